@@ -0,0 +1 @@
+# Benchmarks for the SAI server and user client, run from the project root with python -m benchmarks.<name>
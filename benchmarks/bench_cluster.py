@@ -0,0 +1,132 @@
+# Cluster scaling benchmark: request throughput of SAI with 1, 2, 4 and 8 worker processes
+# Usage: python -m benchmarks.bench_cluster --workers 1 2 4 8 --clients 64 --seconds 5
+
+import argparse
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_connections import find_free_port, raise_fd_limit
+from sai_protocol import Message_Stream
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Requests sent by the load clients
+# cached: unchanged online list, answered by the worker from shared versions
+# list: whole online list, encoded once per version and cached by every worker
+# coordinator: paged list, runs at the coordinator process
+# mixed: half of the clients send coordinator requests, only the cached requests of the other half are counted
+WORKLOADS = {
+    "cached": "LIST_USERS_ONLINE {username} VERSION={version}",
+    "list": "LIST_USERS_ONLINE {username}",
+    "coordinator": "LIST_USERS_ONLINE {username} LIMIT=20",
+    "mixed": "LIST_USERS_ONLINE {username} VERSION={version}",
+}
+
+
+# Cluster in eventloop mode in a scratch directory, database and log files are not touched
+def start_server(workers, port, workdir):
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "sai_server.py"), "--mode", "eventloop",
+         "--port", str(port), "--workers", str(workers)],
+        cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            time.sleep(0.5 + 0.1 * workers)  # Every worker must be listening before load starts
+            return process
+        except OSError:
+            time.sleep(0.05)
+
+    process.kill()
+    raise RuntimeError(f"SAI CLUSTER WITH {workers} WORKERS DID NOT START")
+
+
+# Load client process, one framed connection sending requests back to back
+def run_client(port, username, workload, start_at, seconds, results, counted=True):
+    stream = Message_Stream(socket.create_connection(("127.0.0.1", port)))
+    stream.request_handshake()
+    stream.request(f"REGISTER {username} bench".encode("utf-8"))
+    stream.request(f"LOGIN {username} bench".encode("utf-8"))
+
+    time.sleep(max(0, start_at - time.time()))  # Every client logged in before the clock starts
+
+    # Current list version for the cached workload
+    reply = stream.request(
+        f"LIST_USERS_ONLINE {username} VERSION=0".encode("utf-8"))
+    version = reply.split(b"\n", 1)[0].split()[1].decode("utf-8")
+
+    request = WORKLOADS[workload].format(
+        username=username, version=version).encode("utf-8")
+    requests = 0
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        stream.request(request)
+        requests += 1
+
+    results.put(requests if counted else 0)
+    stream.close()
+
+
+def run_workers(workers, clients, workload, seconds):
+    port = find_free_port()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        process = start_server(workers, port, workdir)
+        try:
+            results = multiprocessing.Queue()
+            start_at = time.time() + 2 + clients * 0.02
+            loaders = [multiprocessing.Process(target=run_client,
+                                               args=(port, f"bench{i}", workload, start_at, seconds, results))
+                       for i in range(clients)]
+
+            # Coordinator requests share the worker event loops with the counted cached requests
+            if workload == "mixed":
+                loaders[1::2] = [multiprocessing.Process(target=run_client,
+                                                         args=(port, f"bench{i}", "coordinator", start_at, seconds,
+                                                               results, False))
+                                 for i in range(1, clients, 2)]
+            for loader in loaders:
+                loader.start()
+
+            total = sum(results.get(timeout=seconds + 60) for _ in loaders)
+            for loader in loaders:
+                loader.join()
+        finally:
+            process.terminate()
+            process.wait()
+
+    return total / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SAI CLUSTER BENCHMARK")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--clients", type=int, default=64,
+                        help="load client processes, each one keeps a request in flight")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--workload", choices=sorted(WORKLOADS), nargs="+",
+                        default=["cached", "list", "coordinator", "mixed"])
+    args = parser.parse_args()
+
+    raise_fd_limit()
+    print(f"CPU CORES: {os.cpu_count()}, LOAD CLIENTS: {args.clients}\n")
+
+    print(f"{'WORKLOAD':<12} {'WORKERS':>7} {'REQ/S':>10} {'SCALING':>8}")
+    for workload in args.workload:
+        baseline = None
+        for workers in args.workers:
+            throughput = run_workers(
+                workers, args.clients, workload, args.seconds)
+            baseline = baseline or throughput
+            print(f"{workload:<12} {workers:>7} {throughput:>10.0f} {throughput / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+# Connection benchmark: memory per idle client and command latency for each SAI server mode
+# Usage: python -m benchmarks.bench_connections --connections 10000
+
+import argparse
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# Each idle client costs one descriptor here and one at the server
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return hard
+
+
+# Resident memory in KB and thread count of a process
+def read_proc_status(pid):
+    rss_kb, threads = 0, 0
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                rss_kb = int(line.split()[1])
+            elif line.startswith("Threads:"):
+                threads = int(line.split()[1])
+    return rss_kb, threads
+
+
+def find_free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# Start SAI server in a scratch directory so database and log files are not touched
+def start_server(mode, port, workdir):
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "sai_server.py"),
+         "--mode", mode, "--port", str(port)],
+        cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            time.sleep(0.2)  # Let the probe connection be cleaned up
+            return process
+        except OSError:
+            time.sleep(0.05)
+
+    process.kill()
+    raise RuntimeError(f"SAI SERVER DID NOT START IN {mode} MODE")
+
+
+def open_idle_clients(port, count):
+    clients = []
+    for _ in range(count):
+        clients.append(socket.create_connection(("127.0.0.1", port)))
+    return clients
+
+
+# Round trip time of a list command, sent by several active clients at the same time
+def measure_latency(clients, samples, active):
+    latencies = []
+    lock = threading.Lock()
+    per_client = max(1, samples // active)
+
+    def run(sock):
+        local = []
+        for _ in range(per_client):
+            started = time.perf_counter()
+            sock.sendall(b"LIST_USERS_PLAYING")
+            sock.recv(1024)
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+
+    # Active clients are spread over the idle ones
+    step = max(1, len(clients) // active)
+    threads = [threading.Thread(target=run, args=(clients[i * step],))
+               for i in range(min(active, len(clients)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return sorted(latencies)
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+    return values[index]
+
+
+def run_mode(mode, connections, samples, active):
+    port = find_free_port()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        process = start_server(mode, port, workdir)
+        try:
+            rss_before, threads_before = read_proc_status(process.pid)
+
+            clients = open_idle_clients(port, connections)
+            time.sleep(1)  # Let every accepted client settle at the server
+            rss_after, threads_after = read_proc_status(process.pid)
+
+            latencies = measure_latency(clients, samples, active)
+
+            for sock in clients:
+                sock.close()
+        finally:
+            process.kill()
+            process.wait()
+
+    return {
+        "mode": mode,
+        "connections": connections,
+        "kb_per_connection": (rss_after - rss_before) / connections,
+        "server_threads": threads_after,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SAI CONNECTION BENCHMARK")
+    parser.add_argument("--connections", type=int, default=10000)
+    parser.add_argument("--samples", type=int, default=5000)
+    parser.add_argument("--active", type=int, default=32,
+                        help="clients sending commands while the others stay idle")
+    parser.add_argument("--mode", choices=("threaded", "eventloop", "both"),
+                        default="both")
+    args = parser.parse_args()
+
+    limit = raise_fd_limit()
+    if limit < args.connections * 2 + 64:
+        print(f"⚠️  FILE DESCRIPTOR LIMIT {limit} IS LOW FOR {args.connections} CONNECTIONS")
+
+    modes = ("threaded", "eventloop") if args.mode == "both" else (args.mode,)
+
+    print(f"{'MODE':<10} {'CONNS':>7} {'KB/CONN':>9} {'THREADS':>8} {'P50 MS':>8} {'P99 MS':>8}")
+    for mode in modes:
+        result = run_mode(mode, args.connections, args.samples, args.active)
+        print(f"{result['mode']:<10} {result['connections']:>7} {result['kb_per_connection']:>9.1f} "
+              f"{result['server_threads']:>8} {result['p50_ms']:>8.3f} {result['p99_ms']:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
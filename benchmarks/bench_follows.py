@@ -0,0 +1,130 @@
+# Follow list benchmark: presence fan-out scoped to followers against a push to every subscriber
+# Usage: python -m benchmarks.bench_follows --users 10000 --follows 50 --changes 1000
+
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.bench_presence_index import Null_Connection
+from sai_follows import Follow_Graph
+from sai_server import SAI_Server
+
+
+# Followed users of every user, the same edges for every structure measured
+def random_edges(usernames, follows):
+    return {username: random.sample(usernames, follows + 1) for username in usernames}
+
+
+def build_graph(edges):
+    graph = Follow_Graph()
+    for username, targets in edges.items():
+        for target in targets:
+            if target != username:
+                graph.follow(username, target)
+    return graph
+
+
+# Plain layout for comparison, sets of usernames in both directions
+def build_sets(edges):
+    following, followers = {}, {}
+    for username, targets in edges.items():
+        for target in targets:
+            if target != username:
+                following.setdefault(username, set()).add(target)
+                followers.setdefault(target, set()).add(username)
+    return following, followers
+
+
+def traced_size(build, edges):
+    tracemalloc.start()
+    structure = build(edges)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return structure, size
+
+
+# Subscribe every user with one scope, change users and time one batch flush
+def measure_fanout(server, usernames, changed, scope):
+    connections = {}
+    for username in usernames:
+        conn = Null_Connection()
+        conn.messages = 0
+        send = conn.send
+
+        def counting_send(data, conn=conn, send=send):
+            conn.messages += 1
+            return send(data)
+
+        conn.send = counting_send
+        connections[username] = conn
+        server.add_user_connection(server.presence.session_of(username), conn)
+        server.subscribe_presence(conn, username, {'SCOPE': scope})
+
+    for conn in connections.values():
+        conn.sent = conn.messages = 0
+
+    for username in changed:
+        server.presence.set_status(username, 'PLAYING')
+
+    started = time.perf_counter()
+    server.flush_presence_changes()
+    elapsed = time.perf_counter() - started
+
+    result = {
+        "ms": elapsed * 1000,
+        "messages": sum(conn.messages for conn in connections.values()),
+        "mb": sum(conn.sent for conn in connections.values()) / 1e6,
+    }
+
+    # Back to the same state for the next scope
+    for username in usernames:
+        server.unsubscribe_presence(username)
+    for username in changed:
+        server.presence.set_status(username, 'ONLINE')
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SAI FOLLOW LIST BENCHMARK")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--follows", type=int, default=50)
+    parser.add_argument("--changes", type=int, default=1000,
+                        help="users changing status in one presence batch")
+    args = parser.parse_args()
+
+    usernames = [f"user{i}" for i in range(args.users)]
+    edges = random_edges(usernames, args.follows)
+
+    graph, graph_size = traced_size(build_graph, edges)
+    _, sets_size = traced_size(build_sets, edges)
+
+    # Server runs in a scratch directory so database and log files are not touched
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        server = SAI_Server("127.0.0.1", 0)
+        server.follows = graph
+
+        for port, username in enumerate(usernames, start=10000):
+            server.users.add(username, 'x')
+            server.presence.login(username, "127.0.0.1", port)
+
+        changed = random.sample(usernames, args.changes)
+        broadcast = measure_fanout(server, usernames, changed, 'ALL')
+        scoped = measure_fanout(server, usernames, changed, 'FOLLOWING')
+
+    print(f"USERS {args.users} | FOLLOWS PER USER {args.follows} | CHANGES PER BATCH {args.changes}\n")
+    print(f"{'FOLLOW LISTS':<28} {'MB':>8}")
+    print(f"{'adjacency arrays':<28} {graph_size / 1e6:>8.2f}")
+    print(f"{'sets of usernames':<28} {sets_size / 1e6:>8.2f}")
+    print(f"\n{'PRESENCE BATCH':<28} {'MS':>8} {'MESSAGES':>9} {'MB SENT':>8}")
+    for name, result in (("every subscriber (ALL)", broadcast), ("followers (FOLLOWING)", scoped)):
+        print(f"{name:<28} {result['ms']:>8.1f} {result['messages']:>9} {result['mb']:>8.2f}")
+    print(f"\nBYTES SENT REDUCTION: {broadcast['mb'] / max(scoped['mb'], 1e-9):.0f}x")
+
+
+if __name__ == "__main__":
+    main()
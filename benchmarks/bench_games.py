@@ -0,0 +1,75 @@
+# Game registry benchmark: memory of game records and registry size under invite churn
+# Usage: python -m benchmarks.bench_games --games 100000 --churn 1000000
+
+import argparse
+import time
+import tracemalloc
+import uuid
+
+from sai_games import Game_Registry, Game_Record
+
+
+# Game record as the server kept it before the registry, one dict per invite and never removed
+def dict_records(count):
+    games = {}
+    for i in range(count):
+        token = str(uuid.uuid4())
+        games[token] = {'token': token, 'players': [f"host{i}", f"guest{i}"], 'status': 'PENDING', 'timer': None}
+    return games
+
+
+def slot_records(count):
+    return {i: Game_Record(i, str(uuid.uuid4()), f"host{i}", f"guest{i}") for i in range(count)}
+
+
+def traced_size(build, count):
+    tracemalloc.start()
+    structure = build(count)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return structure, size
+
+
+# Invites created and resolved back to back, registry size stays bounded by ttl and count limit
+def churn(games, ttl, max_finished):
+    registry = Game_Registry(ttl=ttl, max_finished=max_finished)
+    started = time.perf_counter()
+
+    for i in range(games):
+        record = registry.create(f"host{i % 1000}", f"guest{i % 1000}")
+        if i % 3 == 0:
+            registry.finish(record, 'DECLINED')
+        else:
+            registry.accept(record)
+            registry.start(record.host, record.guest)
+            registry.leave(record.host)
+            registry.leave(record.guest)
+
+    elapsed = time.perf_counter() - started
+    return registry.stats(), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SAI GAME REGISTRY BENCHMARK")
+    parser.add_argument("--games", type=int, default=100000, help="records measured for memory")
+    parser.add_argument("--churn", type=int, default=1000000, help="invites created and resolved")
+    parser.add_argument("--ttl", type=float, default=300)
+    parser.add_argument("--max-finished", type=int, default=10000)
+    args = parser.parse_args()
+
+    _, dict_size = traced_size(dict_records, args.games)
+    _, slot_size = traced_size(slot_records, args.games)
+
+    print(f"GAME RECORDS: {args.games}\n")
+    print(f"{'RECORD LAYOUT':<28} {'MB':>8} {'BYTES/GAME':>11}")
+    print(f"{'dict per game':<28} {dict_size / 1e6:>8.2f} {dict_size / args.games:>11.0f}")
+    print(f"{'slots record':<28} {slot_size / 1e6:>8.2f} {slot_size / args.games:>11.0f}")
+
+    stats, elapsed = churn(args.churn, args.ttl, args.max_finished)
+    print(f"\nINVITES CREATED: {stats['created']} IN {elapsed:.2f}s ({stats['created'] / elapsed:.0f}/s)")
+    print(f"RECORDS KEPT: {stats['live']} LIVE, {stats['finished']} FINISHED, {stats['evicted']} EVICTED")
+    print(f"REGISTRY MEMORY: {stats['bytes'] / 1e6:.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
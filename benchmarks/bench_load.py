@@ -0,0 +1,320 @@
+# Load generator: thousands of simulated SAI clients on one asyncio loop
+# Clients register, log in, poll lobby lists, invite each other, answer invites, play and reconnect
+# Usage: python -m benchmarks.bench_load --clients 2000 --seconds 30
+
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_connections import ROOT, find_free_port, raise_fd_limit
+from sai_client import SAI_Client
+from sai_metrics import Latency_Histogram
+
+ERROR_PREFIXES = ("🚨", "💣")
+
+
+class Load_Stats:
+
+    # Shared by every simulated client, the loop runs one client at a time so no lock is needed
+    def __init__(self):
+        self.latency = {}  # Command to histogram in ns
+        self.errors = {}  # Kind to count
+        self.events = {}  # Invite outcomes, matches and reconnections
+        self.requests = 0
+        self.sent = 0  # Commands without a response
+
+    def record(self, command, elapsed):
+        self.latency.setdefault(command, Latency_Histogram()).record(elapsed)
+        self.requests += 1
+
+    def error(self, kind):
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def event(self, kind):
+        self.events[kind] = self.events.get(kind, 0) + 1
+
+
+class Load_Client:
+
+    # One simulated user on a SAI_Client, which owns framing, request tags, heartbeats and pushed events
+    def __init__(self, generator, username):
+        self.generator = generator
+        self.stats = generator.stats
+        self.username = username
+        self.client = None  # None while disconnected, next action logs in again
+        self.invited = None  # Guest of the invite this client is waiting on
+        self.in_match = False
+
+    async def connect(self):
+        client = SAI_Client(self.generator.host, self.generator.port, self.generator.timeout)
+        client.on_event = lambda event: self.handle_event(client, event)
+        await client.connect()
+        self.client = client
+
+    async def close(self):
+        self.generator.online.discard(self.username)
+        client, self.client = self.client, None
+        if client:
+            await client.close()
+
+    # Round trip of one SAI_Client request, measured here at the client and recorded per command name
+    async def request(self, name, call):
+        started = time.perf_counter_ns()
+        try:
+            result = await call
+        except asyncio.TimeoutError:
+            self.stats.error("timeout")
+            raise
+        self.stats.record(name, time.perf_counter_ns() - started)
+        return result
+
+    def check(self, name, response):
+        if response.startswith(ERROR_PREFIXES):
+            self.stats.error(f"{name} {response.strip()}")
+
+    # Command the server does not answer
+    def send(self, send, *args):
+        send(*args)
+        self.stats.sent += 1
+
+    # Pushed events, handled here so SAI_Client does not queue them
+    def handle_event(self, client, event):
+        if client is not self.client:
+            return True  # Connection already closed by this client
+
+        if event.kind == 'INVITED':
+            self.answer_invite()
+        elif event.kind == 'INVITE_ANSWERED':
+            self.invite_answered(event.outcome)
+        elif event.kind == 'INVITE_EXPIRED':
+            self.stats.event("invite expired")
+        elif event.kind == 'DISCONNECTED':
+            self.stats.error("connection lost")
+            asyncio.create_task(self.close())
+        return True
+
+    def answer_invite(self):
+        if not self.in_match and random.random() < self.generator.accept_ratio:
+            self.send(self.client.send, "GAME_ACK")  # Load host never opens the match, no CONNECT to wait for
+            self.in_match = True
+            asyncio.create_task(self.play_match(None))
+        else:
+            self.send(self.client.decline)
+
+    def invite_answered(self, outcome):
+        guest, self.invited = self.invited, None
+        self.stats.event(f"invite {outcome.lower()}")
+        if outcome == "ACCEPTED" and guest:
+            self.in_match = True
+            asyncio.create_task(self.play_match(guest))
+
+    # Host starts the match, both players report GAME_OVER and become available again
+    async def play_match(self, guest):
+        if guest and self.client:
+            self.send(self.client.send, f"GAME_START {self.username} {guest}")
+            self.stats.event("match started")
+        await asyncio.sleep(self.generator.match_seconds)
+        if self.client:
+            self.send(self.client.game_over)
+            self.send(self.client.available)
+        self.in_match = False
+
+    async def register_and_login(self):
+        await self.connect()
+        _, response = await self.request("REGISTER", self.client.register(self.username, "load"))
+        self.check("REGISTER", response)
+        await self.login()
+
+    async def login(self):
+        if not self.client:
+            await self.connect()
+        authenticated, response = await self.request("LOGIN", self.client.login(self.username, "load"))
+        self.check("LOGIN", response)
+        if authenticated:
+            self.generator.online.add(self.username)
+
+    # Client session, one weighted action after every think time until the run ends
+    async def run(self, deadline):
+        actions, weights = zip(*self.generator.mix.items())
+        while time.monotonic() < deadline:
+            await asyncio.sleep(min(random.expovariate(1 / self.generator.think), deadline - time.monotonic()))
+            if time.monotonic() >= deadline:
+                break
+            try:
+                if not self.client:
+                    await self.login()
+                    continue
+                action = random.choices(actions, weights)[0]
+                await getattr(self, f"do_{action}")()
+            except (ConnectionError, OSError):
+                self.stats.error("connection lost")
+                await self.close()
+            except asyncio.TimeoutError:
+                await self.close()
+
+    async def do_list(self):
+        page = await self.request("LIST_USERS_ONLINE", self.client.list_online(limit=50))
+        self.check("LIST_USERS_ONLINE", page.text)
+
+    async def do_playing(self):
+        page = await self.request("LIST_USERS_PLAYING", self.client.list_playing(limit=50))
+        self.check("LIST_USERS_PLAYING", page.text)
+
+    async def do_invite(self):
+        if self.invited or self.in_match or len(self.generator.online) < 2:
+            return
+        guest = random.choice(tuple(self.generator.online))
+        if guest == self.username:
+            return
+        # Set before sending, the answer of a quick guest can arrive right behind the response
+        self.invited = guest
+        invited, response = await self.request("GAME_INI", self.client.invite(guest))
+        self.check("GAME_INI", response)
+        if invited:
+            self.stats.event("invite sent")
+        elif self.invited == guest:
+            self.invited = None
+            if "DEALING" in response:
+                self.stats.event("invite busy")
+
+    # Drop the connection, next action logs in again
+    async def do_reconnect(self):
+        if self.in_match or self.invited:
+            return
+        await self.close()
+        self.stats.event("reconnect")
+
+
+class Load_Generator:
+
+    def __init__(self, host, port, args):
+        self.host = host
+        self.port = port
+        self.mix = {"list": args.list, "playing": args.playing, "invite": args.invite, "reconnect": args.reconnect}
+        self.accept_ratio = args.accept
+        self.think = args.think
+        self.match_seconds = args.match_seconds
+        self.timeout = args.timeout
+        self.stats = Load_Stats()
+        self.online = set()  # Logged in simulated users, invite targets
+
+    async def run(self, clients, seconds, connect_rate):
+        prefix = f"load{os.getpid()}_{random.randrange(1 << 20)}_"
+        users = [Load_Client(self, f"{prefix}{i}") for i in range(clients)]
+
+        # Connections opened in waves, the listen backlog is not flooded
+        started = time.monotonic()
+        for first in range(0, clients, connect_rate):
+            wave = users[first:first + connect_rate]
+            results = await asyncio.gather(*(user.register_and_login() for user in wave), return_exceptions=True)
+            for result in results:
+                if isinstance(result, BaseException):
+                    self.stats.error(f"login {type(result).__name__}")
+        ramp_seconds = time.monotonic() - started
+
+        # Counters restart so ramp up does not count as load
+        self.stats = Load_Stats()
+        for user in users:
+            user.stats = self.stats
+
+        started = time.monotonic()
+        await asyncio.gather(*(user.run(started + seconds) for user in users))
+        elapsed = time.monotonic() - started
+
+        for user in users:
+            await user.close()
+        return ramp_seconds, elapsed
+
+
+# Local server in a scratch directory, database and log files are not touched
+def start_server(mode, port, workers, workdir):
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "sai_server.py"), "--mode", mode, "--port", str(port),
+         "--workers", str(workers)],
+        cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            time.sleep(0.3 + 0.1 * workers)
+            return process
+        except OSError:
+            time.sleep(0.05)
+
+    process.kill()
+    raise RuntimeError(f"SAI SERVER DID NOT START IN {mode} MODE")
+
+
+def print_report(stats, clients, ramp_seconds, elapsed):
+    errors = sum(stats.errors.values())
+    print(f"CLIENTS: {clients} | LOGIN RAMP: {ramp_seconds:.1f}s | RUN: {elapsed:.1f}s\n")
+    print(f"THROUGHPUT: {stats.requests / elapsed:.0f} REQ/S + {stats.sent / elapsed:.0f} UNANSWERED CMD/S")
+    print(f"ERROR RATE: {errors / max(stats.requests, 1):.2%} ({errors} ERRORS)\n")
+
+    # Round trips measured by the simulated clients, server side latency is in the STATS command
+    print("CLIENT ROUND TRIP LATENCY\n")
+    print(f"{'COMMAND':<22} {'COUNT':>8} {'P50 MS':>8} {'P90 MS':>8} {'P99 MS':>8} {'MAX MS':>8}")
+    for command, histogram in sorted(stats.latency.items()):
+        print(f"{command:<22} {histogram.total:>8} {histogram.percentile(0.5) / 1e6:>8.2f} "
+              f"{histogram.percentile(0.9) / 1e6:>8.2f} {histogram.percentile(0.99) / 1e6:>8.2f} "
+              f"{histogram.max / 1e6:>8.2f}")
+
+    if stats.events:
+        print()
+        for kind, count in sorted(stats.events.items()):
+            print(f"{kind.upper():<22} {count:>8}")
+    if stats.errors:
+        print()
+        for kind, count in sorted(stats.errors.items(), key=lambda item: -item[1]):
+            print(f"ERROR {kind:<40} {count:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SAI LOAD GENERATOR")
+    parser.add_argument("--clients", type=int, default=2000)
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument("--server", default=None, help="HOST:PORT of a running server, default starts one")
+    parser.add_argument("--mode", choices=("threaded", "eventloop"), default="eventloop")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--think", type=float, default=1.0, help="mean seconds between actions of a client")
+    parser.add_argument("--list", type=float, default=60, help="weight of LIST_USERS_ONLINE polls")
+    parser.add_argument("--playing", type=float, default=20, help="weight of LIST_USERS_PLAYING polls")
+    parser.add_argument("--invite", type=float, default=15, help="weight of GAME_INI")
+    parser.add_argument("--reconnect", type=float, default=5, help="weight of disconnect and login again")
+    parser.add_argument("--accept", type=float, default=0.7, help="fraction of invites accepted")
+    parser.add_argument("--match-seconds", type=float, default=5)
+    parser.add_argument("--timeout", type=float, default=10, help="seconds before a request counts as failed")
+    parser.add_argument("--connect-rate", type=int, default=200, help="clients logging in at once during ramp up")
+    args = parser.parse_args()
+
+    raise_fd_limit()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        process = None
+        if args.server:
+            host, port = args.server.rsplit(":", 1)
+            port = int(port)
+        else:
+            host, port = "127.0.0.1", find_free_port()
+            process = start_server(args.mode, port, args.workers, workdir)
+
+        try:
+            generator = Load_Generator(host, port, args)
+            ramp_seconds, elapsed = asyncio.run(generator.run(args.clients, args.seconds, args.connect_rate))
+        finally:
+            if process:
+                process.terminate()
+                process.wait()
+
+    print_report(generator.stats, args.clients, ramp_seconds, elapsed)
+
+
+if __name__ == "__main__":
+    main()
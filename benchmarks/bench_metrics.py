@@ -0,0 +1,62 @@
+# Metrics overhead benchmark: cost added to every command by latency timing
+# Usage: python -m benchmarks.bench_metrics --commands 1000000
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.bench_presence_index import Null_Connection
+from sai_metrics import Latency_Histogram
+from sai_server import SAI_Server
+
+
+def time_per_call(function, repeat):
+    started = time.perf_counter_ns()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter_ns() - started) / repeat
+
+
+# Timed and untimed commands run in alternating rounds, the median difference hides other load on the machine
+def overhead_per_call(timed, untimed, repeat, rounds=21):
+    differences = []
+    for _ in range(rounds):
+        differences.append(time_per_call(timed, repeat // rounds) - time_per_call(untimed, repeat // rounds))
+    return statistics.median(differences)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SAI METRICS OVERHEAD BENCHMARK")
+    parser.add_argument("--commands", type=int, default=1000000)
+    args = parser.parse_args()
+
+    histogram = Latency_Histogram()
+    record_ns = time_per_call(lambda: histogram.record(123456), args.commands)
+
+    # Server runs in a scratch directory so database and log files are not touched
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        server = SAI_Server("127.0.0.1", 0)
+        conn = Null_Connection()
+        message = "UNSUBSCRIBE_PRESENCE"  # Cheapest command, overhead is most visible
+
+        # Both sides split the message, the difference is the timing alone
+        timed = lambda: server.handle_command(conn, message, None)
+        untimed = lambda: server.run_command(conn, message.split(), None)
+        timed_ns = time_per_call(timed, args.commands)
+        untimed_ns = time_per_call(untimed, args.commands)
+        overhead_ns = overhead_per_call(timed, untimed, args.commands)
+        server.events.close()
+        os.chdir("/")
+
+    print(f"COMMANDS: {args.commands}\n")
+    print(f"{'HISTOGRAM RECORD':<34} {record_ns:>8.0f} ns")
+    print(f"{'COMMAND WITHOUT TIMING':<34} {untimed_ns:>8.0f} ns")
+    print(f"{'COMMAND WITH TIMING':<34} {timed_ns:>8.0f} ns")
+    print(f"\nOVERHEAD PER COMMAND: {overhead_ns / 1000:.2f} µs (MEDIAN OF ALTERNATING ROUNDS)")
+
+
+if __name__ == "__main__":
+    main()
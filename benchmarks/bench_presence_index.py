@@ -0,0 +1,92 @@
+# Lobby listing benchmark: status indexes against a scan of every registered user
+# Usage: python -m benchmarks.bench_presence_index --registered 1000000 --online 1000
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from sai_server import SAI_Server
+
+
+# Stand-in for a client connection, keeps only response size
+class Null_Connection:
+
+    def __init__(self):
+        self.sent = 0
+
+    def send(self, data):
+        self.sent += len(data)
+        return len(data)
+
+
+# Listing as it was done before the indexes, every registered user is checked
+def scan_online_users(users, logged_in_username):
+    return [(username, data.get('status'), data.get('ip'), data.get('port'))
+            for username, data in users.items()
+            if data.get('status') == 'ONLINE' and username != logged_in_username]
+
+
+def time_per_call(function, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - started) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SAI PRESENCE INDEX BENCHMARK")
+    parser.add_argument("--registered", type=int, default=1000000)
+    parser.add_argument("--online", type=int, default=1000)
+    parser.add_argument("--playing", type=int, default=200,
+                        help="online users that are also in a match")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    usernames = [f"user{i}" for i in range(args.registered)]
+    online = random.sample(usernames, args.online)
+    playing = online[:args.playing]
+
+    # Server runs in a scratch directory so database and log files are not touched
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        server = SAI_Server("127.0.0.1", 0)
+
+        for username in usernames:
+            server.users.add(username, 'x')
+
+        for port, username in enumerate(online, start=10000):
+            server.presence.login(username, "127.0.0.1", port)
+        for username in playing:
+            server.presence.set_status(username, 'PLAYING')
+
+        # Same users in the layout where status lived in every user record
+        flat_users = {username: {'password': 'x', 'status': 'OFFLINE'}
+                      for username in usernames}
+        for port, username in enumerate(online, start=10000):
+            flat_users[username].update(
+                status='ONLINE', ip="127.0.0.1", port=port, notification='AVAILABLE')
+        for username in playing:
+            flat_users[username]['status'] = 'PLAYING'
+
+        conn = Null_Connection()
+        viewer = online[-1]
+
+        scan = time_per_call(
+            lambda: scan_online_users(flat_users, viewer), args.repeat)
+        indexed_online = time_per_call(
+            lambda: server.send_online_users(conn, viewer), args.repeat)
+        indexed_playing = time_per_call(
+            lambda: server.send_playing_users(conn), args.repeat)
+
+    print(f"REGISTERED {args.registered} | ONLINE {args.online} | PLAYING {args.playing}\n")
+    print(f"{'LISTING':<32} {'MS PER CALL':>12}")
+    print(f"{'scan of registered users':<32} {scan * 1000:>12.3f}")
+    print(f"{'LIST_USERS_ONLINE (index)':<32} {indexed_online * 1000:>12.3f}")
+    print(f"{'LIST_USERS_PLAYING (index)':<32} {indexed_playing * 1000:>12.3f}")
+    print(f"\nSPEEDUP ONLINE LIST: {scan / indexed_online:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# Startup benchmark: users database loaded from the JSON lines file against the binary snapshot
+# Usage: python -m benchmarks.bench_startup --users 100000 1000000
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from sai_server import SAI_Server
+from sai_snapshot import write_binary_snapshot
+from sai_users import User_Table
+
+
+def time_call(function):
+    started = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - started
+
+
+# Startup as it was before the binary snapshot, one json.loads per line and every user in memory
+def load_json_lines(path):
+    users = User_Table()
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                username, data = json.loads(line).popitem()
+                users.load(username, data['password'])
+    return users
+
+
+# Server ready to accept connections, snapshot mapped and only journal entries read
+def start_server():
+    return SAI_Server("127.0.0.1", 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SAI STARTUP BENCHMARK")
+    parser.add_argument("--users", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--follow-every", type=int, default=100,
+                        help="one user in this many has a follow list")
+    args = parser.parse_args()
+
+    print(f"{'USERS':>9} {'JSON LINES S':>13} {'BINARY S':>9} {'FIRST LOGIN MS':>15} {'FILE MB JSON/BIN':>17}")
+    for count in args.users:
+        users = {f"user{i}": {'password': f"pw{i}"} for i in range(count)}
+        for i in range(0, count, args.follow_every):
+            users[f"user{i}"]['follows'] = [f"user{(i + 1) % count}", f"user{(i + 2) % count}"]
+
+        # Server runs in a scratch directory so database and log files are not touched
+        with tempfile.TemporaryDirectory() as workdir:
+            os.chdir(workdir)
+            with open("database.txt", "w", encoding="utf-8") as file:
+                for username, user_data in users.items():
+                    file.write(json.dumps({username: user_data}) + "\n")
+            with open("database.snap", "wb") as file:
+                write_binary_snapshot(file, users)
+
+            _, json_seconds = time_call(lambda: load_json_lines("database.txt"))
+            server, binary_seconds = time_call(start_server)
+            _, login_seconds = time_call(lambda: server.users.password(f"user{count // 2}"))
+
+            json_mb = os.path.getsize("database.txt") / 1e6
+            binary_mb = os.path.getsize("database.snap") / 1e6
+            server.events.close()
+            server.users.snapshot.close()
+            os.chdir("/")
+
+        print(f"{count:>9} {json_seconds:>13.2f} {binary_seconds:>9.3f} {login_seconds * 1000:>15.3f} "
+              f"{json_mb:>8.1f}/{binary_mb:<8.1f}")
+
+
+if __name__ == "__main__":
+    main()
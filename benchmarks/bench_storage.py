@@ -0,0 +1,68 @@
+# Storage benchmark: registration throughput of the file store against the SQLite store
+# Usage: python -m benchmarks.bench_storage --clients 1 16 64 --registrations 2000
+
+import argparse
+import contextlib
+import os
+import tempfile
+import threading
+import time
+
+from benchmarks.bench_presence_index import Null_Connection
+from sai_server import SAI_Server, STORAGE_BACKENDS
+
+
+# Clients register at the same time, each registration returns once it is durable
+def run_registrations(storage, clients, registrations, existing):
+    # Server runs in a scratch directory so database and log files are not touched
+    with tempfile.TemporaryDirectory() as workdir, open(os.devnull, "w") as devnull, \
+            contextlib.redirect_stdout(devnull):
+        os.chdir(workdir)
+        server = SAI_Server("127.0.0.1", 0, storage=storage)
+
+        # Users already stored, the cost of a write must not grow with them
+        server.storage.write_snapshot({f"old{i}": {'password': "x"} for i in range(existing)})
+
+        per_client = registrations // clients
+        start = threading.Barrier(clients + 1)
+
+        def register(client):
+            conn = Null_Connection()
+            start.wait()
+            for i in range(per_client):
+                server.register_user(conn, f"user{client}_{i}", "password")
+
+        threads = [threading.Thread(target=register, args=(client,)) for client in range(clients)]
+        for thread in threads:
+            thread.start()
+        start.wait()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        commits = server.storage.commits
+        entries = server.storage.committed_entries
+        server.events.close()
+        os.chdir("/")
+
+    return per_client * clients / elapsed, entries / max(commits, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SAI STORAGE BENCHMARK")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--registrations", type=int, default=2000)
+    parser.add_argument("--existing", type=int, default=100000, help="users stored before the run")
+    args = parser.parse_args()
+
+    print(f"EXISTING USERS: {args.existing}, REGISTRATIONS PER RUN: {args.registrations}\n")
+    print(f"{'STORAGE':<8} {'CLIENTS':>7} {'REG/S':>9} {'ROWS/COMMIT':>12}")
+    for storage in STORAGE_BACKENDS:
+        for clients in args.clients:
+            throughput, batch = run_registrations(storage, clients, args.registrations, args.existing)
+            print(f"{storage:<8} {clients:>7} {throughput:>9.0f} {batch:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+# Micro-benchmark suite for SAI server and client hot paths, compared against a stored baseline
+# Usage: python -m benchmarks.bench_suite --output results.json
+#        python -m benchmarks.bench_suite --save-baseline
+#        python -m benchmarks.bench_suite --baseline benchmarks/baseline.json --threshold 0.10
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from sai_follows import Follow_Graph
+from sai_server import SAI_Server
+from sai_users import User_Table
+from user_client import User_Client
+from benchmarks.bench_presence_index import Null_Connection
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+ANIMALS = ("SHARK", "SQUID", "LOBSTER", "FISH", "SHRIMP")
+
+
+# Best time per call in ns over several rounds, the minimum is the least disturbed by other processes
+def measure(function, repeat, rounds, before_round=None):
+    best = None
+    for _ in range(rounds):
+        if before_round:
+            before_round()
+        started = time.perf_counter_ns()
+        for _ in range(repeat):
+            function()
+        elapsed = (time.perf_counter_ns() - started) / repeat
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+# Server with registered users and a lobby of logged in users, a fifth of them playing
+def build_server(users, lobby):
+    server = SAI_Server("127.0.0.1", 0)
+    for i in range(users):
+        server.users.add(f"user{i}", "secret")
+    for i in range(lobby):
+        server.presence.login(f"user{i}", "127.0.0.1", 10000 + i)
+    for i in range(lobby // 5):
+        server.presence.set_status(f"user{i}", 'PLAYING')
+    return server
+
+
+# Fresh user table and follow graph each call, as at server start
+def reload_users(server):
+    if server.users.snapshot:
+        server.users.snapshot.close()
+    server.users = User_Table()
+    server.follows = Follow_Graph()
+    server.load_users_from_file()
+
+
+# Log writer drains between rounds, a full queue would time the dropped path
+def drain_events(server):
+    while not server.events.events.empty():
+        time.sleep(0.01)
+
+
+def server_cases(args):
+    conn = Null_Connection()
+
+    for lobby in args.lobby:
+        server = build_server(lobby, lobby)
+        me = "user0"
+        yield f"send_online_users cached lobby={lobby}", lambda: server.send_online_users(
+            conn, me), args.repeat, None
+        yield f"send_online_users rebuilt lobby={lobby}", lambda: (
+            server.list_cache.clear(), server.send_online_users(conn, me)), max(args.repeat // lobby, 10), None
+        yield f"send_playing_users cached lobby={lobby}", lambda: server.send_playing_users(
+            conn), args.repeat, None
+        yield f"send_playing_users rebuilt lobby={lobby}", lambda: (
+            server.list_cache.clear(), server.send_playing_users(conn)), max(args.repeat // lobby, 10), None
+        yield f"send_online_users page lobby={lobby}", lambda: server.send_online_users(
+            conn, me, {'LIMIT': '50'}), args.repeat // 10, None
+        server.events.close()
+
+    server = build_server(args.users, 0)
+    message = "UNSUBSCRIBE_PRESENCE"  # Cheapest command, parsing and dispatch only
+    yield "handle_message UNSUBSCRIBE_PRESENCE", lambda: server.handle_message(
+        conn, message, "user0"), args.repeat, None
+    version = server.presence.versions['PLAYING']
+    yield "handle_message LIST_USERS_PLAYING NOT_MODIFIED", lambda: server.handle_message(
+        conn, f"LIST_USERS_PLAYING VERSION={version}", "user0"), args.repeat, None
+    yield "handle_message unknown command", lambda: server.handle_message(
+        conn, "BOGUS x y", None), args.repeat, None
+
+    yield f"save_users_to_file users={args.users}", server.save_users_to_file, 3, None
+    yield f"load_users_from_file users={args.users}", lambda: reload_users(server), 10, None
+
+    drain = lambda: drain_events(server)
+    yield "log_event", lambda: server.log_event("🎮 MATCH STARTED: user1 X user2"), 5000, drain
+    drain_events(server)
+    server.events.close()
+
+
+def client_cases(args):
+    client = User_Client("127.0.0.1", 0)
+    board = client.initialize_ocean_board()
+    yield "initialize_ocean_board", client.initialize_ocean_board, args.repeat // 10, None
+    yield "count_points", lambda: [client.count_points(animal) for animal in ANIMALS], args.repeat, None
+    yield "get_animal_icon", lambda: [client.get_animal_icon(animal) for animal in ANIMALS], args.repeat, None
+    yield "display_ocean_empty", client.display_ocean_empty, args.repeat // 10, None
+    yield "display_ocean_result", lambda: client.display_ocean_result(board), args.repeat // 10, None
+    client.loop.close()  # Never started, no connection to close
+
+
+def run_suite(args):
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir, open(os.devnull, "w") as devnull:
+        os.chdir(workdir)
+        # Server events and client renders print, only the report reaches the terminal
+        with contextlib.redirect_stdout(devnull):
+            for cases in (server_cases(args), client_cases(args)):
+                for name, function, repeat, before_round in cases:
+                    if args.only and args.only not in name:
+                        continue
+                    results[name] = measure(function, max(repeat, 1), args.rounds, before_round)
+        os.chdir(cwd)
+    return results
+
+
+# Cases slower than the baseline by more than the threshold, as name to ratio
+def find_regressions(results, baseline, threshold):
+    return {name: value / baseline[name] for name, value in results.items()
+            if baseline.get(name) and value / baseline[name] > 1 + threshold}
+
+
+def print_report(results, baseline, regressions):
+    print(f"{'CASE':<52} {'NS/CALL':>12} {'BASELINE':>12} {'CHANGE':>8}")
+    for name, value in results.items():
+        line = f"{name:<52} {value:>12.0f}"
+        if baseline.get(name):
+            line += f" {baseline[name]:>12.0f} {value / baseline[name] - 1:>+8.1%}"
+            if name in regressions:
+                line += "  🚨 REGRESSION"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SAI MICRO-BENCHMARK SUITE")
+    parser.add_argument("--lobby", type=int, nargs="+", default=[100, 1000, 10000], help="logged in users")
+    parser.add_argument("--users", type=int, default=10000, help="registered users saved and loaded")
+    parser.add_argument("--repeat", type=int, default=10000, help="calls per round of the fast cases")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--only", default=None, help="run cases whose name contains this text")
+    parser.add_argument("--output", default=None, help="write results as JSON")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--threshold", type=float, default=0.10, help="slowdown flagged as regression, 0.10 is 10%%")
+    args = parser.parse_args()
+
+    results = run_suite(args)
+    report = {"python": platform.python_version(), "machine": platform.machine(), "created": time.time(),
+              "unit": "ns", "results": results}
+
+    # Baselines are per machine and not committed, without one nothing can be flagged
+    baseline = {}
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            baseline = json.load(file)["results"]
+    elif not args.save_baseline:
+        print(f"⚠️ NO BASELINE AT {args.baseline}, RUN WITH --save-baseline FIRST TO FLAG REGRESSIONS\n")
+
+    regressions = find_regressions(results, baseline, args.threshold)
+    report["regressions"] = regressions
+    print_report(results, baseline, regressions)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+        print(f"\n✅ BASELINE SAVED: {args.baseline}")
+    elif regressions:
+        print(f"\n🚨 {len(regressions)} CASES SLOWER THAN BASELINE BY MORE THAN {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
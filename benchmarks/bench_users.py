@@ -0,0 +1,64 @@
+# User store benchmark: memory of the old dict per user layout against the user table and packed presence
+# Usage: python -m benchmarks.bench_users --users 100000 1000000 --online 0.1
+
+import argparse
+import gc
+import tracemalloc
+
+from sai_presence import Presence
+from sai_users import User_Table
+
+
+# Layout before the presence table, every registered user a dict with every field
+def dict_layout(usernames, online):
+    users = {}
+    for username in usernames:
+        users[username] = {'password': "password", 'status': 'OFFLINE', 'ip': None,
+                           'port': None, 'notification': None}
+    for port, username in enumerate(online, start=10000):
+        users[username].update(status='ONLINE', ip=f"10.0.{port % 256}.{port // 256 % 256}",
+                               port=port, notification='AVAILABLE')
+    return users
+
+
+# Credentials in the user table, presence only for online users with packed state and address
+def compact_layout(usernames, online):
+    users = User_Table()
+    for username in usernames:
+        users.add(username, "password")
+    sessions = {}
+    for port, username in enumerate(online, start=10000):
+        sessions[port] = Presence(port, username, f"10.0.{port % 256}.{port // 256 % 256}", port)
+    return users, sessions
+
+
+# Bytes allocated by the layout, usernames are built before tracing and shared by both
+def traced_size(build, usernames, online):
+    gc.collect()
+    tracemalloc.start()
+    structure = build(usernames, online)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del structure
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SAI USER STORE BENCHMARK")
+    parser.add_argument("--users", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--online", type=float, default=0.1, help="fraction of users logged in")
+    args = parser.parse_args()
+
+    print(f"{'USERS':>9} {'DICT PER USER MB':>17} {'COMPACT MB':>11} {'B/USER OLD':>11} {'B/USER NEW':>11} {'SAVED':>6}")
+    for count in args.users:
+        usernames = [f"user{i}" for i in range(count)]
+        online = usernames[:int(count * args.online)]
+
+        old = traced_size(dict_layout, usernames, online)
+        new = traced_size(compact_layout, usernames, online)
+        print(f"{count:>9} {old / 1e6:>17.1f} {new / 1e6:>11.1f} {old / count:>11.0f} {new / count:>11.0f} "
+              f"{1 - new / old:>6.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,28 @@
+import glob
 import os
 
-# Clean game log
+# Clean game log and its rotated archives
 
 
 def clean_game_log():
     with open("game.log", "w"):
         pass
 
-# Clean database
+    for archive in glob.glob("game.log.*.gz"):
+        os.remove(archive)
+
+# Clean database, snapshot file and its journals
 
 
 def clean_database():
     with open("database.txt", "w"):
         pass
 
+    for journal in ("database.snap", "database.journal", "database.journal.old",
+                    "database.db", "database.db-wal", "database.db-shm"):
+        if os.path.exists(journal):
+            os.remove(journal)
+
 
 # Execute
 clean_game_log()
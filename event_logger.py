@@ -0,0 +1,154 @@
+# Buffered event log, one background writer batches events to file and stdout
+
+import atexit
+import gzip
+import os
+import queue
+import shutil
+import sys
+import threading
+import time
+from datetime import datetime
+
+
+class Event_Logger:
+
+    # Events wait at a bounded queue, request handlers never block on log file writes
+    def __init__(self, path="game.log", max_bytes=1 << 20, backups=5, queue_size=10000,
+                 flush_bytes=64 << 10, flush_interval=1.0):
+        self.path = path
+        self.max_bytes = max_bytes  # Rotate once the log file reaches this size
+        self.backups = backups  # Compressed archives kept, game.log.1.gz is the newest
+        self.flush_bytes = flush_bytes  # Write batch once this many bytes are waiting
+        self.flush_interval = flush_interval  # Or once the oldest waiting event is this old
+
+        self.events = queue.Queue(maxsize=queue_size)
+        self.dropped = 0  # Events lost because the queue was full
+        self.written = 0  # Events written to the log file
+        self.rotations = 0
+
+        self.last_second = None  # Timestamp text is formatted once per second
+        self.last_timestamp = ""
+        self.file = None
+        self.thread = None
+
+    # Start writer thread, pending events are written when the interpreter exits
+    def start(self):
+        if self.thread is None:
+            self.file = open(self.path, "ab")
+            self.thread = threading.Thread(target=self.write_events, daemon=True)
+            self.thread.start()
+            atexit.register(self.close)
+        return self
+
+    # Queue one timestamped event, stdout echo is written by the same batch
+    def log(self, event, to_file=True, to_stdout=True):
+        line = f"{self.timestamp()}: {event}\n"
+        try:
+            self.events.put_nowait((line, to_file, to_stdout))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def timestamp(self):
+        second = int(time.time())
+        if second != self.last_second:
+            self.last_timestamp = datetime.fromtimestamp(
+                second).strftime("%Y-%m-%d %H:%M:%S")
+            self.last_second = second
+        return self.last_timestamp
+
+    # Writer thread, stdout echo goes out when the queue runs dry, file lines wait for size or time limit
+    def write_events(self):
+        file_lines = []
+        stdout_lines = []
+        batch_bytes = 0
+        batch_started = None
+
+        while True:
+            timeout = self.flush_interval
+            if batch_started is not None:
+                timeout = max(0, batch_started + self.flush_interval - time.monotonic())
+
+            try:
+                item = self.events.get(timeout=timeout)
+            except queue.Empty:
+                item = ()  # Time limit of the waiting batch
+
+            if item is None:  # Close asked, write what is left
+                self.write_stdout(stdout_lines)
+                if file_lines:
+                    self.write_batch(file_lines)
+                return
+
+            if item:
+                line, to_file, to_stdout = item
+                if to_file:
+                    data = line.encode("utf-8")
+                    file_lines.append(data)
+                    batch_bytes += len(data)
+                    if batch_started is None:
+                        batch_started = time.monotonic()
+                if to_stdout:
+                    stdout_lines.append(line)
+
+                # Take everything already queued before writing
+                if batch_bytes < self.flush_bytes and not self.events.empty():
+                    continue
+
+            self.write_stdout(stdout_lines)
+            stdout_lines = []
+
+            if file_lines and (batch_bytes >= self.flush_bytes or
+                               time.monotonic() - batch_started >= self.flush_interval):
+                self.write_batch(file_lines)
+                file_lines = []
+                batch_bytes = 0
+                batch_started = None
+
+    def write_stdout(self, lines):
+        if lines:
+            sys.stdout.write("".join(lines))
+            sys.stdout.flush()
+
+    # One write for the whole batch, rotate first when the file would pass its limit
+    def write_batch(self, lines):
+        data = b"".join(lines)
+        if self.file.tell() and self.file.tell() + len(data) > self.max_bytes:
+            self.rotate()
+
+        self.file.write(data)
+        self.file.flush()
+        self.written += len(lines)
+
+    # game.log becomes game.log.1.gz, older archives shift by one and the oldest is removed
+    def rotate(self):
+        self.file.close()
+
+        for index in range(self.backups - 1, 0, -1):
+            older = f"{self.path}.{index}.gz"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{index + 1}.gz")
+
+        if self.backups > 0:
+            with open(self.path, "rb") as source, gzip.open(f"{self.path}.1.gz", "wb") as archive:
+                shutil.copyfileobj(source, archive)
+        os.remove(self.path)
+
+        self.file = open(self.path, "ab")
+        self.rotations += 1
+
+    # Every archive of this log, newest first
+    def archives(self):
+        return [f"{self.path}.{index}.gz" for index in range(1, self.backups + 1)
+                if os.path.exists(f"{self.path}.{index}.gz")]
+
+    # Write pending events and stop writer thread
+    def close(self):
+        if self.thread is None:
+            return
+        self.events.put(None)  # Blocks only when the queue is full, writer is draining it
+        self.thread.join()
+        self.thread = None
+        self.file.close()
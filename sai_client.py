@@ -0,0 +1,524 @@
+# Headless SAI client on asyncio, lobby, invites and peer to peer matches without terminal input or output
+# Game rules and message parsing live here too, the terminal client only renders them
+
+import asyncio
+import itertools
+import random
+
+from sai_protocol import (HANDSHAKE, HANDSHAKE_ACK, HEADER, Frame_Error, MAX_FRAME_SIZE, PING, PONG, PUSH_MARK,
+                          TAG_PREFIX, encode_frame)
+
+BOARD_SIZE = 5
+ROUNDS = 5
+
+# Sea creature points and icons
+POINTS = {"SHARK": 100, "SQUID": 80, "LOBSTER": 60, "FISH": 50, "SHRIMP": 30}
+ICONS = {"SHARK": "🦈", "SQUID": "🦑", "LOBSTER": "🦞", "FISH": "🐟", "SHRIMP": "🦐"}
+
+# Answers of a guest to the host's invite, pushed to the host
+OUTCOMES = ("ACCEPTED", "DECLINED", "TIMEOUT", "IGNORED")
+LEAVE = "LEAVE"
+PUSH_PREFIX = PUSH_MARK.decode("utf-8")
+PING_MESSAGE = PING.decode("utf-8")
+
+
+class Client_Error(ConnectionError):
+    pass
+
+
+# 5x5 ocean, one sea creature per square by its chance
+def initialize_ocean_board():
+    ocean_board = [[None] * BOARD_SIZE for _ in range(BOARD_SIZE)]
+
+    for row in range(BOARD_SIZE):
+        for col in range(BOARD_SIZE):
+            chance = random.random()
+            if chance <= 0.05:  # 5% chance to appear
+                ocean_board[row][col] = "SHARK"
+            elif chance <= 0.15:  # 10% chance to appear
+                ocean_board[row][col] = "SQUID"
+            elif chance <= 0.35:  # 20% chance to appear
+                ocean_board[row][col] = "LOBSTER"
+            elif chance <= 0.65:  # 30% chance to appear
+                ocean_board[row][col] = "FISH"
+            else:  # 35% chance to appear
+                ocean_board[row][col] = "SHRIMP"
+    return ocean_board
+
+
+def count_points(animal_type):
+    return POINTS[animal_type]
+
+
+def animal_icon(animal_type):
+    return ICONS.get(animal_type, "❓")
+
+
+class Client_Event:
+
+    # Message pushed by SAI without a request
+    # INVITED: username invited us, playing tells if we are in a match
+    # INVITE_ANSWERED: outcome of our invite, one of OUTCOMES
+    # INVITE_EXPIRED: invite we answered is gone
+    # CONNECT: host of our match listens at port
+    # PRESENCE: lobby deltas, already applied to the client lobby
+    # DISCONNECTED: SAI closed the connection
+    __slots__ = ('kind', 'username', 'outcome', 'port', 'framed', 'playing', 'message')
+
+    def __init__(self, kind, message="", username=None, outcome=None, port=None, framed=False, playing=False):
+        self.kind = kind
+        self.message = message
+        self.username = username
+        self.outcome = outcome
+        self.port = port
+        self.framed = framed
+        self.playing = playing
+
+    def __repr__(self):
+        return f"Client_Event({self.kind}, {self.message.strip()!r})"
+
+
+# Pushed message as an event, None for responses to requests
+def parse_event(message):
+    if message.startswith("PRESENCE\n"):
+        return Client_Event('PRESENCE', message)
+
+    if "INVITED YOU TO JOIN" in message:
+        parts = message.split()
+        return Client_Event('INVITED', message, username=parts[1], playing="ANOTHER GAME" in message)
+
+    if message in OUTCOMES:
+        return Client_Event('INVITE_ANSWERED', message, outcome=message)
+
+    if message.startswith("⌛ INVITE EXPIRED"):
+        return Client_Event('INVITE_EXPIRED', message)
+
+    if message.startswith("CONNECT TO PORT"):
+        parts = message.split()
+        return Client_Event('CONNECT', message, port=int(parts[3]), framed="FRAMED" in parts[4:])
+
+    return None
+
+
+# Apply presence snapshot or delta lines to a lobby, username to [status, notification, ip, port]
+def apply_presence(lobby, message):
+    for line in message.splitlines()[1:]:
+        parts = line.split()
+        if not parts:
+            continue
+
+        if parts[0] == "JOINED" and len(parts) >= 6:
+            lobby[parts[1]] = [parts[2], parts[3], parts[4], parts[5]]
+        elif parts[0] == "LEFT":
+            lobby.pop(parts[1], None)
+        elif parts[0] == "STATUS" and parts[1] in lobby:
+            lobby[parts[1]][0] = parts[2]
+        elif parts[0] == "NOTIFICATION" and parts[1] in lobby:
+            lobby[parts[1]][1] = parts[2]
+
+
+# Leading VERSION or NOT_MODIFIED line of a list response, as (version, not modified, rest)
+def split_version(response):
+    if response.startswith("NOT_MODIFIED "):
+        return int(response.split()[1]), True, ""
+    if response.startswith("VERSION "):
+        header, _, response = response.partition("\n")
+        return int(header.split()[1]), False, response
+    return None, False, response
+
+
+# Leading NEXT line of a lobby page, as (next cursor or None at the last page, rest)
+def split_page(response):
+    if response.startswith("NEXT "):
+        header, _, response = response.partition("\n")
+        cursor = header.split()[1]
+        return (None if cursor == "END" else cursor), response
+    return None, response
+
+
+class Lobby_List:
+
+    # Online or playing list, users are (username, ip, port) in the order SAI sent them
+    __slots__ = ('version', 'not_modified', 'next_cursor', 'users', 'text')
+
+    def __init__(self, version, not_modified, next_cursor, users, text):
+        self.version = version
+        self.not_modified = not_modified
+        self.next_cursor = next_cursor
+        self.users = users
+        self.text = text
+
+
+# Users of list lines, online lines carry STATUS, IP and PORT, playing lines carry pairs of user | ip:port
+def parse_lobby_users(text):
+    users = []
+    for line in text.splitlines():
+        if "👤" not in line:
+            continue
+        if "| IP: " in line:
+            fields = line.split(" | ")
+            users.append((fields[0].split()[-1], fields[2].split()[-1], int(fields[3].split()[-1])))
+            continue
+        for player in line.split(" X "):
+            name, _, address = player.partition(" | ")
+            ip, _, port = address.strip().rpartition(":")
+            users.append((name.split()[-1], ip, int(port)))
+    return users
+
+
+# Followed users of a LIST_FOLLOWING answer as (username, status)
+def parse_following(text):
+    users = []
+    for line in text.splitlines():
+        if "👤" in line and " | STATUS: " in line:
+            name, _, status = line.partition(" | STATUS: ")
+            users.append((name.split()[-1], status.strip()))
+    return users
+
+
+class Match_Result:
+
+    # Outcome of one match, WIN, LOSS or TIE, left names the player that quit early
+    __slots__ = ('opponent', 'score_self', 'score_opponent', 'rounds', 'outcome', 'left')
+
+    def __init__(self, opponent, score_self, score_opponent, rounds, left=None):
+        self.opponent = opponent
+        self.score_self = score_self
+        self.score_opponent = score_opponent
+        self.rounds = rounds
+        self.left = left
+        if left:
+            self.outcome = 'LOSS' if left == 'SELF' else 'WIN'
+        elif score_self == score_opponent:
+            self.outcome = 'TIE'
+        else:
+            self.outcome = 'WIN' if score_self > score_opponent else 'LOSS'
+
+    def __repr__(self):
+        return f"Match_Result({self.outcome} {self.score_self}x{self.score_opponent} VS {self.opponent})"
+
+
+class Match:
+
+    # Framed peer to peer connection of one match, moves are animal names or LEAVE
+    def __init__(self, reader, writer, player, opponent, server=None):
+        self.reader = reader
+        self.writer = writer
+        self.player = player
+        self.opponent = opponent
+        self.server = server  # Host listener, closed with the match
+
+    async def send_move(self, move):
+        self.writer.write(encode_frame(move.encode("utf-8")))
+        await self.writer.drain()
+
+    # Opponent move, LEAVE when the opponent quit or the connection dropped
+    async def receive_move(self):
+        try:
+            return await read_frame(self.reader)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return LEAVE
+
+    # Five rounds, choose gets the board and round number and returns (row, col) or None to leave
+    # choose may be a coroutine function, a bot answers at once and a front end may wait for input
+    # on_round, when given, sees every finished round as (round number, board, move, opponent move, scores)
+    async def play(self, choose, rounds=ROUNDS, on_round=None):
+        score_self = score_opponent = 0
+
+        for round_number in range(1, rounds + 1):
+            board = initialize_ocean_board()
+            square = choose(board, round_number)
+            if asyncio.iscoroutine(square):
+                square = await square
+
+            if square is None:
+                await self.send_move(LEAVE)
+                return Match_Result(self.opponent, score_self, score_opponent, round_number, left='SELF')
+
+            row, col = square
+            move = board[row][col]
+            await self.send_move(move)
+            score_self += count_points(move)
+
+            move_opponent = await self.receive_move()
+            if move_opponent not in POINTS:
+                return Match_Result(self.opponent, score_self, score_opponent, round_number, left='OPPONENT')
+            score_opponent += count_points(move_opponent)
+
+            if on_round:
+                shown = on_round(round_number, board, move, move_opponent, score_self, score_opponent)
+                if asyncio.iscoroutine(shown):
+                    await shown
+
+        return Match_Result(self.opponent, score_self, score_opponent, rounds)
+
+    async def close(self):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except OSError:
+            pass
+        if self.server:
+            self.server.close()
+
+
+# One framed message from a stream reader
+async def read_frame(reader):
+    (length,) = HEADER.unpack(await reader.readexactly(HEADER.size))
+    if length > MAX_FRAME_SIZE:
+        raise Frame_Error(f"FRAME TOO LARGE: {length} BYTES")
+    return (await reader.readexactly(length)).decode("utf-8")
+
+
+class SAI_Client:
+
+    # One framed SAI connection, a reader task sorts messages into tagged replies and events
+    # Every request carries a tag, so several requests may be in flight at once
+    def __init__(self, host, port, timeout=20):
+        self.host = host
+        self.port = port
+        self.timeout = timeout  # Seconds to wait for a response or an event
+        self.username = None
+        self.reader = None
+        self.writer = None
+        self.read_task = None
+        self.tags = itertools.count(1)
+        self.pending = {}  # Tag to future of the request waiting for its reply
+        self.events = asyncio.Queue()
+        self.lobby = None  # Presence pushes after subscribe, username to [status, notification, ip, port]
+        self.on_event = None  # Called at the loop with every event as it arrives, events it returns True for are not queued
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write(HANDSHAKE)
+        reply = await asyncio.wait_for(self.reader.readexactly(len(HANDSHAKE_ACK)), self.timeout)
+        if reply != HANDSHAKE_ACK:
+            raise Client_Error("SERVER DOES NOT SPEAK THE FRAMED PROTOCOL")
+        self.read_task = asyncio.create_task(self.read_messages())
+        return self
+
+    async def close(self):
+        if self.writer:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        if self.read_task:
+            self.read_task.cancel()
+        self.writer = self.read_task = None
+        self.fail_pending()
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def read_messages(self):
+        try:
+            while True:
+                message = await read_frame(self.reader)
+                if message.startswith(TAG_PREFIX):
+                    tag, _, message = message.partition(" ")
+                    future = self.pending.pop(tag, None)
+                    if future and not future.done():
+                        future.set_result(message)
+                    continue
+
+                if message.startswith(PUSH_PREFIX):
+                    message = message[len(PUSH_PREFIX):]
+                if message == PING_MESSAGE:
+                    self.writer.write(encode_frame(PONG))  # Heartbeat, SAI drops clients that stop answering
+                    continue
+                event = parse_event(message)
+                if event is None:
+                    continue  # Nothing waits for an untagged reply
+
+                if event.kind == 'PRESENCE':
+                    if self.lobby is not None:
+                        apply_presence(self.lobby, message)
+                    continue
+                self.put_event(event)
+
+        except (asyncio.IncompleteReadError, ConnectionError, Frame_Error):
+            self.put_event(Client_Event('DISCONNECTED'))
+            self.fail_pending()
+
+    def put_event(self, event):
+        if not (self.on_event and self.on_event(event)):
+            self.events.put_nowait(event)
+
+    def fail_pending(self):
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(Client_Error("CONNECTION LOST"))
+        self.pending = {}
+
+    # Tagged command, returns its reply, empty for commands SAI does not answer
+    async def request(self, command):
+        if not self.writer:
+            raise Client_Error("NOT CONNECTED")
+        tag = f"{TAG_PREFIX}{next(self.tags)}"
+        future = asyncio.get_running_loop().create_future()
+        self.pending[tag] = future
+        self.writer.write(encode_frame(f"{tag} {command}".encode("utf-8")))
+        try:
+            return await asyncio.wait_for(future, self.timeout)
+        finally:
+            self.pending.pop(tag, None)
+
+    # Several commands in one round trip, replies in the order of the commands
+    async def pipeline(self, *commands):
+        return await asyncio.gather(*(self.request(command) for command in commands))
+
+    # Command without a response
+    def send(self, command):
+        if not self.writer:
+            raise Client_Error("NOT CONNECTED")
+        self.writer.write(encode_frame(command.encode("utf-8")))
+
+    # Next pushed event, TimeoutError when none arrives in time
+    async def next_event(self, timeout=None):
+        return await asyncio.wait_for(self.events.get(), timeout or self.timeout)
+
+    # Next event of the given kinds, events of other kinds are dropped
+    async def wait_event(self, *kinds, timeout=None):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or self.timeout)
+        while True:
+            event = await asyncio.wait_for(self.events.get(), max(deadline - loop.time(), 0))
+            if event.kind in kinds or event.kind == 'DISCONNECTED':
+                return event
+
+    async def register(self, username, password):
+        response = await self.request(f"REGISTER {username} {password}")
+        return "SUCCESSFUL" in response, response
+
+    # Presence subscription may share the login round trip, SAI refuses it when login failed
+    async def login(self, username, password, presence=False):
+        command = f"LOGIN {username} {password}"
+        if presence:
+            response, snapshot = await self.pipeline(command, "SUBSCRIBE_PRESENCE")
+        else:
+            response = await self.request(command)
+
+        if "LOGIN SUCCESSFUL" in response:
+            self.username = username
+            if presence:
+                self.presence_snapshot(snapshot)
+            return True, response
+        return False, response
+
+    # Local lobby kept fresh by pushes, scope ALL or FOLLOWING
+    async def subscribe_presence(self, scope=None):
+        command = "SUBSCRIBE_PRESENCE" + (f" SCOPE={scope}" if scope else "")
+        return self.presence_snapshot(await self.request(command))
+
+    def presence_snapshot(self, response):
+        if not response.startswith("PRESENCE_SNAPSHOT"):
+            return False
+        self.lobby = {}
+        apply_presence(self.lobby, response)
+        return True
+
+    # One page of online users sorted by username, version asks for NOT_MODIFIED when unchanged
+    # Following limits the page to users we follow
+    async def list_online(self, limit=None, cursor=None, prefix=None, version=None, following=False):
+        options = []
+        if following:
+            options.append("FOLLOWING=1")
+        if limit:
+            options.append(f"LIMIT={limit}")
+        if cursor:
+            options.append(f"CURSOR={cursor}")
+        if prefix:
+            options.append(f"PREFIX={prefix}")
+        if version is not None:
+            options.append(f"VERSION={version}")
+        return self.lobby_list(await self.request(" ".join(["LIST_USERS_ONLINE", self.username or "-"] + options)))
+
+    async def list_playing(self, limit=None, version=None):
+        options = []
+        if limit:
+            options.append(f"LIMIT={limit}")
+        if version is not None:
+            options.append(f"VERSION={version}")
+        return self.lobby_list(await self.request(" ".join(["LIST_USERS_PLAYING"] + options)))
+
+    def lobby_list(self, response):
+        version, not_modified, text = split_version(response)
+        next_cursor, text = split_page(text)
+        return Lobby_List(version, not_modified, next_cursor, parse_lobby_users(text), text)
+
+    # Follow lists belong to the logged in user, they scope presence pushes and online pages
+    async def follow(self, target):
+        response = await self.request(f"FOLLOW {target}")
+        return response.startswith("🤝"), response
+
+    async def unfollow(self, target):
+        response = await self.request(f"UNFOLLOW {target}")
+        return response.startswith("👋"), response
+
+    # Followed users as (username, status)
+    async def list_following(self):
+        return parse_following(await self.request("LIST_FOLLOWING"))
+
+    # Invite guest, True when SAI sent the invite, outcome arrives as INVITE_ANSWERED event
+    async def invite(self, guest):
+        response = await self.request(f"GAME_INI {self.username} {guest}")
+        return "INVITED" in response, response
+
+    # Outcome of our invite, one of OUTCOMES, None when SAI disconnected
+    async def wait_invite_answer(self, timeout=None):
+        event = await self.wait_event('INVITE_ANSWERED', timeout=timeout)
+        return event.outcome
+
+    # Accept invite, returns CONNECT event with the host port or INVITE_EXPIRED
+    async def accept(self, timeout=None):
+        response = await self.request("GAME_ACK")
+        if "EXPIRED" in response:
+            return Client_Event('INVITE_EXPIRED', response)
+        return await self.wait_event('CONNECT', timeout=timeout)
+
+    def decline(self):
+        self.send("GAME_NEG")
+
+    # Host side of an accepted invite, listens for the guest and marks both players as playing
+    async def host_match(self, guest, timeout=None):
+        connected = asyncio.get_running_loop().create_future()
+
+        def on_connect(reader, writer):
+            if connected.done():
+                writer.close()
+            else:
+                connected.set_result((reader, writer))
+
+        server = await asyncio.start_server(on_connect, self.host, 0)
+        port = server.sockets[0].getsockname()[1]
+        self.send(f"SEND_GUEST_CONN_PORT {guest} {port} FRAMED")
+
+        try:
+            reader, writer = await asyncio.wait_for(connected, timeout or self.timeout)
+            if await reader.readexactly(len(HANDSHAKE)) != HANDSHAKE:
+                raise Client_Error("GUEST DOES NOT SPEAK THE FRAMED PROTOCOL")
+        except BaseException:
+            server.close()
+            raise
+
+        self.send(f"GAME_START {self.username} {guest}")
+        return Match(reader, writer, self.username, guest, server)
+
+    # Guest side, connect to the host port of a CONNECT event
+    async def join_match(self, host_username, event):
+        reader, writer = await asyncio.open_connection(self.host, event.port)
+        writer.write(HANDSHAKE)
+        return Match(reader, writer, self.username, host_username)
+
+    # Match over, back to ONLINE
+    def game_over(self):
+        self.send(f"GAME_OVER {self.username}")
+
+    # Ready for invites again after an unanswered one
+    def available(self):
+        self.send(f"AVAILABLE {self.username}")
@@ -0,0 +1,348 @@
+# Multi-process SAI, workers share the port with SO_REUSEPORT and one coordinator owns users, presence and invites
+
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.managers import BaseManager
+
+from sai_event_loop import SAI_Event_Loop
+from sai_heartbeat import Heartbeat_Monitor, HEARTBEAT_INTERVAL
+from sai_presence import VIEWS
+from sai_protocol import Outbound_Writer, client_connection, parse_options
+from sai_server import SAI_Server, SERVER_MODES, PAGE_OPTIONS
+from timer_wheel import Timer_Wheel
+
+coordinator = None  # Cluster_Coordinator of the manager process, created by its initializer
+COORDINATOR_THREADS = 8  # Coordinator calls in flight per event loop worker, each thread has its own manager connection
+
+
+class Shared_Versions:
+
+    # Presence view versions in shared memory, workers check their list cache without asking the coordinator
+    def __init__(self, array):
+        self.array = array
+
+    def __getitem__(self, view):
+        return self.array[VIEWS.index(view)]
+
+    def __setitem__(self, view, value):
+        self.array[VIEWS.index(view)] = value
+
+
+class Reply_Collector:
+
+    # Requesting client seen from the coordinator, replies go back with the call result
+    def __init__(self, worker_id, addr):
+        self.worker_id = worker_id
+        self.addr = addr
+        self.replies = []
+
+    def send(self, data):
+        self.replies.append(data)
+        return len(data)
+
+    def getpeername(self):
+        return self.addr
+
+
+class Remote_Connection:
+
+    # Session held by a worker, notifications travel through that worker's mailbox
+    def __init__(self, mailbox, session_id):
+        self.mailbox = mailbox
+        self.session_id = session_id
+
+    def send(self, data):
+        self.mailbox.put((self.session_id, data))
+        return len(data)
+
+
+class Cluster_Coordinator(SAI_Server):
+
+    # Only process with users, presence, invites, storage and game log, it never listens for clients
+    def __init__(self, host, port, workers, versions, storage, metrics_file):
+        super().__init__(host, port, storage=storage)
+        self.metrics_file = metrics_file
+        self.mailboxes = [queue.Queue() for _ in range(workers)]  # Messages for sessions of each worker
+
+        for view in VIEWS:
+            versions[VIEWS.index(view)] = self.presence.versions[view]
+        self.presence.versions = Shared_Versions(versions)
+
+        self.timers.start()
+        self.dump_metrics()
+
+    # Run one command for a worker client, returns username, replies and session id of the client
+    def handle(self, worker_id, addr, message, logged_in_username):
+        conn = Reply_Collector(worker_id, addr)
+        logged_in_username = self.handle_message(
+            conn, message, logged_in_username)
+
+        session_id = self.presence.session_of(
+            logged_in_username) if logged_in_username else None
+        return logged_in_username, conn.replies, session_id
+
+    # Logged in client lives at a worker, keep a handle to its mailbox
+    def add_user_connection(self, session_id, conn):
+        self.connections[session_id] = Remote_Connection(
+            self.mailboxes[conn.worker_id], session_id)
+
+    # Encoded lobby list for a worker cache
+    def lobby_list(self, kind):
+        return self.get_online_list() if kind == 'ONLINE' else self.get_playing_list()
+
+    # Messages for sessions of a worker, waits up to timeout for the first one and takes the rest without waiting
+    def next_messages(self, worker_id, timeout=1.0):
+        mailbox = self.mailboxes[worker_id]
+        try:
+            messages = [mailbox.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+
+        while True:
+            try:
+                messages.append(mailbox.get_nowait())
+            except queue.Empty:
+                return messages
+
+
+class Cluster_Worker(SAI_Server):
+
+    # Worker process, owns client sockets and forwards every state change to the coordinator
+    # SAI_Server constructor is skipped on purpose, database and game log belong to the coordinator
+    def __init__(self, host, port, mode, worker_id, coordinator, versions, heartbeat_interval=HEARTBEAT_INTERVAL):
+        if mode not in SERVER_MODES:
+            raise ValueError(f"UNKNOWN SERVER MODE: {mode}")
+
+        self.host = host
+        self.port = port
+        self.mode = mode
+        self.reuse_port = True  # Kernel spreads new connections over every worker
+        self.worker_id = worker_id
+        self.coordinator = coordinator  # Manager proxy, one connection per calling thread
+        self.versions = Shared_Versions(versions)
+        self.connections = {}  # Session id to local client connection
+        self.sessions = {}  # Username to session id of local clients
+        self.list_cache = {}  # Lobby lists fetched from the coordinator, kept while shared version matches
+
+        # Client sockets live here, so do their heartbeats
+        self.timers = Timer_Wheel()
+        self.heartbeat = Heartbeat_Monitor(self.timers, self.session_reaped, heartbeat_interval)
+        self.outbound = Outbound_Writer()
+
+        # Event loop thread never waits for the coordinator, commands are sent from these threads
+        self.coordinator_calls = ThreadPoolExecutor(COORDINATOR_THREADS) if mode == "eventloop" else None
+
+    def start(self):
+        # Notifications for local clients sent by commands of other workers
+        threading.Thread(target=self.deliver_messages, daemon=True).start()
+        self.timers.start()
+        self.heartbeat.start()
+
+        if self.mode == "eventloop":
+            SAI_Event_Loop(self).run()
+        else:
+            self.start_threaded()
+
+    # Lobby lists without page options are served from the worker cache, everything else runs at the coordinator
+    # Heartbeat answers stay here too, the client socket and its heartbeat belong to this worker
+    # Request tags are handled here, the coordinator sees untagged commands
+    def handle_command(self, conn, message, logged_in_username):
+        parts = message.split()
+        command = parts[0]
+
+        if command == "PONG":
+            return logged_in_username  # Receiving it already marked the connection as alive
+
+        elif command == "LIST_USERS_ONLINE" and len(parts) > 1:
+            options = parse_options(parts[2:])
+            if not PAGE_OPTIONS.intersection(options):
+                self.send_online_users(conn, parts[1], options)
+                return logged_in_username
+
+        elif command == "LIST_USERS_PLAYING":
+            options = parse_options(parts[1:])
+            if not PAGE_OPTIONS.intersection(options):
+                self.send_playing_users(conn, options)
+                return logged_in_username
+
+        # Answer is held like a storage write, later commands of the client wait in its backlog
+        if self.coordinator_calls:
+            conn.hold()
+            self.coordinator_calls.submit(self.call_coordinator, conn, message, logged_in_username)
+            return logged_in_username
+
+        logged_in_username, replies, session_id = self.coordinator.handle(
+            self.worker_id, conn.getpeername(), message, logged_in_username)
+        return self.finish_command(conn, logged_in_username, replies, session_id)
+
+    # Coordinator thread, result goes back to the event loop thread
+    def call_coordinator(self, conn, message, logged_in_username):
+        try:
+            result = self.coordinator.handle(
+                self.worker_id, conn.getpeername(), message, logged_in_username)
+        except Exception as e:
+            self.stdout_event(f"🚨 COMMAND FAILED FROM {conn.getpeername()}: {e!r}")
+            conn.call_soon(self.coordinator_failed, conn)
+            return
+        conn.call_soon(self.coordinator_answered, conn, logged_in_username, *result)
+
+    def coordinator_answered(self, conn, previous_username, logged_in_username, replies, session_id):
+        client = client_connection(conn)
+
+        # Client left while the command ran, a login it made must not stay online
+        if client.sock.fileno() == -1:
+            if session_id and logged_in_username != previous_username:
+                self.coordinator.disconnect_user(logged_in_username)
+        else:
+            client.logged_in_username = self.finish_command(conn, logged_in_username, replies, session_id)
+        conn.release()
+
+    # Same as a failing command at the event loop, only its own client is dropped
+    def coordinator_failed(self, conn):
+        client_connection(conn).shutdown()
+        conn.release()
+
+    def finish_command(self, conn, logged_in_username, replies, session_id):
+        # Login happened at the coordinator, keep the connection for its notifications
+        if session_id and logged_in_username not in self.sessions:
+            self.sessions[logged_in_username] = session_id
+            self.connections[session_id] = client_connection(conn)
+
+        for data in replies:
+            conn.send(data)
+
+        return logged_in_username
+
+    def get_online_list(self):
+        return self.cached_lobby_list('ONLINE')
+
+    def get_playing_list(self):
+        return self.cached_lobby_list('PLAYING')
+
+    # Shared version is read from memory, coordinator is asked only when the list changed
+    def cached_lobby_list(self, kind):
+        cached = self.list_cache.get(kind)
+        if cached and cached[0] == self.versions[kind]:
+            return cached
+
+        cached = self.coordinator.lobby_list(kind)
+        self.list_cache[kind] = cached
+        return cached
+
+    # Disconnection control runs at the coordinator, local session is dropped here
+    def disconnect_user(self, username):
+        session_id = self.sessions.pop(username, None)
+        self.connections.pop(session_id, None)
+        self.coordinator.disconnect_user(username)
+
+    # Metrics of the whole cluster are kept by the coordinator
+    def connection_opened(self):
+        self.coordinator.connection_opened()
+
+    def connection_closed(self):
+        self.coordinator.connection_closed()
+
+    def outbound_overflow(self, addr):
+        self.coordinator.outbound_overflow(addr)
+
+    def session_reaped(self, addr):
+        self.coordinator.session_reaped(addr)
+
+    # Game log has a single writer at the coordinator
+    def log_event(self, event):
+        self.coordinator.log_event(event)
+
+    def stdout_event(self, event):
+        self.coordinator.stdout_event(event)
+
+    # Mailbox thread, hands notifications to local clients
+    def deliver_messages(self):
+        while True:
+            try:
+                messages = self.coordinator.next_messages(self.worker_id)
+            except (EOFError, OSError):
+                # Coordinator is gone, sessions of this worker can not be served anymore
+                print("\n🚨 COORDINATOR LOST, STOPPING WORKER\n")
+                os._exit(1)
+
+            for session_id, data in messages:
+                conn = self.connections.get(session_id)
+                if conn is None:
+                    continue  # Client left, message has nobody to reach
+                try:
+                    conn.send(data)
+                except OSError:
+                    pass  # Client handler runs disconnection control
+
+
+class Cluster_Manager(BaseManager):
+    pass
+
+
+def get_coordinator():
+    return coordinator
+
+
+def init_coordinator(host, port, workers, versions, storage, metrics_file):
+    global coordinator
+    coordinator = Cluster_Coordinator(host, port, workers, versions, storage, metrics_file)
+    threading.Thread(target=watch_parent, args=(os.getppid(),), daemon=True).start()
+
+
+# Coordinator process must not outlive the cluster process that started it
+def watch_parent(parent_pid):
+    while os.getppid() == parent_pid:
+        time.sleep(1)
+    os._exit(0)
+
+
+Cluster_Manager.register("coordinator", callable=get_coordinator)
+
+
+# Worker process entry, connects to the coordinator and serves clients
+def run_worker(address, authkey, worker_id, host, port, mode, versions, heartbeat_interval):
+    manager = Cluster_Manager(address=address, authkey=authkey)
+    manager.connect()
+    Cluster_Worker(host, port, mode, worker_id,
+                   manager.coordinator(), versions, heartbeat_interval).start()
+
+
+# Coordinator process plus one worker process per core asked, runs until the workers stop
+def start_cluster(host, port, mode, workers, storage="file", metrics_file=None, heartbeat_interval=HEARTBEAT_INTERVAL):
+    if not hasattr(socket, "SO_REUSEPORT"):
+        raise RuntimeError("SO_REUSEPORT NOT SUPPORTED, RUN A SINGLE WORKER")
+
+    versions = multiprocessing.RawArray('q', len(VIEWS))  # Presence versions read by every worker
+    authkey = os.urandom(16)
+
+    manager = Cluster_Manager(authkey=authkey)
+    manager.start(initializer=init_coordinator,
+                  initargs=(host, port, workers, versions, storage, metrics_file))
+
+    print(f"☎️  SAI CLUSTER WITH {workers} WORKERS ON {host}:{port}\n")
+
+    # Stop signal runs the cleanup below instead of leaving workers behind
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    processes = [multiprocessing.Process(target=run_worker,
+                                         args=(manager.address, authkey, worker_id, host, port, mode, versions,
+                                               heartbeat_interval),
+                                         daemon=True)
+                 for worker_id in range(workers)]
+    for process in processes:
+        process.start()
+
+    try:
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            process.terminate()
+        manager.shutdown()
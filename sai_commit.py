@@ -0,0 +1,87 @@
+# Group commit shared by both user stores, one writer thread makes every batch of pending changes durable at once
+
+import threading
+
+
+class Storage_Error(Exception):
+    pass
+
+
+class Group_Commit:
+
+    # Each change may carry a callback, called by the writer with None once it is durable or with the error
+    # A failed batch is reported to its callers and dropped, the writer goes on with the next batch
+    def __init__(self):
+        self.condition = threading.Condition()  # Reentrant, stores encode entries under it before queueing
+        self.pending = []  # Entries waiting for the writer thread
+        self.callbacks = []  # Callbacks of the pending entries
+        self.writer_thread = None
+
+        # Group commit counters, entries per commit shows how well requests are batched
+        self.commits = 0
+        self.committed_entries = 0
+        self.failed_commits = 0
+
+    def start_writer(self):
+        self.writer_thread = threading.Thread(target=self.write_entries, daemon=True)
+        self.writer_thread.start()
+
+    def queue(self, entry, done=None):
+        with self.condition:
+            self.pending.append(entry)
+            if done:
+                self.callbacks.append(done)
+            self.condition.notify()
+
+    # Store one user change and block until it is durable, concurrent callers share one commit
+    def save(self, username, user_data):
+        finished = threading.Event()
+        errors = []
+
+        def done(error):
+            errors.append(error)
+            finished.set()
+
+        self.append(username, user_data, done)
+        finished.wait()
+        if errors[0] is not None:
+            raise Storage_Error(f"STORAGE WRITE FAILED: {errors[0]!r}") from errors[0]
+
+    # Writer thread, one commit for every batch of pending entries
+    def write_entries(self):
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+                batch, callbacks = self.pending, self.callbacks
+                self.pending, self.callbacks = [], []
+
+            try:
+                self.write_batch(batch)
+                error = None
+            except Exception as e:
+                error = e
+                print(f"🚨 STORAGE WRITE FAILED, {len(batch)} CHANGES LOST: {e!r}")
+
+            with self.condition:
+                if error is None:
+                    self.commits += 1
+                    self.committed_entries += len(batch)
+                else:
+                    self.failed_commits += 1
+
+            for done in callbacks:
+                try:
+                    done(error)
+                except Exception as e:
+                    print(f"🚨 STORAGE CALLBACK FAILED: {e!r}")
+
+            if error is None:
+                try:
+                    self.batch_committed(batch)
+                except Exception as e:
+                    print(f"🚨 STORAGE MAINTENANCE FAILED: {e!r}")
+
+    # Subclass hook, runs at the writer thread after each successful commit
+    def batch_committed(self, batch):
+        pass
@@ -0,0 +1,152 @@
+# SQLite store of the users database and match history, WAL mode with batched transactions
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from sai_commit import Group_Commit
+from sai_snapshot import read_binary_snapshot, read_json_lines
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password TEXT NOT NULL,
+    follows TEXT
+);
+CREATE INDEX IF NOT EXISTS users_with_follows ON users (username) WHERE follows IS NOT NULL;
+CREATE TABLE IF NOT EXISTS games (
+    game_id INTEGER PRIMARY KEY,
+    token TEXT NOT NULL,
+    host TEXT NOT NULL,
+    guest TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created REAL NOT NULL,
+    finished REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS games_by_host ON games (host);
+CREATE INDEX IF NOT EXISTS games_by_guest ON games (guest);
+"""
+
+# Statements are fixed text, sqlite3 prepares each once and keeps it in the connection cache
+UPSERT_USER = ("INSERT INTO users (username, password, follows) VALUES (?, ?, ?) "
+               "ON CONFLICT (username) DO UPDATE SET password = excluded.password, follows = excluded.follows")
+INSERT_GAME = "INSERT INTO games (token, host, guest, status, created, finished) VALUES (?, ?, ?, ?, ?, ?)"
+SELECT_PASSWORD = "SELECT password FROM users WHERE username = ?"
+
+
+class User_Database(Group_Commit):
+
+    # Same calls as the file journal, only users that changed are written
+    # Readers use one connection per thread, WAL lets them run while the writer commits
+    # Pending entries are rows as (statement, parameters), one transaction per batch
+    def __init__(self, path="database.db"):
+        super().__init__()
+        self.path = path
+        self.readers = threading.local()
+        self.count = 0  # Users at load time, later registrations are counted by the user table
+        self.writer = None
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=FULL")  # Commit returns once it is on disk
+        return connection
+
+    # Connection of the calling thread
+    def reader(self):
+        connection = getattr(self.readers, "connection", None)
+        if connection is None:
+            connection = self.readers.connection = self.connect()
+        return connection
+
+    # Create schema, users stay in the database and are read on demand
+    def load(self, users, follows):
+        found = os.path.exists(self.path)
+        self.writer = self.connect()
+        self.writer.executescript(SCHEMA)
+
+        self.count = self.writer.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+        users.attach(self)
+
+        # Follow lists are the only part of the users loaded now, through the partial index
+        for username, follow_list in self.writer.execute(
+                "SELECT username, follows FROM users WHERE follows IS NOT NULL"):
+            for target in json.loads(follow_list):
+                follows.follow(username, target)
+
+        if not found:
+            raise FileNotFoundError(self.path)
+
+    # User table calls, same as the binary snapshot
+    def __len__(self):
+        return self.count
+
+    def password(self, username):
+        row = self.reader().execute(SELECT_PASSWORD, (username,)).fetchone()
+        return row[0] if row else None
+
+    def items(self):
+        yield from self.reader().execute("SELECT username, password FROM users ORDER BY username")
+
+    def start(self, snapshot_source):
+        self.start_writer()
+
+    # Queue one user change, done is called with None once it is committed or with the error
+    def append(self, username, user_data, done=None):
+        follow_list = user_data.get('follows')
+        row = (username, user_data['password'], json.dumps(follow_list) if follow_list else None)
+        self.queue((UPSERT_USER, row), done)
+
+    # Finished game for the match history, nobody waits for it
+    def record_game(self, game):
+        started = time.time() - (time.monotonic() - game.created)
+        self.queue((INSERT_GAME, (game.token, game.host, game.guest, game.status, started, time.time())))
+
+    # Rows grouped by statement, order of changes to the same user is kept
+    # A failed batch is rolled back so the next one starts a clean transaction, its callers get the error
+    def write_batch(self, batch):
+        try:
+            self.writer.execute("BEGIN")
+            index = 0
+            while index < len(batch):
+                statement = batch[index][0]
+                end = index
+                while end < len(batch) and batch[end][0] == statement:
+                    end += 1
+                self.writer.executemany(statement, [parameters for _, parameters in batch[index:end]])
+                index = end
+            self.writer.execute("COMMIT")
+        except sqlite3.Error:
+            try:
+                self.writer.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass  # Nothing was started or SQLite rolled back already
+            raise
+
+    # Every user at once, used to move a whole database into SQLite
+    def write_snapshot(self, users):
+        rows = [(username, user_data['password'],
+                 json.dumps(user_data['follows']) if user_data.get('follows') else None)
+                for username, user_data in users.items()]
+        connection = self.connect()
+        connection.execute("BEGIN")
+        connection.executemany(UPSERT_USER, rows)
+        connection.execute("COMMIT")
+        connection.close()
+
+
+# Copy every user of the file store into the SQLite database
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SAI DATABASE IMPORT")
+    parser.add_argument("source", help="binary snapshot (.snap) or JSON lines database file")
+    parser.add_argument("target", nargs="?", default="database.db")
+    args = parser.parse_args()
+
+    users = read_binary_snapshot(args.source) if args.source.endswith(".snap") else read_json_lines(args.source)
+
+    database = User_Database(args.target)
+    database.connect().executescript(SCHEMA)
+    database.write_snapshot(users)
+    print(f"✅ IMPORTED {len(users)} USERS: {args.source} -> {args.target}")
@@ -0,0 +1,268 @@
+# Single-threaded event loop mode for the SAI server
+
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+
+from sai_protocol import Frame_Decoder, Frame_Error, HANDSHAKE_ACK, OUTBOUND_LIMIT, PUSH_MARK, encode_frame
+
+
+class Loop_Connection:
+
+    # Client connection owned by the event loop, replaces the raw socket given to handle_message
+    def __init__(self, sock, addr, loop):
+        self.sock = sock
+        self.addr = addr
+        self.loop = loop
+        self.decoder = Frame_Decoder()  # Framed or text protocol chosen by first bytes
+        self.out_buffer = bytearray()  # Pending bytes, written when socket is ready
+        self.lock = threading.Lock()  # Send may be called from the invite expiry thread
+        self.watching_write = False  # Registered for writability at selector
+        self.logged_in_username = None  # Save username for disconnection control
+        self.tagged = False  # Client tags its requests, messages that are not replies get the push mark
+        self.overflowed = False  # Passed the outbound limit, dropped at the next loop iteration
+        self.last_seen = time.monotonic()  # Any message from the client, read by the heartbeat sweep
+        self.holds = 0  # Commands answering later, commands behind them wait in the backlog
+        self.backlog = deque()  # Received commands not run yet, replies keep the order of requests
+
+    # Buffer outgoing message, event loop writes it when the socket is writable
+    # A client that lets more than OUTBOUND_LIMIT bytes pile up is disconnected instead of growing the buffer
+    def send(self, data, reply=False):
+        if self.tagged and not reply:
+            data = PUSH_MARK + data
+        if self.decoder.framed:
+            data = encode_frame(data)
+
+        # Only the sender that crosses the limit reports it, checked and set under one lock
+        with self.lock:
+            if self.overflowed:
+                return 0
+            overflowed = len(self.out_buffer) + len(data) > OUTBOUND_LIMIT
+            if overflowed:
+                self.overflowed = True
+            else:
+                self.out_buffer += data
+
+        if overflowed:
+            self.loop.server.outbound_overflow(self.addr)
+            self.shutdown()
+            return 0
+
+        self.loop.schedule_write(self)
+        return len(data)
+
+    # Command answers after it returns, such as a registration waiting for the storage writer
+    def hold(self):
+        self.holds += 1
+
+    # Called at the loop thread once the held answer is sent, waiting commands run again
+    def release(self):
+        self.holds -= 1
+        self.loop.run_backlog(self)
+
+    # Run function at the loop thread, answers completed by other threads come back this way
+    def call_soon(self, function, *args):
+        self.loop.call_soon(function, *args)
+
+    # Drop the client from any thread, the loop closes it and runs disconnection control
+    def shutdown(self):
+        self.loop.call_soon(self.loop.close_client, self)
+
+    # Client address info, same as socket getpeername
+    def getpeername(self):
+        return self.addr
+
+    def fileno(self):
+        return self.sock.fileno()
+
+
+class SAI_Event_Loop:
+
+    # Event loop drives all client sockets of one SAI server from a single thread
+    def __init__(self, server):
+        self.server = server
+        self.selector = selectors.DefaultSelector()
+        self.pending_writes = set()  # Connections with data waiting to be flushed
+        self.pending_calls = []  # Functions other threads asked the loop to run
+        self.pending_lock = threading.Lock()
+        self.loop_thread = None
+
+        # Socket pair used by other threads to wake the loop up
+        self.wake_reader, self.wake_writer = socket.socketpair()
+        self.wake_reader.setblocking(False)
+        self.wake_writer.setblocking(False)
+
+    # Initiate listening socket and run the loop forever
+    def run(self):
+        self.loop_thread = threading.current_thread()
+
+        with self.server.open_listener() as s:
+            s.setblocking(False)
+
+            self.selector.register(s, selectors.EVENT_READ, "accept")
+            self.selector.register(
+                self.wake_reader, selectors.EVENT_READ, "wake")
+
+            print(
+                f"☎️  SAI SERVER LISTENING ON {self.server.host}:{self.server.port} (EVENT LOOP)\n")
+
+            while True:
+                for key, mask in self.selector.select():
+                    if key.data == "accept":
+                        self.accept_clients(key.fileobj)
+
+                    elif key.data == "wake":
+                        self.drain_wake()
+
+                    else:
+                        if mask & selectors.EVENT_READ:
+                            self.read_client(key.data)
+                        if mask & selectors.EVENT_WRITE:
+                            self.flush_client(key.data)
+
+                self.flush_pending()
+
+    # Accept every connection waiting at the listening socket
+    def accept_clients(self, listener):
+        while True:
+            try:
+                sock, addr = listener.accept()
+            except BlockingIOError:
+                return
+
+            sock.setblocking(False)
+            conn = Loop_Connection(sock, addr, self)
+            self.selector.register(sock, selectors.EVENT_READ, conn)
+            self.server.connection_opened()
+            self.server.heartbeat.watch(conn)
+
+    # Read client data and run its commands, same command set as threaded mode
+    def read_client(self, conn):
+        try:
+            data = conn.sock.recv(4096)  # Client data
+            messages = conn.decoder.feed(data) if data else None
+        except BlockingIOError:
+            return
+        except (ConnectionError, Frame_Error):
+            messages = None
+
+        if messages is None:
+            self.close_client(conn)
+            return
+        conn.last_seen = time.monotonic()
+
+        if conn.decoder.acknowledge:
+            conn.decoder.acknowledge = False
+            with conn.lock:
+                conn.out_buffer += HANDSHAKE_ACK
+            self.schedule_write(conn)
+
+        conn.backlog.extend(messages)
+        self.run_backlog(conn)
+
+    # Commands in arrival order, a held command stops the ones behind it until its answer is sent
+    def run_backlog(self, conn):
+        while conn.backlog and not conn.holds:
+            if conn.sock.fileno() == -1:
+                conn.backlog.clear()
+                return  # Dropped by an earlier command
+            self.dispatch(conn, conn.backlog.popleft())
+
+    # Handle commands, a failing command or undecodable bytes only drop their own client
+    def dispatch(self, conn, data):
+        try:
+            message = data.decode("utf-8")
+            if message.split():
+                conn.logged_in_username = self.server.handle_message(
+                    conn, message, conn.logged_in_username)
+        except Exception as e:
+            self.server.stdout_event(
+                f"🚨 COMMAND FAILED FROM {conn.addr}: {e!r}")
+            self.call_soon(self.close_client, conn)
+
+    # Queue connection to be flushed by the loop thread
+    def schedule_write(self, conn):
+        with self.pending_lock:
+            self.pending_writes.add(conn)
+
+        # Called from another thread, loop may be sleeping at select
+        if threading.current_thread() is not self.loop_thread:
+            self.wake()
+
+    # Run function at the loop thread
+    def call_soon(self, function, *args):
+        if threading.current_thread() is self.loop_thread:
+            function(*args)
+        else:
+            with self.pending_lock:
+                self.pending_calls.append((function, args))
+            self.wake()
+
+    def wake(self):
+        try:
+            self.wake_writer.send(b"\0")
+        except BlockingIOError:
+            pass  # Loop already has a wake up pending
+
+    def drain_wake(self):
+        try:
+            while self.wake_reader.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    # Write everything other threads and commands queued since last iteration
+    def flush_pending(self):
+        with self.pending_lock:
+            pending_calls, self.pending_calls = self.pending_calls, []
+
+        for function, args in pending_calls:
+            function(*args)
+
+        # Taken after the calls, answers they sent go out in this iteration
+        with self.pending_lock:
+            pending_writes, self.pending_writes = self.pending_writes, set()
+
+        for conn in pending_writes:
+            self.flush_client(conn)
+
+    # Send as much buffered data as the socket accepts
+    def flush_client(self, conn):
+        if conn.sock.fileno() == -1:
+            return
+
+        with conn.lock:
+            try:
+                sent = conn.sock.send(conn.out_buffer) if conn.out_buffer else 0
+            except BlockingIOError:
+                sent = 0
+            except ConnectionError:
+                self.close_client(conn)
+                return
+
+            del conn.out_buffer[:sent]
+            remaining = bool(conn.out_buffer)
+
+        # Watch for writability only while there is data left
+        if remaining != conn.watching_write:
+            conn.watching_write = remaining
+            events = selectors.EVENT_READ
+            if remaining:
+                events |= selectors.EVENT_WRITE
+            self.selector.modify(conn.sock, events, conn)
+
+    # Unregister client and run disconnection control
+    def close_client(self, conn):
+        if conn.sock.fileno() == -1:
+            return
+
+        self.selector.unregister(conn.sock)
+        conn.sock.close()
+        self.server.heartbeat.forget(conn)
+        self.server.connection_closed()
+
+        if conn.logged_in_username:
+            self.server.disconnect_user(conn.logged_in_username)
+            conn.logged_in_username = None
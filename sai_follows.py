@@ -0,0 +1,103 @@
+# Follow lists of SAI users, compact adjacency arrays in both directions
+
+import bisect
+import threading
+from array import array
+
+
+class Follow_Graph:
+
+    # Usernames are interned to integer ids, each user keeps sorted arrays of 4-byte ids
+    # Following answers who a user is interested in, followers answers who must hear about a user
+    def __init__(self):
+        self.ids = {}  # Username to id
+        self.names = []  # Id to username
+        self.following = {}  # Id to sorted array of followed ids
+        self.followers = {}  # Id to sorted array of follower ids
+        self.lock = threading.Lock()
+
+    def user_id(self, username):
+        user_id = self.ids.get(username)
+        if user_id is None:
+            user_id = len(self.names)
+            self.ids[username] = user_id
+            self.names.append(username)
+        return user_id
+
+    # Add edge, False when user already follows target
+    def follow(self, username, target):
+        with self.lock:
+            user_id = self.user_id(username)
+            target_id = self.user_id(target)
+
+            if not insert_sorted(self.following.setdefault(user_id, array('I')), target_id):
+                return False
+            insert_sorted(self.followers.setdefault(target_id, array('I')), user_id)
+            return True
+
+    # Remove edge, False when user did not follow target
+    def unfollow(self, username, target):
+        with self.lock:
+            user_id = self.ids.get(username)
+            target_id = self.ids.get(target)
+            if user_id is None or target_id is None:
+                return False
+
+            if not remove_sorted(self.following.get(user_id), target_id):
+                return False
+            remove_sorted(self.followers.get(target_id), user_id)
+            return True
+
+    def count_following(self, username):
+        user_id = self.ids.get(username)
+        return len(self.following.get(user_id, ())) if user_id is not None else 0
+
+    # Usernames followed by user, sorted by name
+    def following_names(self, username):
+        with self.lock:
+            user_id = self.ids.get(username)
+            if user_id is None:
+                return []
+            return sorted(self.names[target_id] for target_id in self.following.get(user_id, ()))
+
+    # Usernames following user, used for presence fan-out
+    def follower_names(self, username):
+        with self.lock:
+            user_id = self.ids.get(username)
+            if user_id is None:
+                return []
+            return [self.names[follower_id] for follower_id in self.followers.get(user_id, ())]
+
+    def is_following(self, username, target):
+        user_id = self.ids.get(username)
+        target_id = self.ids.get(target)
+        if user_id is None or target_id is None:
+            return False
+        ids = self.following.get(user_id, ())
+        index = bisect.bisect_left(ids, target_id)
+        return index < len(ids) and ids[index] == target_id
+
+    # Bytes held by the adjacency arrays
+    def adjacency_bytes(self):
+        with self.lock:
+            return sum(ids.buffer_info()[1] * ids.itemsize
+                       for side in (self.following, self.followers) for ids in side.values())
+
+
+# Keep ids sorted and unique, False when id is already there
+def insert_sorted(ids, value):
+    index = bisect.bisect_left(ids, value)
+    if index < len(ids) and ids[index] == value:
+        return False
+    ids.insert(index, value)
+    return True
+
+
+def remove_sorted(ids, value):
+    if not ids:
+        return False
+    index = bisect.bisect_left(ids, value)
+    if index == len(ids) or ids[index] != value:
+        return False
+    del ids[index]
+    return True
@@ -0,0 +1,149 @@
+# Game records of SAI, live games indexed by id and finished games kept only for a while
+
+import collections
+import sys
+import threading
+import time
+import uuid
+
+# Record states: PENDING invite ends as DECLINED, TIMEOUT or CANCELLED or goes on to ACCEPTED, PLAYING and OVER
+MATCH_STATES = ('ACCEPTED', 'PLAYING')  # Live states bound to both players until GAME_OVER
+
+
+class Game_Record:
+
+    # Fixed attributes, no per record dictionary
+    __slots__ = ('game_id', 'token', 'host', 'guest', 'status', 'timer', 'created', 'finished')
+
+    def __init__(self, game_id, token, host, guest):
+        self.game_id = game_id
+        self.token = token
+        self.host = host
+        self.guest = guest
+        self.status = 'PENDING'
+        self.timer = None  # Invite deadline while PENDING
+        self.created = time.monotonic()
+        self.finished = None  # Time record reached a finished state
+
+
+class Game_Registry:
+
+    # Records keyed by a compact integer id, token is only kept to identify the game outside the server
+    # Finished records stay ttl seconds, and never more than max_finished of them
+    def __init__(self, ttl=300, max_finished=10000):
+        self.ttl = ttl
+        self.max_finished = max_finished
+        self.records = {}  # Game id to record
+        self.ids = {}  # Token to game id
+        self.by_player = {}  # Username to id of its ACCEPTED or PLAYING game
+        self.finished = collections.deque()  # Ids of finished records, oldest first
+        self.next_id = 1
+        self.lock = threading.Lock()
+
+        # Called with every record reaching a finished state, under the registry lock, must not block
+        self.watchers = []
+
+        self.created = 0
+        self.evicted = 0
+
+    # New PENDING invite of host to guest
+    def create(self, host, guest):
+        with self.lock:
+            self.evict_expired()
+
+            game_id = self.next_id
+            self.next_id += 1
+            record = Game_Record(game_id, str(uuid.uuid4()), host, guest)
+            self.records[game_id] = record
+            self.ids[record.token] = game_id
+            self.created += 1
+            return record
+
+    def get(self, game_id):
+        return self.records.get(game_id)
+
+    def get_by_token(self, token):
+        return self.records.get(self.ids.get(token))
+
+    # ACCEPTED or PLAYING game of a player, None when not in a game
+    def game_of(self, username):
+        return self.records.get(self.by_player.get(username))
+
+    # Guest accepted, both players are bound to the game until GAME_OVER
+    def accept(self, record):
+        with self.lock:
+            # Earlier game never reported its GAME_OVER, it can not stay live forever
+            for username in (record.host, record.guest):
+                previous = self.records.get(self.by_player.get(username))
+                if previous and previous.status in MATCH_STATES:
+                    self.set_finished(previous, 'OVER')
+
+            record.status = 'ACCEPTED'
+            record.timer = None
+            self.by_player[record.host] = record.game_id
+            self.by_player[record.guest] = record.game_id
+
+    # P2P match started between host and guest of an accepted game
+    def start(self, host, guest):
+        with self.lock:
+            record = self.records.get(self.by_player.get(host))
+            if record and record.guest == guest and record.status == 'ACCEPTED':
+                record.status = 'PLAYING'
+            return record
+
+    # Player left the game, game is OVER when its first player leaves
+    def leave(self, username):
+        with self.lock:
+            record = self.records.get(self.by_player.pop(username, None))
+            if record and record.status in MATCH_STATES:
+                self.set_finished(record, 'OVER')
+            return record
+
+    # Invite resolved without a game, DECLINED, TIMEOUT or CANCELLED
+    def finish(self, record, status):
+        with self.lock:
+            self.set_finished(record, status)
+
+    def set_finished(self, record, status):
+        record.status = status
+        record.timer = None
+        record.finished = time.monotonic()
+        self.finished.append(record.game_id)
+        for watcher in self.watchers:
+            watcher(record)
+        self.evict_expired()
+
+    # Drop finished records older than ttl or beyond the count limit, oldest first
+    def evict_expired(self):
+        deadline = time.monotonic() - self.ttl
+        while self.finished:
+            record = self.records.get(self.finished[0])
+            if record and record.finished > deadline and len(self.finished) <= self.max_finished:
+                return
+            self.finished.popleft()
+            if record:
+                self.remove(record)
+
+    def remove(self, record):
+        del self.records[record.game_id]
+        del self.ids[record.token]
+        for username in (record.host, record.guest):
+            if self.by_player.get(username) == record.game_id:
+                del self.by_player[username]
+        self.evicted += 1
+
+    # Record counts and approximate bytes held by records, tokens and indexes
+    def stats(self):
+        with self.lock:
+            self.evict_expired()
+            records = list(self.records.values())
+            size = sum(sys.getsizeof(record) + sys.getsizeof(record.token) for record in records)
+            size += sum(sys.getsizeof(index) for index in (self.records, self.ids, self.by_player, self.finished))
+
+            return {
+                'live': len(records) - len(self.finished),
+                'finished': len(self.finished),
+                'created': self.created,
+                'evicted': self.evicted,
+                'bytes': size,
+            }
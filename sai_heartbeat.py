@@ -0,0 +1,61 @@
+# Heartbeats for SAI server, pings quiet client connections and reaps the ones that stopped answering
+
+import threading
+import time
+
+from sai_protocol import PING
+
+HEARTBEAT_INTERVAL = 2  # Seconds a connection may stay quiet before SAI pings it
+MISSED_HEARTBEATS = 3  # Intervals without any message before a connection is reaped
+
+
+class Heartbeat_Monitor:
+
+    # Connections note when their client was last heard, one sweep per interval on the timer wheel checks them all
+    # Only framed connections are pinged and reaped, text protocol clients do not know PING
+    def __init__(self, timers, reaped, interval=HEARTBEAT_INTERVAL):
+        self.timers = timers
+        self.reaped = reaped  # Called with the address of every reaped connection
+        self.interval = interval  # 0 turns heartbeats off
+        self.connections = set()
+        self.lock = threading.Lock()
+
+    # Silence after which a client is considered gone, a laptop asleep or a pulled cable never sends a FIN
+    @property
+    def timeout(self):
+        return self.interval * MISSED_HEARTBEATS
+
+    def start(self):
+        if self.interval > 0:
+            self.timers.schedule(self.interval, self.sweep)
+        return self
+
+    def watch(self, conn):
+        conn.last_seen = time.monotonic()
+        with self.lock:
+            self.connections.add(conn)
+
+    def forget(self, conn):
+        with self.lock:
+            self.connections.discard(conn)
+
+    # Ping connections quiet for an interval, shut down the ones quiet for the whole timeout
+    # Receiving side of a reaped connection sees it end and runs disconnection control, freeing session and invites
+    def sweep(self):
+        try:
+            now = time.monotonic()
+            with self.lock:
+                connections = list(self.connections)
+
+            for conn in connections:
+                if not conn.decoder.framed:
+                    continue
+                quiet = now - conn.last_seen
+                if quiet >= self.timeout:
+                    self.forget(conn)
+                    conn.shutdown()
+                    self.reaped(conn.addr)
+                elif quiet >= self.interval:
+                    conn.send(PING)
+        finally:
+            self.timers.schedule(self.interval, self.sweep)
@@ -0,0 +1,234 @@
+# File store of the users database, write-ahead journal with group commit and background snapshots
+
+import json
+import os
+import threading
+from sai_commit import Group_Commit
+from sai_snapshot import Binary_Snapshot, Snapshot_Error, read_binary_snapshot, write_binary_snapshot
+
+
+class User_Journal(Group_Commit):
+
+    # Snapshot is binary and read on demand, journal appends one changed user per JSON line
+    # JSON lines database file of older versions is read only while there is no binary snapshot
+    def __init__(self, snapshot_path="database.snap", journal_path="database.journal", legacy_path="database.txt",
+                 snapshot_every=5000):
+        super().__init__()
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.legacy_path = legacy_path
+        self.rotated_path = journal_path + ".old"  # Journal covered by a snapshot in progress
+        self.snapshot_every = snapshot_every  # Journal entries before a new snapshot
+
+        self.entries_since_snapshot = 0
+        self.snapshot_thread = None
+        self.snapshot_source = None  # Returns a copy of every user for snapshots
+        self.snapshot = None  # Mapped snapshot the user table reads, swapped when a newer one is written
+        self.users = None
+        self.journal = None
+        self.journal_length = 0  # Bytes of whole entries, a failed write is cut back to it
+
+    # Binary snapshot, None when there is none yet
+    def open_snapshot(self):
+        if not os.path.exists(self.snapshot_path):
+            return None
+        return Binary_Snapshot(self.snapshot_path)
+
+    # Users changed after the snapshot, later lines win
+    # Without a binary snapshot every user comes from the JSON lines database file
+    def replay(self):
+        found = os.path.exists(self.snapshot_path)
+        paths = (self.rotated_path, self.journal_path) if found else (
+            self.legacy_path, self.rotated_path, self.journal_path)
+
+        for path in paths:
+            try:
+                for username, data in self.read_journal(path):
+                    found = True
+                    if path == self.journal_path:
+                        self.entries_since_snapshot += 1
+                    yield username, data
+                found = True  # Empty file counts as found
+            except FileNotFoundError:
+                continue
+
+        if not found:
+            raise FileNotFoundError(self.snapshot_path)
+
+    # Entries of one journal or JSON lines file in order
+    def read_journal(self, path):
+        with open(path, "r", encoding="utf-8") as file:
+            for line in file:
+                if not line.strip():  # Check if the line is not empty
+                    continue
+                try:
+                    user_data = json.loads(line)
+                except json.JSONDecodeError:
+                    # Last entry cut by a crash, it was never acknowledged
+                    print(f"\n ⚠️  SKIPPING DAMAGED LINE AT {path}\n")
+                    continue
+                yield user_data.popitem()
+
+    # Fill user table and follow graph, snapshot users are read on demand
+    # Only follow lists and journal entries are loaded now
+    def load(self, users, follows):
+        follow_lists = {}
+
+        self.users = users
+        snapshot = self.snapshot = self.open_snapshot()
+        if snapshot:
+            users.attach(snapshot)
+            for username, extra in snapshot.extras():
+                follow_lists[username] = extra.get('follows', [])
+
+        for username, data in self.replay():
+            # Older files also stored presence fields, only credentials are kept
+            users.load(username, data['password'])
+            follow_lists[username] = data.get('follows', [])  # Later records replace the whole list
+
+        # Targets were checked by FOLLOW and users are never removed
+        for username, targets in follow_lists.items():
+            for target in targets:
+                follows.follow(username, target)
+
+    # Match history is not kept by the file store, game.log has every match
+    def record_game(self, game):
+        pass
+
+    # Start writer thread, journal of the previous run keeps growing until the next snapshot
+    def start(self, snapshot_source):
+        self.snapshot_source = snapshot_source
+
+        # First run after the JSON lines database, or a snapshot was cut short, write it before serving
+        if not os.path.exists(self.snapshot_path) or os.path.exists(self.rotated_path):
+            self.write_snapshot(snapshot_source())
+            self.remove_file(self.rotated_path)
+            self.remove_file(self.journal_path)
+            self.entries_since_snapshot = 0
+
+        self.truncate_damaged_tail()
+        self.open_journal()
+        self.start_writer()
+
+    # Unbuffered, a failed write leaves nothing behind to be written again with the next batch
+    def open_journal(self):
+        self.journal = open(self.journal_path, "ab", buffering=0)
+        self.journal_length = self.journal_size()
+
+    # Append one user change, done is called with None once it is on disk or with the write error
+    def append(self, username, user_data, done=None):
+        with self.condition:
+            # Encoded under lock so the latest state of the user is the last journal entry
+            line = json.dumps({username: user_data}) + "\n"
+            self.queue(line.encode("utf-8"), done)
+
+    # One write and one fsync for every batch, a failed batch is cut off so the journal keeps whole lines
+    def write_batch(self, batch):
+        data = b"".join(batch)
+        view = memoryview(data)
+        try:
+            while view:
+                view = view[self.journal.write(view):]
+            os.fsync(self.journal.fileno())
+        except OSError:
+            try:
+                os.ftruncate(self.journal.fileno(), self.journal_length)
+            except OSError:
+                pass  # Damaged tail is cut at next start
+            raise
+        self.journal_length += len(data)
+
+    def batch_committed(self, batch):
+        self.entries_since_snapshot += len(batch)
+        if self.entries_since_snapshot >= self.snapshot_every:
+            self.rotate()
+
+    # Move journal aside and snapshot in background, journal keeps taking entries meanwhile
+    # Only the rename happens at the writer thread, pending commits never wait for users to be decoded
+    def rotate(self):
+        if self.snapshot_thread and self.snapshot_thread.is_alive():
+            return  # Previous snapshot still being written
+
+        self.journal.close()
+        try:
+            os.replace(self.journal_path, self.rotated_path)
+        finally:
+            self.open_journal()
+        self.entries_since_snapshot = 0
+
+        self.snapshot_thread = threading.Thread(
+            target=self.finish_snapshot, daemon=True)
+        self.snapshot_thread.start()
+
+    # Snapshot thread, previous snapshot plus the rotated journal make the next one
+    def finish_snapshot(self):
+        try:
+            users = read_binary_snapshot(self.snapshot_path)
+            for username, data in self.read_journal(self.rotated_path):
+                users[username] = data
+            self.write_snapshot(users)
+        except (OSError, ValueError, Snapshot_Error) as e:
+            # Rotated journal stays, it is replayed and snapshotted at next start
+            print(f"🚨 SNAPSHOT FAILED: {e!r}")
+            return
+        self.remove_file(self.rotated_path)
+
+    # Entry cut by a crash would glue itself to the next one, cut the journal back to its last full line
+    def truncate_damaged_tail(self):
+        size = self.journal_size()
+        if not size:
+            return
+
+        with open(self.journal_path, "rb+") as file:
+            end = size
+            while end > 0:
+                start = max(0, end - 4096)
+                file.seek(start)
+                newline = file.read(end - start).rfind(b"\n")
+                if newline >= 0:
+                    end = start + newline + 1
+                    break
+                end = start
+
+            if end < size:
+                file.truncate(end)  # Replay already skipped this line
+
+    # Full binary snapshot, written aside and renamed so a crash keeps the previous one
+    def write_snapshot(self, users):
+        temporary_path = self.snapshot_path + ".tmp"
+
+        with open(temporary_path, "wb") as file:
+            write_binary_snapshot(file, users)
+            file.flush()
+            os.fsync(file.fileno())
+
+        # Mapped snapshot is swapped in place, user table reads the new file from now on
+        if self.snapshot:
+            self.snapshot.replace(temporary_path)
+            self.users.attach(self.snapshot)
+        else:
+            os.replace(temporary_path, self.snapshot_path)
+        self.sync_directory()
+
+    # Rename is durable only after the directory entry is synced
+    def sync_directory(self):
+        if os.name == "nt":
+            return
+        directory = os.open(os.path.dirname(
+            os.path.abspath(self.snapshot_path)), os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+    def journal_size(self):
+        try:
+            return os.path.getsize(self.journal_path)
+        except FileNotFoundError:
+            return 0
+
+    def remove_file(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
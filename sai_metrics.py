@@ -0,0 +1,154 @@
+# Server metrics, command latency histograms, counters and gauges for STATS and Prometheus
+
+import os
+import threading
+import time
+
+SUB_BUCKET_BITS = 3  # 8 buckets per power of two, values are kept within 12.5%
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+BUCKETS = 64 * SUB_BUCKETS  # Up to 2^64 ns
+
+# Prometheus bucket bounds in seconds, fixed so every dump has the same series
+EXPORT_BOUNDS = (0.000001, 0.0000025, 0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+                 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+# Bucket of a value in ns, HDR style: exact below 16 and 3 significant bits above
+def bucket_of(value):
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    if shift <= 0:
+        return value
+    return (shift << SUB_BUCKET_BITS) + (value >> shift)
+
+
+# Highest value in ns that falls in a bucket
+def bucket_limit(index):
+    shift = (index >> SUB_BUCKET_BITS) - 1
+    if shift <= 0:
+        return index
+    return (((index & (SUB_BUCKETS - 1)) + SUB_BUCKETS + 1) << shift) - 1
+
+
+class Latency_Histogram:
+
+    # Fixed bucket counts, recording costs one index computation and one increment
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.sum = 0  # ns
+        self.max = 0
+
+    # Same index as bucket_of, written inline because it runs for every command
+    def record(self, value):
+        shift = value.bit_length() - SUB_BUCKET_BITS - 1
+        self.counts[(shift << SUB_BUCKET_BITS) + (value >> shift) if shift > 0 else value] += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    # Samples recorded, counted when asked instead of on every record
+    @property
+    def total(self):
+        return sum(self.counts)
+
+    # Value in ns below which the given fraction of samples falls
+    def percentile(self, fraction):
+        total = self.total
+        if not total:
+            return 0
+        rank = fraction * total
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(bucket_limit(index), self.max)
+        return self.max
+
+    # Samples at or below each bound in seconds
+    def cumulative(self, bounds):
+        counts = []
+        seen = 0
+        index = 0
+        for bound in bounds:
+            limit = bound * 1e9
+            while index < BUCKETS and bucket_limit(index) <= limit:
+                seen += self.counts[index]
+                index += 1
+            counts.append(seen)
+        return counts
+
+
+class Server_Metrics:
+
+    # Histogram updates take no lock, a thread switch inside a record may lose one sample in threaded mode
+    # Counters take a lock, gauges derived from them must not drift
+    # Commands outside the known set share one histogram, clients can not grow the table
+    def __init__(self, commands):
+        self.latency = {command: Latency_Histogram() for command in commands}
+        self.other = Latency_Histogram()
+        self.counters = {}
+        self.counter_lock = threading.Lock()
+        self.gauges = {}  # Name to function read when metrics are shown
+        self.started = time.time()
+        self.dump_lock = threading.Lock()
+
+    # Histogram of a command, the caller records into it directly
+    def histogram(self, command):
+        return self.latency.get(command, self.other)
+
+    # Time of one command in ns
+    def observe(self, command, elapsed):
+        self.latency.get(command, self.other).record(elapsed)
+
+    # Counters are updated from several threads, gauges such as open connections are derived from them
+    def increment(self, name, amount=1):
+        with self.counter_lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def gauge(self, name, function):
+        self.gauges[name] = function
+
+    # Admin report, latency in microseconds
+    def report(self):
+        lines = [f"📊 SAI STATS | UPTIME: {time.time() - self.started:.0f}s\n\n",
+                 f"{'COMMAND':<24} {'COUNT':>9} {'P50 µs':>9} {'P90 µs':>9} {'P99 µs':>9} {'MAX µs':>10}\n"]
+        for command, histogram in sorted(self.histograms()):
+            if histogram.total:
+                lines.append(
+                    f"{command:<24} {histogram.total:>9} {histogram.percentile(0.5) / 1000:>9.1f} "
+                    f"{histogram.percentile(0.9) / 1000:>9.1f} {histogram.percentile(0.99) / 1000:>9.1f} "
+                    f"{histogram.max / 1000:>10.1f}\n")
+
+        lines.append("\n")
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"{name}: {value}\n")
+        for name, function in sorted(self.gauges.items()):
+            lines.append(f"{name}: {function()}\n")
+        return "".join(lines)
+
+    def histograms(self):
+        return list(self.latency.items()) + [("OTHER", self.other)]
+
+    # Prometheus text format
+    def prometheus(self):
+        lines = ["# HELP sai_command_duration_seconds Time to handle one client command\n",
+                 "# TYPE sai_command_duration_seconds histogram\n"]
+        for command, histogram in self.histograms():
+            for bound, count in zip(EXPORT_BOUNDS, histogram.cumulative(EXPORT_BOUNDS)):
+                lines.append(f'sai_command_duration_seconds_bucket{{command="{command}",le="{bound}"}} {count}\n')
+            lines.append(f'sai_command_duration_seconds_bucket{{command="{command}",le="+Inf"}} {histogram.total}\n')
+            lines.append(f'sai_command_duration_seconds_sum{{command="{command}"}} {histogram.sum / 1e9:.9f}\n')
+            lines.append(f'sai_command_duration_seconds_count{{command="{command}"}} {histogram.total}\n')
+
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"# TYPE sai_{name}_total counter\nsai_{name}_total {value}\n")
+        for name, function in sorted(self.gauges.items()):
+            lines.append(f"# TYPE sai_{name} gauge\nsai_{name} {function()}\n")
+        return "".join(lines)
+
+    # Write Prometheus text aside and rename, a scraper never reads half a file
+    def dump(self, path):
+        with self.dump_lock:
+            temporary_path = path + ".tmp"
+            with open(temporary_path, "w", encoding="utf-8") as file:
+                file.write(self.prometheus())
+            os.replace(temporary_path, path)
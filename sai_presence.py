@@ -0,0 +1,207 @@
+# In-memory presence of logged in users, never written to disk
+
+import bisect
+import itertools
+import socket
+import sys
+import threading
+
+# Lobby views kept indexed, two statuses plus users available to receive invites
+VIEWS = ('ONLINE', 'PLAYING', 'AVAILABLE')
+
+# Status and notification of a session packed as bits of one small int
+STATUSES = ('ONLINE', 'PLAYING')
+NOTIFICATIONS = ('AVAILABLE', 'BUSY')
+PLAYING_BIT = 1
+BUSY_BIT = 2
+
+
+class Presence:
+
+    # One logged in session, ONLINE or PLAYING and AVAILABLE or BUSY for notifications
+    # Fixed slots, state bits and IPv4 address with port packed in one int
+    __slots__ = ('session_id', 'username', 'state', 'address')
+
+    def __init__(self, session_id, username, ip, port):
+        self.session_id = session_id
+        self.username = sys.intern(username)
+        self.state = 0  # ONLINE and AVAILABLE
+        self.address = int.from_bytes(socket.inet_aton(ip), "big") << 16 | int(port)
+
+    @property
+    def status(self):
+        return STATUSES[self.state & PLAYING_BIT]
+
+    @status.setter
+    def status(self, status):
+        self.state = self.state | PLAYING_BIT if status == 'PLAYING' else self.state & ~PLAYING_BIT
+
+    @property
+    def notification(self):
+        return NOTIFICATIONS[(self.state & BUSY_BIT) >> 1]
+
+    @notification.setter
+    def notification(self, notification):
+        self.state = self.state | BUSY_BIT if notification == 'BUSY' else self.state & ~BUSY_BIT
+
+    @property
+    def ip(self):
+        return socket.inet_ntoa((self.address >> 16).to_bytes(4, "big"))
+
+    @property
+    def port(self):
+        return self.address & 0xFFFF
+
+
+class Presence_Table:
+
+    # Sessions keyed by session id, username index allows only one session per user
+    def __init__(self):
+        self.sessions = {}
+        self.by_username = {}
+        self.session_ids = itertools.count(1)
+        self.lock = threading.RLock()  # Login check and index updates must be atomic
+
+        # Views by status, username to presence in login order, listing costs the result size only
+        # AVAILABLE holds ONLINE or PLAYING users that can receive invites
+        self.views = {view: {} for view in VIEWS}
+        self.sorted_names = {view: [] for view in VIEWS}  # Same users sorted, for cursor pages
+
+        # Each view changes version on its own, lobby lists are cached per version
+        self.versions = {view: 1 for view in VIEWS}
+
+        # Called with username and change kind under the table lock, must not block
+        self.watchers = []
+
+    # New session for user, None when user is already logged in
+    def login(self, username, ip, port):
+        with self.lock:
+            if username in self.by_username:
+                return None
+
+            session_id = next(self.session_ids)
+            presence = Presence(session_id, username, ip, port)
+            self.sessions[session_id] = presence
+            self.by_username[username] = session_id
+
+            self.add_to_view(presence.status, presence)
+            self.add_to_view('AVAILABLE', presence)
+            self.notify(username, 'JOINED')
+            return session_id
+
+    # Remove session, returns its presence or None
+    def logout(self, session_id):
+        with self.lock:
+            presence = self.sessions.pop(session_id, None)
+            if presence:
+                del self.by_username[presence.username]
+                self.remove_from_view(presence.status, presence.username)
+                self.remove_from_view('AVAILABLE', presence.username)
+                self.notify(presence.username, 'LEFT')
+            return presence
+
+    # Presence of a logged in user, None when offline
+    def get(self, username):
+        session_id = self.by_username.get(username)
+        return self.sessions.get(session_id) if session_id else None
+
+    def session_of(self, username):
+        return self.by_username.get(username)
+
+    # OFFLINE when user has no session
+    def status(self, username):
+        presence = self.get(username)
+        return presence.status if presence else 'OFFLINE'
+
+    def notification(self, username):
+        presence = self.get(username)
+        return presence.notification if presence else None
+
+    # Move user between status views
+    def set_status(self, username, status):
+        with self.lock:
+            presence = self.get(username)
+            if presence and presence.status != status:
+                self.remove_from_view(presence.status, username)
+                presence.status = status
+                self.add_to_view(status, presence)
+
+                # Status is shown at the available list too
+                if username in self.views['AVAILABLE']:
+                    self.versions['AVAILABLE'] += 1
+                self.notify(username, 'STATUS')
+
+    def set_notification(self, username, notification):
+        with self.lock:
+            presence = self.get(username)
+            if presence and presence.notification != notification:
+                presence.notification = notification
+                if notification == 'AVAILABLE':
+                    self.add_to_view('AVAILABLE', presence)
+                else:
+                    self.remove_from_view('AVAILABLE', username)
+                self.notify(username, 'NOTIFICATION')
+
+    def notify(self, username, change):
+        for watcher in self.watchers:
+            watcher(username, change)
+
+    def add_to_view(self, view, presence):
+        self.views[view][presence.username] = presence
+        bisect.insort(self.sorted_names[view], presence.username)
+        self.versions[view] += 1
+
+    def remove_from_view(self, view, username):
+        if self.views[view].pop(username, None):
+            names = self.sorted_names[view]
+            del names[bisect.bisect_left(names, username)]
+            self.versions[view] += 1
+
+    # Every session at given view, from the view index
+    def with_status(self, view):
+        with self.lock:
+            return list(self.views[view].values())
+
+    # Version and sessions at given view, taken together so a cached list matches its version
+    def snapshot(self, view):
+        with self.lock:
+            return self.versions[view], list(self.views[view].values())
+
+    # Sorted page of a view after a username, with optional username prefix
+    # Among is a sorted list of usernames to page through instead of the whole view
+    # Returns version, sessions and the last username when more sessions follow
+    def page(self, view, after=None, prefix="", limit=50, exclude=None, among=None):
+        with self.lock:
+            sessions = self.views[view]
+            names = self.sorted_names[view]
+            if among is not None:
+                names = [username for username in among if username in sessions]
+
+            start = bisect.bisect_left(names, prefix)
+            if after is not None and after >= prefix:
+                start = bisect.bisect_right(names, after)
+
+            page = []
+            index = start
+            while index < len(names) and len(page) < limit:
+                username = names[index]
+                if not username.startswith(prefix):
+                    break
+                if username != exclude:
+                    page.append(sessions[username])
+                index += 1
+
+            # Another matching user after this page
+            while index < len(names) and names[index] == exclude:
+                index += 1
+            more = index < len(names) and names[index].startswith(prefix)
+
+            return self.versions[view], page, page[-1].username if more and page else None
+
+    # Every session that can receive an invite
+    def available_for_invite(self):
+        return self.with_status('AVAILABLE')
+
+    # Number of sessions at a view
+    def count(self, view):
+        return len(self.views[view])
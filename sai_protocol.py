@@ -0,0 +1,469 @@
+# SAI wire protocol, length-prefixed frames negotiated by a handshake
+
+import base64
+import binascii
+import select
+import selectors
+import socket
+import struct
+import threading
+import time
+from collections import deque
+
+# Framed peers open the connection with the handshake, anything else is the old text protocol
+HANDSHAKE = b"SAI/2 FRAMED\n"
+HANDSHAKE_ACK = b"SAI/2 OK\n"
+
+HEADER = struct.Struct("!I")  # Payload length, 4 bytes big endian
+MAX_FRAME_SIZE = 1 << 20  # Refuse frames larger than 1 MB
+OUTBOUND_LIMIT = 4 << 20  # Bytes waiting for one client before SAI drops it as too slow
+
+# Request tag, a command starting with #<id> gets exactly one reply starting with the same #<id>
+# Once a client tags requests, every message that is not a reply starts with the push mark
+TAG_PREFIX = "#"
+PUSH_MARK = b"! "
+
+# Heartbeat, SAI pings connections quiet for a while and clients answer at once
+PING = b"PING\n"
+PONG = b"PONG"
+PINGS = (PING, PUSH_MARK + PING)
+
+
+class Frame_Error(ValueError):
+    pass
+
+
+# Opaque page cursor, last username of the previous page
+def encode_cursor(username):
+    return base64.urlsafe_b64encode(username.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    try:
+        username = base64.b64decode(cursor.encode("ascii"), altchars=b"-_", validate=True).decode("utf-8")
+    except (binascii.Error, UnicodeError) as e:
+        raise ValueError(f"INVALID CURSOR: {cursor}") from e
+    if not username:
+        raise ValueError(f"INVALID CURSOR: {cursor}")
+    return username
+
+
+# Optional KEY=VALUE arguments after the positional ones of a command
+def parse_options(tokens):
+    options = {}
+    for token in tokens:
+        key, separator, value = token.partition("=")
+        if separator:
+            options[key.upper()] = value
+    return options
+
+
+# Tag and command of a message, tag is None for untagged commands
+def split_tag(message):
+    if message.startswith(TAG_PREFIX):
+        tag, _, message = message.partition(" ")
+        return tag, message
+    return None, message
+
+
+class Tagged_Reply:
+
+    # Replies of one tagged request, sent as one message once the command is done
+    # A command without a reply still answers with the bare tag, so pipelined clients never wait forever
+    def __init__(self, connection, tag):
+        self.connection = connection
+        self.tag = tag.encode("utf-8")
+        self.replies = []
+        self.held = False  # Command answers after it returns, release sends the reply instead
+
+    def send(self, data):
+        self.replies.append(data)
+        return len(data)
+
+    def flush(self):
+        self.connection.send(self.tag + b" " + b"".join(self.replies), reply=True)
+
+    # Answer comes from another thread, client's later commands wait for it
+    def hold(self):
+        self.held = True
+        self.connection.hold()
+
+    def release(self):
+        self.flush()
+        self.connection.release()
+
+    def call_soon(self, function, *args):
+        self.connection.call_soon(function, *args)
+
+    def getpeername(self):
+        return self.connection.getpeername()
+
+
+# Client connection behind a reply, sessions keep it for later pushes
+def client_connection(conn):
+    return conn.connection if isinstance(conn, Tagged_Reply) else conn
+
+
+# Length of the buffer up to the last whole UTF-8 character, a text read may stop inside one
+def complete_utf8(buffer):
+    end = len(buffer)
+    for back in range(1, min(4, end) + 1):
+        byte = buffer[end - back]
+        if byte & 0xC0 != 0x80:  # ASCII or lead byte, continuation bytes are skipped
+            size = 1 if byte < 0x80 else 2 if byte < 0xE0 else 3 if byte < 0xF0 else 4
+            return end if back >= size else end - back
+    return end
+
+
+# Length header plus payload
+def encode_frame(payload):
+    if len(payload) > MAX_FRAME_SIZE:
+        raise Frame_Error(f"FRAME TOO LARGE: {len(payload)} BYTES")
+    return HEADER.pack(len(payload)) + payload
+
+
+class Frame_Decoder:
+
+    # Framed None means still negotiating, decoder looks for the handshake at the first bytes
+    def __init__(self, framed=None):
+        self.framed = framed
+        self.buffer = bytearray()  # Partial reads wait here until a frame is complete
+        self.acknowledge = False  # Handshake received and not acknowledged yet
+
+    # Feed received bytes, returns every complete message
+    def feed(self, data):
+        self.buffer += data
+
+        if self.framed is None:
+            if self.buffer.startswith(HANDSHAKE):
+                del self.buffer[:len(HANDSHAKE)]
+                self.framed = True
+                self.acknowledge = True
+            elif HANDSHAKE.startswith(self.buffer):
+                return []  # Handshake not complete yet
+            else:
+                self.framed = False
+
+        # Old text protocol, each read is one command, a cut character waits for the next read
+        if not self.framed:
+            end = complete_utf8(self.buffer)
+            if not end:
+                return []
+            message = bytes(self.buffer[:end])
+            del self.buffer[:end]
+            return [message]
+
+        messages = []
+        offset = 0
+        buffer_size = len(self.buffer)
+
+        # Several frames may arrive back to back in one read
+        while buffer_size - offset >= HEADER.size:
+            (length,) = HEADER.unpack_from(self.buffer, offset)
+            if length > MAX_FRAME_SIZE:
+                raise Frame_Error(f"FRAME TOO LARGE: {length} BYTES")
+
+            end = offset + HEADER.size + length
+            if end > buffer_size:
+                break
+
+            messages.append(bytes(self.buffer[offset + HEADER.size:end]))
+            offset = end
+
+        del self.buffer[:offset]
+        return messages
+
+
+class Message_Stream:
+
+    # Blocking socket wrapper, sends and receives whole messages in framed or text protocol
+    def __init__(self, sock, framed=None):
+        self.sock = sock
+        self.decoder = Frame_Decoder(framed)
+        self.messages = deque()  # Decoded messages not consumed yet
+        self.recv_lock = threading.Lock()  # Decoder is used by one reader at a time
+        self.send_lock = threading.Lock()  # Frames from different threads do not interleave
+        self.send_ack = True  # Answer a received handshake, off for peer to peer streams
+        self.tagged = False  # Peer tags its requests, messages that are not replies get the push mark
+        self.answer_pings = True  # Heartbeats are answered here and never reach the reader, off at the server side
+
+    @property
+    def framed(self):
+        return bool(self.decoder.framed)
+
+    # Send one message
+    def send(self, data, reply=False):
+        if self.tagged and not reply:
+            data = PUSH_MARK + data
+        if self.decoder.framed:
+            data = encode_frame(data)
+        return self.write(data)
+
+    # Raw bytes, frames and handshake replies alike
+    def write(self, data):
+        with self.send_lock:
+            self.sock.sendall(data)
+        return len(data)
+
+    # Receive one message, empty bytes when the peer closed the connection
+    def recv(self, bufsize=4096):
+        with self.recv_lock:
+            while not self.messages:
+                if not self.read_socket(bufsize):
+                    return b""
+            return self.messages.popleft()
+
+    # Send one message and receive the next one, no other reader can take the answer in between
+    def request(self, data, bufsize=4096):
+        with self.recv_lock:
+            self.send(data)
+            while not self.messages:
+                if not self.read_socket(bufsize):
+                    return b""
+            return self.messages.popleft()
+
+    def read_socket(self, bufsize):
+        data = self.sock.recv(bufsize)
+        if not data:
+            return False
+
+        for message in self.decoder.feed(data):
+            if self.answer_pings and message in PINGS:
+                self.send(PONG)
+            else:
+                self.messages.append(message)
+
+        if self.decoder.acknowledge:
+            self.decoder.acknowledge = False
+            if self.send_ack:
+                self.write(HANDSHAKE_ACK)
+        return True
+
+    # Client side, ask for framed protocol and fall back to text if server does not answer
+    def request_handshake(self, timeout=2.0):
+        with self.send_lock:
+            self.sock.sendall(HANDSHAKE)
+
+        reply = bytearray()
+        previous_timeout = self.sock.gettimeout()
+        self.sock.settimeout(timeout)
+        try:
+            while HANDSHAKE_ACK.startswith(reply) and len(reply) < len(HANDSHAKE_ACK):
+                data = self.sock.recv(len(HANDSHAKE_ACK) - len(reply))
+                if not data:
+                    break
+                reply += data
+        except socket.timeout:
+            pass
+        finally:
+            self.sock.settimeout(previous_timeout)
+
+        if reply == HANDSHAKE_ACK:
+            self.decoder.framed = True
+        else:
+            self.decoder.framed = False
+            if reply:
+                self.messages.extend(self.decoder.feed(bytes(reply)))
+        return self.framed
+
+    # Peer side that already knows the other end is framed, no answer expected
+    def announce_handshake(self):
+        with self.send_lock:
+            self.sock.sendall(HANDSHAKE)
+        self.decoder.framed = True
+
+    # Accepting side, wait for the handshake and fall back to text on silence
+    def accept_handshake(self, timeout=2.0, acknowledge=True):
+        self.send_ack = acknowledge
+        ready_to_read, _, _ = select.select([self.sock], [], [], timeout)
+
+        while ready_to_read and self.decoder.framed is None:
+            if not self.read_socket(4096):
+                break
+            ready_to_read, _, _ = select.select([self.sock], [], [], timeout)
+
+        if self.decoder.framed is None:
+            self.decoder.framed = False
+            # Partial handshake bytes from a text peer become its first message
+            self.messages.extend(self.decoder.feed(b""))
+        return self.framed
+
+    # Address info passthrough, used by server login
+    def getpeername(self):
+        return self.sock.getpeername()
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def close(self):
+        self.sock.close()
+
+
+# Block until sock has data or was shut down, poll has no limit on descriptor numbers but Windows only has select
+def wait_readable(sock):
+    if hasattr(select, "poll"):
+        poller = select.poll()
+        poller.register(sock, select.POLLIN)
+        poller.poll()
+    else:
+        select.select([sock], [], [])
+
+
+class Queued_Stream(Message_Stream):
+
+    # Server side stream of threaded mode, the socket is non-blocking so senders never wait on a slow client
+    # Sends are written at once, bytes the socket did not take are buffered and finished by the shared writer
+    # A client that lets more than limit bytes pile up is disconnected
+    def __init__(self, sock, writer, limit=OUTBOUND_LIMIT, on_overflow=None):
+        super().__init__(sock)
+        self.answer_pings = False
+        self.addr = sock.getpeername()
+        self.last_seen = time.monotonic()  # Any message from the client, read by the heartbeat sweep
+        self.writer = writer  # Outbound_Writer shared by every stream of the server
+        self.limit = limit
+        self.on_overflow = on_overflow  # Called with the client address once the limit is passed
+        self.out_buffer = bytearray()  # Bytes the socket did not take yet
+        self.closed = False
+        sock.setblocking(False)
+
+    def write(self, data):
+        size = len(data)
+        with self.send_lock:
+            if self.closed:
+                return 0
+
+            # Nothing waiting, the socket buffer usually takes the whole message
+            if not self.out_buffer:
+                try:
+                    data = data[self.sock.send(data):]
+                except BlockingIOError:
+                    pass
+                except OSError:
+                    self.closed = True
+                    self.shutdown()  # Receiving thread sees the connection end
+                    return 0
+                if not data:
+                    return size
+                watch = True
+            else:
+                watch = False
+
+            overflowed = len(self.out_buffer) + len(data) > self.limit
+            if overflowed:
+                self.closed = True
+                self.out_buffer.clear()
+            else:
+                self.out_buffer += data
+
+        if overflowed:
+            # Receiving thread sees the connection end and runs disconnection control
+            self.shutdown()
+            if self.on_overflow:
+                self.on_overflow(self.addr)
+            return 0
+
+        if watch:
+            self.writer.watch(self)
+        return size
+
+    # Called by the shared writer once the socket is writable, True while bytes are left
+    def write_buffered(self):
+        with self.send_lock:
+            if self.closed:
+                return False
+            try:
+                del self.out_buffer[:self.sock.send(self.out_buffer)]
+            except BlockingIOError:
+                pass
+            except OSError:
+                self.closed = True
+                self.out_buffer.clear()
+                self.shutdown()
+            return bool(self.out_buffer)
+
+    # Receiving thread of the connection waits here, the socket itself never blocks
+    def read_socket(self, bufsize):
+        while True:
+            wait_readable(self.sock)
+            try:
+                return super().read_socket(bufsize)
+            except BlockingIOError:
+                continue
+
+    def shutdown(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    # Connection is over, buffered bytes are dropped and the shared writer stops watching the socket
+    def close(self):
+        with self.send_lock:
+            self.closed = True
+            self.out_buffer.clear()
+        self.writer.forget(self)
+        self.shutdown()
+
+
+class Outbound_Writer:
+
+    # One thread finishes the sends of every Queued_Stream whose socket was full
+    # Only streams with buffered bytes are watched, a server with fast clients leaves it asleep
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.changes = []  # (stream, watch) in the order sender threads asked for them
+        self.lock = threading.Lock()
+        self.thread = None
+
+        # Socket pair used by sender threads to wake the writer up
+        self.wake_reader, self.wake_writer = socket.socketpair()
+        self.wake_reader.setblocking(False)
+        self.wake_writer.setblocking(False)
+        self.selector.register(self.wake_reader, selectors.EVENT_READ)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def watch(self, stream):
+        self.change(stream, True)
+
+    # Must reach the writer before the socket is closed, its descriptor number may be reused
+    def forget(self, stream):
+        self.change(stream, False)
+
+    def change(self, stream, watch):
+        with self.lock:
+            self.changes.append((stream, watch))
+        try:
+            self.wake_writer.send(b"\0")
+        except BlockingIOError:
+            pass  # Writer already has a wake up pending
+
+    def run(self):
+        while True:
+            for key, _ in self.selector.select():
+                if key.fileobj is self.wake_reader:
+                    self.drain_wake()
+                elif not key.data.write_buffered():
+                    self.selector.unregister(key.fileobj)
+
+            with self.lock:
+                changes, self.changes = self.changes, []
+
+            for stream, watch in changes:
+                try:
+                    if watch:
+                        self.selector.register(stream.sock, selectors.EVENT_WRITE, stream)
+                    else:
+                        self.selector.unregister(stream.sock)
+                except (KeyError, ValueError):
+                    pass  # Already watched, or already done and unregistered
+
+    def drain_wake(self):
+        try:
+            while self.wake_reader.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
@@ -1,67 +1,190 @@
 # Authentication and Information Server - SAI
 
+import argparse
 import socket
 import threading
-import json
-import uuid
+import time
 import os
-from datetime import datetime
+from time import perf_counter_ns
+from event_logger import Event_Logger
+from sai_event_loop import SAI_Event_Loop
+from sai_follows import Follow_Graph
+from sai_games import Game_Registry
+from sai_database import User_Database
+from sai_journal import User_Journal
+from sai_metrics import SUB_BUCKET_BITS, Server_Metrics
+from sai_presence import Presence_Table, VIEWS
+from sai_protocol import Outbound_Writer, Queued_Stream, Frame_Error, Tagged_Reply, client_connection, parse_options, split_tag, encode_cursor, decode_cursor
+from sai_users import User_Table
+from timer_wheel import Timer_Wheel
+from sai_heartbeat import Heartbeat_Monitor, HEARTBEAT_INTERVAL
+from sai_commit import Storage_Error
+
+# Threaded mode runs one thread per client, event loop mode runs every client on one thread
+SERVER_MODES = ("threaded", "eventloop")
+
+# File store keeps a binary snapshot plus journal, SQLite store keeps users and match history in database.db
+STORAGE_BACKENDS = ("file", "sqlite")
+
+# Lobby list pagination, any of these options asks for a sorted page instead of the whole list
+PAGE_OPTIONS = {'LIMIT', 'CURSOR', 'PREFIX', 'STATUS', 'FOLLOWING'}
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+INVITE_TIMEOUT = 15  # Seconds a guest has to answer a game invite
+PRESENCE_BATCH_INTERVAL = 0.1  # Presence changes within this interval reach subscribers as one message
+MAX_FOLLOWS = 1000  # Users one user can follow, bounds presence fan-out per change
+SAVE_FAILED = "🚨 DATABASE WRITE FAILED, CHANGE MAY BE LOST AT RESTART\n"
+
+# Commands with their own latency histogram, anything else is counted as OTHER
+COMMANDS = ("REGISTER", "LOGIN", "LIST_USERS_ONLINE", "LIST_USERS_PLAYING", "SUBSCRIBE_PRESENCE",
+            "UNSUBSCRIBE_PRESENCE", "FOLLOW", "UNFOLLOW", "LIST_FOLLOWING", "GAME_INI", "GAME_ACK", "GAME_NEG",
+            "GAME_START", "SEND_GUEST_CONN_PORT", "GAME_OVER", "AVAILABLE", "GAME_STATS", "STATS", "PONG")
+METRICS_DUMP_INTERVAL = 10  # Seconds between Prometheus text dumps
 
 
 class SAI_Server:
 
     # Constructor method, called when an object of the class is created
-    def __init__(self, host, port):
+    def __init__(self, host, port, mode="threaded", storage="file", heartbeat_interval=HEARTBEAT_INTERVAL):
+        if mode not in SERVER_MODES:
+            raise ValueError(f"UNKNOWN SERVER MODE: {mode}")
+        if storage not in STORAGE_BACKENDS:
+            raise ValueError(f"UNKNOWN STORAGE BACKEND: {storage}")
+
         self.host = host
         self.port = port
-        self.users = {}
-        self.games = {}
-        self.online_users = {}
-        self.playing_users = {}
+        self.mode = mode
+        self.reuse_port = False  # Set for cluster workers listening on the same port
+        self.users = User_Table()  # Durable credentials, only registrations reach the disk
+        self.follows = Follow_Graph()  # Follow lists, saved with the user record of the follower
+        self.games = Game_Registry()  # Invites and matches, finished records are evicted after a while
+
+        # Invites waiting for the guest answer, resolved by the guest's own GAME_ACK or GAME_NEG
+        self.invites_by_guest = {}  # Guest username to game id
+        self.invites_by_host = {}  # Host username to game id
+        self.timers = Timer_Wheel()  # Invite deadlines, a single thread for every pending invite
+        self.invite_lock = threading.Lock()
+        self.presence = Presence_Table()  # Ephemeral status, notification and address by session
+        self.heartbeat = Heartbeat_Monitor(self.timers, self.session_reaped, heartbeat_interval)
+        self.outbound = Outbound_Writer()  # Threaded mode, finishes sends to clients whose socket was full
+
+        # Presence push, changes of a short interval are coalesced and sent as one batch
+        self.subscribers = {}  # Session id to connection subscribed to presence deltas of everyone
+        self.follow_subscribers = {}  # Username to connection subscribed to deltas of followed users only
+        self.presence_changes = {}  # Username to change kinds since the last batch
+        self.presence_flush = None  # Timer of the pending batch
+        self.presence_lock = threading.Lock()
+        self.presence.watchers.append(self.presence_changed)
+        self.connections = {}  # Session id to client connection
+        self.list_cache = {}  # Encoded lobby lists by status, rebuilt when presence version changes
         self.log_file = "game.log"  # Log server events
-        self.load_users_from_file()  # Load users database
+        self.metrics = Server_Metrics(COMMANDS)
+        self.metrics_file = None  # Prometheus text dump, written only when set
+        self.events = Event_Logger(self.log_file).start()  # Batched writes, rotated to compressed archives
 
-    # Load users data from database file
+        # Both stores write only changed users, waiting requests share one commit
+        if storage == "sqlite":
+            self.storage = User_Database("database.db")
+        else:
+            self.storage = User_Journal("database.snap", "database.journal", "database.txt")
+        self.load_users_from_file()  # Load users database
+        self.storage.start(self.copy_users)
+        self.games.watchers.append(self.storage.record_game)  # Match history
+        self.games.watchers.append(self.count_finished_game)
+
+        self.metrics.gauge('online_users', lambda: self.presence.count('ONLINE') + self.presence.count('PLAYING'))
+        self.metrics.gauge('playing_users', lambda: self.presence.count('PLAYING'))
+        self.metrics.gauge('connections_open', lambda: self.metrics.counters.get(
+            'connections_opened', 0) - self.metrics.counters.get('connections_closed', 0))
+        self.metrics.gauge('threads', threading.active_count)
+        self.metrics.gauge('games_live', lambda: self.games.stats()['live'])
+
+    # Load users data from the storage backend
     def load_users_from_file(self):
         try:
-            with open("database.txt", "r") as file:
-                for line in file:
-                    if line.strip():  # Check if the line is not empty
-                        user_data = json.loads(line)
-                        username, data = user_data.popitem()
-                        self.users[username] = data  # Filling user dictionary
+            self.storage.load(self.users, self.follows)
 
         except FileNotFoundError:
             print("\n ⚠️  DATABASE FILE NOT FOUND\n")
 
-        # Empty database JSON format check
+        # Empty database check
         else:
             if not self.users:
                 print("\n ⚠️  DATABASE FILE IS EMPTY\n")
 
-    # Save registered users to database file
+    # Rewrite whole database file, used for compaction only
     def save_users_to_file(self):
-        with open("database.txt", "w") as file:
-            for username, user_data in self.users.items():
-                json.dump({username: user_data}, file)
-                file.write("\n")
+        self.storage.write_snapshot(self.copy_users())
+
+    # Store one changed user and send response once it is on disk, or an error when the write failed
+    # Requests from other clients saving at the same time share one fsync
+    def save_user(self, conn, username, response):
+        record = self.user_record(username)
+
+        # Event loop thread must not wait for the fsync, the answer is held and sent once the writer is done
+        if self.mode == "eventloop":
+            conn.hold()
+            self.storage.append(username, record, lambda error: conn.call_soon(
+                self.finish_save, conn, response, error))
+            return
+
+        try:
+            self.storage.save(username, record)
+        except Storage_Error:
+            response = SAVE_FAILED
+        conn.send(response.encode("utf-8"))
+
+    def finish_save(self, conn, response, error):
+        conn.send((SAVE_FAILED if error else response).encode("utf-8"))
+        conn.release()
+
+    # Copy of every user for snapshots, safe while other threads change users
+    def copy_users(self):
+        return {username: self.user_record(username, password) for username, password in self.users.items()}
+
+    # Stored form of one user, credentials plus follow list when there is one
+    def user_record(self, username, password=None):
+        record = {'password': password if password is not None else self.users.password(username)}
+        following = self.follows.following_names(username)
+        if following:
+            record['follows'] = following
+        return record
 
     # Get user address IP and PORT
     def get_user_address(self, username):
-        if username in self.users:
-            user_data = self.users[username]
-            ip = user_data.get('ip', 'UNKNOWN')
-            port = user_data.get('port', 'UNKNOWN')
-            return f"{ip}:{port}"
+        presence = self.presence.get(username)
+        if presence:
+            return f"{presence.ip}:{presence.port}"
         else:
             return 'UNKNOWN'
 
-    # Initiate socket
+    # Initiate server in the configured mode
     def start(self):
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:  # Socket object TCP
-            s.bind((self.host, self.port))
-            s.listen()
+        # Wheel thread expires every unanswered invite, no thread waits for a single guest
+        self.timers.start()
+        self.heartbeat.start()
+        self.dump_metrics()
 
+        if self.mode == "eventloop":
+            SAI_Event_Loop(self).run()
+        else:
+            self.start_threaded()
+
+    # Listening socket of both modes, cluster workers share the port with SO_REUSEPORT
+    def open_listener(self):
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)  # Socket object TCP
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.reuse_port:
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        s.bind((self.host, self.port))
+        s.listen(socket.SOMAXCONN)
+        return s
+
+    # Initiate socket
+    def start_threaded(self):
+        self.outbound.start()
+        with self.open_listener() as s:
             print(f"☎️  SAI SERVER LISTENING ON {self.host}:{self.port}\n")
 
             # Loop for incoming clients connections
@@ -72,72 +195,131 @@ class SAI_Server:
                 threading.Thread(target=self.handle_client,
                                  args=(conn, addr)).start()
 
-    def handle_client(self, conn, addr):
-        with conn:
+    def handle_client(self, sock, addr):
+        with sock:
+            # Framed or text protocol is chosen by the client's first bytes
+            # Sends from any thread go out at once, the shared outbound writer finishes what a full socket did not take
+            conn = Queued_Stream(sock, self.outbound, on_overflow=self.outbound_overflow)
+            self.connection_opened()
+            self.heartbeat.watch(conn)
             logged_in_username = None  # Save username for disconnection control
 
             # connection_event = f"⚡ CONNECTED BY {addr}"
             # self.stdout_event(connection_event)
 
-            while True:
-                try:
-                    data = conn.recv(1024)  # Client data
+            # However the loop ends, a failing command included, connection and session are released
+            try:
+                while True:
+                    try:
+                        data = conn.recv()  # Client message, one command
+                    # Disconnected handler for connection errors or a broken frame
+                    except (OSError, Frame_Error):
+                        break
 
                     if not data:
-                        # Disconnection using logout command only if user was logged in
-                        if logged_in_username:
-                            disconnect_event = f"🍃 USER DISCONNECTED: {logged_in_username}"
-
-                            # Stdout SAI server event
-                            self.stdout_event(disconnect_event)
-                            # Disconnect event to log file
-                            self.log_event(disconnect_event)
-
-                            # Update status for offline when logged out
-                            self.users[logged_in_username]['status'] = 'OFFLINE'
-                            self.save_users_to_file()
-
-                            del self.online_users[logged_in_username]
                         break
+                    conn.last_seen = time.monotonic()
 
-                    # Handle commands
+                    # Handle commands, bytes that are not UTF-8 end the connection
                     message = data.decode("utf-8")
+                    if not message.split():
+                        continue
                     logged_in_username = self.handle_message(
                         conn, message, logged_in_username)
 
-                # Disconnected handler for connection reset error
-                except ConnectionResetError:
-                    if logged_in_username:
-                        disconnect_event = f"🍃 USER DISCONNECTED: {logged_in_username}"
+            # Same as event loop mode, a failing command only drops its own client
+            except Exception as e:
+                self.stdout_event(f"🚨 COMMAND FAILED FROM {addr}: {e!r}")
+
+            finally:
+                self.heartbeat.forget(conn)
+                conn.close()
+                self.connection_closed()
+
+                # Disconnection control only if user was logged in
+                if logged_in_username:
+                    self.disconnect_user(logged_in_username)
+
+    # Connection counters of both modes
+    def connection_opened(self):
+        self.metrics.increment('connections_opened')
+
+    def connection_closed(self):
+        self.metrics.increment('connections_closed')
+
+    # Client stopped reading, its queued replies and pushes passed the outbound limit
+    def outbound_overflow(self, addr):
+        self.metrics.increment('slow_clients_disconnected')
+        self.stdout_event(f"🐢 SLOW CLIENT DISCONNECTED: {addr}")
 
-                        # Stdout SAI server event
-                        self.stdout_event(disconnect_event)
-                        # Disconnect event to log file
-                        self.log_event(disconnect_event)
+    # Client stopped answering heartbeats, its session is freed by disconnection control
+    def session_reaped(self, addr):
+        self.metrics.increment('sessions_reaped')
+        self.stdout_event(f"💀 SILENT CLIENT REAPED: {addr}")
 
-                        # Update status for offline when connection error
-                        self.users[logged_in_username]['status'] = 'OFFLINE'
-                        self.save_users_to_file()
+    # Disconnection control, shared by threaded and event loop modes
+    def disconnect_user(self, username):
+        disconnect_event = f"🍃 USER DISCONNECTED: {username}"
 
-                        del self.online_users[logged_in_username]
-                    break
+        # Disconnect event to log file and stdout
+        self.log_event(disconnect_event)
 
-     # Add connection to online user
-    def add_user_connection(self, username, conn):
-        self.online_users[username] = conn
+        # Session ends, user is offline when logged out or connection error
+        self.remove_user_connection(username)
 
-    # Remove connection to offline user
+        # Invites of a user that left can not be answered anymore
+        self.cancel_invites(username)
+
+    # Add connection to online user's session, pushes go to the client and not to the reply of the login
+    def add_user_connection(self, session_id, conn):
+        self.connections[session_id] = client_connection(conn)
+
+    # Remove offline user's session and connection
     def remove_user_connection(self, username):
-        if username in self.online_users:
-            del self.online_users[username]
+        session_id = self.presence.session_of(username)
+        if session_id:
+            self.unsubscribe_presence(username)
+            self.presence.logout(session_id)
+            self.connections.pop(session_id, None)
 
     # Get connection from user
     def get_user_connection(self, username):
-        return self.online_users.get(username, None)
+        return self.connections.get(self.presence.session_of(username), None)
 
-    # Communication protocol, commands trigger server-side actions
+    # Communication protocol, a tagged command gets its replies as one message carrying the tag
     def handle_message(self, conn, message, logged_in_username):
+        tag, message = split_tag(message)
+        if tag is None:
+            return self.handle_command(conn, message, logged_in_username)
+
+        conn.tagged = True  # Messages outside replies are pushes from now on
+        reply = Tagged_Reply(conn, tag)
+        try:
+            if message.split():
+                logged_in_username = self.handle_command(reply, message, logged_in_username)
+        finally:
+            if not reply.held:
+                reply.flush()
+        return logged_in_username
+
+    # Every command is timed for STATS, histogram is found before the clock starts
+    # Recording is Latency_Histogram.record written inline, a call costs as much as the bucket math
+    def handle_command(self, conn, message, logged_in_username):
         parts = message.split()
+        histogram = self.metrics.histogram(parts[0])
+        started = perf_counter_ns()
+        logged_in_username = self.run_command(conn, parts, logged_in_username)
+        elapsed = perf_counter_ns() - started
+
+        shift = elapsed.bit_length() - SUB_BUCKET_BITS - 1
+        histogram.counts[(shift << SUB_BUCKET_BITS) + (elapsed >> shift) if shift > 0 else elapsed] += 1
+        histogram.sum += elapsed
+        if elapsed > histogram.max:
+            histogram.max = elapsed
+        return logged_in_username
+
+    # Commands trigger server-side actions
+    def run_command(self, conn, parts, logged_in_username):
         command = parts[0]
 
         # Register user command
@@ -158,13 +340,30 @@ class SAI_Server:
             else:
                 conn.send("🚨 BOTH FIELDS MUST BE FILLED IN\n".encode("utf-8"))
 
-        # List online users command
+        # List online users command, VERSION option asks for NOT_MODIFIED when list did not change
         elif command == "LIST_USERS_ONLINE":
-            self.send_online_users(conn, parts[1])
+            self.send_online_users(conn, parts[1], parse_options(parts[2:]))
 
         # List playing users command
         elif command == "LIST_USERS_PLAYING":
-            self.send_playing_users(conn)
+            self.send_playing_users(conn, parse_options(parts[1:]))
+
+        # Presence push commands, deltas replace lobby list polling
+        elif command == "SUBSCRIBE_PRESENCE":
+            self.subscribe_presence(conn, logged_in_username, parse_options(parts[1:]))
+
+        elif command == "UNSUBSCRIBE_PRESENCE":
+            self.unsubscribe_presence(logged_in_username)
+
+        # Follow list commands, scope presence pushes and lobby lists to followed users
+        elif command == "FOLLOW" or command == "UNFOLLOW":
+            if len(parts) >= 2:
+                self.change_follow(conn, logged_in_username, parts[1], command == "FOLLOW")
+            else:
+                conn.send("🚨 INVALID USER\n".encode("utf-8"))
+
+        elif command == "LIST_FOLLOWING":
+            self.send_following(conn, logged_in_username)
 
         # Game initiation command
         elif command == "GAME_INI":
@@ -173,13 +372,18 @@ class SAI_Server:
             else:
                 conn.send("🚨 INVALID USER\n".encode("utf-8"))
 
+        # Guest answer to a pending invite
+        elif command == "GAME_ACK" or command == "GAME_NEG":
+            self.answer_invite(conn, logged_in_username, command)
+
         # Game start command
         elif command == "GAME_START":
             self.start_game(conn, parts[1], parts[2])
 
-        # Send to guest connection port command
+        # Send to guest connection port command, FRAMED flag means host speaks framed P2P
         elif command == "SEND_GUEST_CONN_PORT":
-            self.send_guest_conn_port(parts[1], parts[2])
+            self.send_guest_conn_port(
+                parts[1], parts[2], "FRAMED" in parts[3:])
 
         # Game over command
         elif command == "GAME_OVER":
@@ -189,28 +393,36 @@ class SAI_Server:
         elif command == "AVAILABLE":
             self.set_invite_status_available(parts[1])
 
+        # Game registry counters
+        elif command == "GAME_STATS":
+            self.send_game_stats(conn)
+
+        # Admin report, command latency, counters and gauges
+        elif command == "STATS":
+            self.send_stats(conn)
+
+        # Heartbeat answer, receiving it already marked the connection as alive
+        elif command == "PONG":
+            pass
+
         return logged_in_username  # Important return for disconnection control
 
     # User registration server response
     def register_user(self, conn, username, password):
 
-        # Existing username check
-        if username in self.users:
+        # Add to user table, existing username check
+        if not self.users.add(username, password):
             response = "🚨 USERNAME ALREADY IN USE PLEASE CHOOSE ANOTHER\n"
 
         else:
-            # Add to username dictionary
-            self.users[username] = {'password': password, 'status': 'OFFLINE'}
-
             # Event log register
             user_event = f"⭐ REGISTERED NEW USER: {username}"
 
-            self.stdout_event(user_event)  # Stdout SAI server event
             self.log_event(user_event)  # Save registration event to log file
 
-            self.save_users_to_file()   # Save user data to database file
-
-            response = "✅ REGISTRATION SUCCESSFUL\n"
+            # Save user data to database file, client response once it is durable
+            self.save_user(conn, username, "✅ REGISTRATION SUCCESSFUL\n")
+            return
 
         # Client response
         conn.send(response.encode("utf-8"))
@@ -219,42 +431,32 @@ class SAI_Server:
     def login_user(self, conn, username, password):
         # Check username exists in database
         if username in self.users:
-            # Check username already logged in
-            if self.users[username]['status'] == 'OFFLINE':
-                # Check password match stored password
-                if self.users[username]['password'] == password:
-                    # Get client's address info
-                    ip, port = conn.getpeername()
+            # Check password match stored password
+            if self.users.password(username) == password:
+                # Get client's address info
+                ip, port = conn.getpeername()
 
-                    # Update ip and port when logged in, user's last login address
-                    self.users[username]['ip'] = ip
-                    self.users[username]['port'] = port
-
-                    # Update status for online when logged in
-                    self.users[username]['status'] = 'ONLINE'
-
-                    # Update status for logged in users to available to receive notifications
-                    self.users[username]['notification'] = 'AVAILABLE'
+                # New session is ONLINE and AVAILABLE to receive notifications
+                # None means username already logged in
+                session_id = self.presence.login(username, ip, port)
 
+                if session_id:
                     # Event log login
                     user_event = f"📌 USER LOGGED IN: {username}"
 
-                    self.stdout_event(user_event)  # Stdout SAI server event
                     self.log_event(user_event)  # Save login event to log file
 
-                    self.save_users_to_file()   # Save user data to database file
-
                     # Add user's connection
-                    self.add_user_connection(username, conn)
+                    self.add_user_connection(session_id, conn)
 
                     response = "✅ LOGIN SUCCESSFUL\n"
                     conn.send(response.encode("utf-8"))
 
                     return username
                 else:
-                    response = "🚨 INVALID PASSWORD\n"
+                    response = "🚨 USER ALREADY LOGGED IN\n"
             else:
-                response = "🚨 USER ALREADY LOGGED IN\n"
+                response = "🚨 INVALID PASSWORD\n"
         else:
             response = "🚨 USERNAME NOT FOUND\n"
 
@@ -262,47 +464,272 @@ class SAI_Server:
         conn.send(response.encode("utf-8"))
 
     # Users online server response
-    def send_online_users(self, conn, logged_in_username):
-
-        # All users online except current user
-        online_users = [(username, data.get('status'), data.get('ip'), data.get('port'))
-                        for username, data in self.users.items()
-                        if data.get('status') == 'ONLINE' and username != logged_in_username]
-
-        if online_users:
-            response = "🤖 ONLINE USERS:\n\n"
-            for user_info in online_users:
-                username, status, ip, port = user_info
-                response += f"🟢 👤 {username} | STATUS: {status} | IP: {ip} | PORT: {port}\n"
-        else:
-            response = "👻 NO USERS ARE CURRENTLY ONLINE\n"
+    def send_online_users(self, conn, logged_in_username, options=None):
+        # Paged or filtered listing, STATUS can be ONLINE, PLAYING or AVAILABLE
+        if options and PAGE_OPTIONS.intersection(options):
+            self.send_lobby_page(conn, options.get('STATUS', 'ONLINE').upper(),
+                                 logged_in_username, options)
+            return
+
+        version, response, spans = self.get_online_list()
+
+        # All users online except current user, cut own line out of the cached list
+        if logged_in_username in spans:
+            if len(spans) == 1:
+                response = b""
+            else:
+                start, end = spans[logged_in_username]
+                response = response[:start] + response[end:]
 
-        conn.send(response.encode("utf-8"))
+        if not response:
+            response = "👻 NO USERS ARE CURRENTLY ONLINE\n".encode("utf-8")
+
+        self.send_lobby_list(conn, version, response, options)
 
     # Users playing server response
-    def send_playing_users(self, conn):
+    def send_playing_users(self, conn, options=None):
+        if options and PAGE_OPTIONS.intersection(options):
+            self.send_lobby_page(conn, 'PLAYING', None, options)
+            return
+
+        version, response = self.get_playing_list()
 
-        playing_users = [(username, data.get('status'), data.get('ip'), data.get('port'))
-                         for username, data in self.users.items()
-                         if data.get('status') == 'PLAYING']
+        if not response:
+            response = "👻 NO USERS ARE CURRENTLY PLAYING\n".encode("utf-8")
 
-        if playing_users:
-            response = "🤖 PLAYING USERS:\n\n"
+        self.send_lobby_list(conn, version, response, options)
 
-            # Iterate over pairs of playing users
-            for i in range(0, len(playing_users), 2):
-                user1 = playing_users[i]
-                user2 = playing_users[i + 1] if i + \
-                    1 < len(playing_users) else None
+    # One page of a lobby view sorted by username, NEXT line carries the cursor of the following page
+    def send_lobby_page(self, conn, view, logged_in_username, options):
+        if view not in VIEWS:
+            conn.send(f"🚨 UNKNOWN STATUS FILTER: {view}\n".encode("utf-8"))
+            return
 
-                response += f"🔴 👤 {user1[0]} | {user1[2]}:{user1[3]}"
-                if user2:
-                    response += f" X 👤 {user2[0]} | {user2[2]}:{user2[3]}"
-                response += "\n"
+        try:
+            limit = min(max(int(options.get('LIMIT', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+            after = decode_cursor(options['CURSOR']) if options.get('CURSOR') else None
+        except ValueError:
+            conn.send("🚨 INVALID PAGE LIMIT OR CURSOR\n".encode("utf-8"))
+            return
+
+        # FOLLOWING option pages through followed users only
+        among = self.follows.following_names(
+            logged_in_username) if options.get('FOLLOWING') else None
+
+        version, page, last_username = self.presence.page(
+            view, after, options.get('PREFIX', ''), limit, exclude=logged_in_username, among=among)
+
+        icon = "🔴" if view == 'PLAYING' else "🟢"
+        lines = [f"NEXT {encode_cursor(last_username) if last_username else 'END'}\n"]
+
+        if page:
+            lines.append(f"🤖 {view} USERS:\n\n")
+            for presence in page:
+                lines.append(
+                    f"{icon} 👤 {presence.username} | STATUS: {presence.status} | IP: {presence.ip} | PORT: {presence.port}\n")
         else:
-            response = "👻 NO USERS ARE CURRENTLY PLAYING\n"
+            lines.append(f"👻 NO {view} USERS FOUND\n")
+
+        self.send_lobby_list(conn, version, "".join(lines).encode("utf-8"), options)
+
+    # Client already has this version, tiny reply instead of the list
+    def send_lobby_list(self, conn, version, response, options):
+        if options and 'VERSION' in options:
+            if options['VERSION'] == str(version):
+                response = f"NOT_MODIFIED {version}\n".encode("utf-8")
+            else:
+                response = f"VERSION {version}\n".encode("utf-8") + response
+
+        conn.send(response)
+
+    # Encoded online list and byte span of each user's line, cached per presence version
+    def get_online_list(self):
+        cached = self.list_cache.get('ONLINE')
+        if cached and cached[0] == self.presence.versions['ONLINE']:
+            return cached
+
+        version, online = self.presence.snapshot('ONLINE')
+        header = "🤖 ONLINE USERS:\n\n".encode("utf-8")
+        lines = []
+        spans = {}
+        offset = len(header)
+
+        for presence in online:
+            line = f"🟢 👤 {presence.username} | STATUS: {presence.status} | IP: {presence.ip} | PORT: {presence.port}\n".encode(
+                "utf-8")
+            spans[presence.username] = (offset, offset + len(line))
+            offset += len(line)
+            lines.append(line)
+
+        response = header + b"".join(lines) if lines else b""
+
+        self.list_cache['ONLINE'] = (version, response, spans)
+        return version, response, spans
+
+    # Encoded playing list, cached per presence version
+    def get_playing_list(self):
+        cached = self.list_cache.get('PLAYING')
+        if cached and cached[0] == self.presence.versions['PLAYING']:
+            return cached
+
+        version, playing_users = self.presence.snapshot('PLAYING')
+        lines = []
+
+        # Iterate over pairs of playing users
+        for i in range(0, len(playing_users), 2):
+            user1 = playing_users[i]
+            user2 = playing_users[i + 1] if i + \
+                1 < len(playing_users) else None
+
+            line = f"🔴 👤 {user1.username} | {user1.ip}:{user1.port}"
+            if user2:
+                line += f" X 👤 {user2.username} | {user2.ip}:{user2.port}"
+            lines.append(line + "\n")
+
+        response = ("🤖 PLAYING USERS:\n\n" + "".join(lines)
+                    ).encode("utf-8") if lines else b""
+
+        self.list_cache['PLAYING'] = (version, response)
+        return version, response
+
+    # Snapshot of every logged in user, deltas follow as PRESENCE batches
+    # SCOPE=FOLLOWING limits snapshot and deltas to followed users, SCOPE=ALL is the default
+    def subscribe_presence(self, conn, logged_in_username, options=None):
+        session_id = self.presence.session_of(logged_in_username)
+        if not session_id:
+            conn.send("🚨 LOGIN REQUIRED\n".encode("utf-8"))
+            return
+
+        scope = (options or {}).get('SCOPE', 'ALL').upper()
+        if scope not in ('ALL', 'FOLLOWING'):
+            conn.send(f"🚨 UNKNOWN PRESENCE SCOPE: {scope}\n".encode("utf-8"))
+            return
+
+        lines = ["PRESENCE_SNAPSHOT\n"]
+        # Presence changes wait while subscribing, no delta can fall between snapshot and subscription
+        # Table lock first, watchers take the batch lock while holding it
+        with self.presence.lock, self.presence_lock:
+            self.unsubscribe_presence(logged_in_username)
+
+            if scope == 'FOLLOWING':
+                for username in self.follows.following_names(logged_in_username):
+                    presence = self.presence.get(username)
+                    if presence:
+                        lines.append(self.presence_line('JOINED', presence))
+                self.follow_subscribers[logged_in_username] = self.get_user_connection(logged_in_username)
+            else:
+                for view in ('ONLINE', 'PLAYING'):
+                    for presence in self.presence.with_status(view):
+                        lines.append(self.presence_line('JOINED', presence))
+                self.subscribers[session_id] = self.get_user_connection(logged_in_username)
+
+        conn.send("".join(lines).encode("utf-8"))
+
+    def unsubscribe_presence(self, username):
+        self.subscribers.pop(self.presence.session_of(username), None)
+        self.follow_subscribers.pop(username, None)
+
+    # Presence table watcher, only records the change, batch is built by the timer
+    def presence_changed(self, username, change):
+        if not self.subscribers and not self.follow_subscribers:
+            return
+
+        with self.presence_lock:
+            self.presence_changes.setdefault(username, set()).add(change)
+            if self.presence_flush is None:
+                self.presence_flush = self.timers.schedule(
+                    PRESENCE_BATCH_INTERVAL, self.flush_presence_changes)
+
+    # Latest state of every changed user, one message encoded once for every ALL subscriber
+    # FOLLOWING subscribers get only lines of users they follow, found through the followers index
+    def flush_presence_changes(self):
+        with self.presence_lock:
+            changes, self.presence_changes = self.presence_changes, {}
+            self.presence_flush = None
+            subscribers = list(self.subscribers.values())
+            follow_subscribers = dict(self.follow_subscribers)
+
+        user_lines = {}
+        for username, kinds in changes.items():
+            presence = self.presence.get(username)
+            if presence is None:
+                user_lines[username] = f"LEFT {username}\n"
+            elif 'JOINED' in kinds:
+                user_lines[username] = self.presence_line('JOINED', presence)
+            else:
+                lines = []
+                if 'STATUS' in kinds:
+                    lines.append(f"STATUS {username} {presence.status}\n")
+                if 'NOTIFICATION' in kinds:
+                    lines.append(f"NOTIFICATION {username} {presence.notification}\n")
+                user_lines[username] = "".join(lines)
+
+        deliveries = []
+        if subscribers:
+            message = ("PRESENCE\n" + "".join(user_lines.values())).encode("utf-8")
+            deliveries.extend((conn, message) for conn in subscribers)
+
+        # Cost follows the followers of changed users, not the number of subscribers
+        if follow_subscribers:
+            scoped = {}
+            for username, line in user_lines.items():
+                for follower in self.follows.follower_names(username):
+                    if follower in follow_subscribers:
+                        scoped.setdefault(follower, ["PRESENCE\n"]).append(line)
+            deliveries.extend((follow_subscribers[follower], "".join(lines).encode("utf-8"))
+                              for follower, lines in scoped.items())
+
+        for conn, message in deliveries:
+            try:
+                conn.send(message)
+            except OSError:
+                pass  # Subscriber left, its handler runs disconnection control
+
+    # Follow or unfollow another registered user, saved with the follower's record
+    def change_follow(self, conn, username, target, follow):
+        if not username:
+            conn.send("🚨 LOGIN REQUIRED\n".encode("utf-8"))
+            return
+
+        if target not in self.users or target == username:
+            response = "💣 PLAYER NOT FOUND\n"
+
+        elif follow and self.follows.count_following(username) >= MAX_FOLLOWS:
+            response = f"🚨 FOLLOW LIMIT OF {MAX_FOLLOWS} USERS REACHED\n"
+
+        elif follow:
+            if self.follows.follow(username, target):
+                self.save_user(conn, username, f"🤝 FOLLOWING {target}\n")
+                return
+            response = f"🚨 ALREADY FOLLOWING {target}\n"
+
+        else:
+            if self.follows.unfollow(username, target):
+                self.save_user(conn, username, f"👋 UNFOLLOWED {target}\n")
+                return
+            response = f"🚨 NOT FOLLOWING {target}\n"
+
         conn.send(response.encode("utf-8"))
 
+    # Followed users with their current status
+    def send_following(self, conn, username):
+        following = self.follows.following_names(username) if username else []
+
+        if not following:
+            conn.send("👻 YOU DO NOT FOLLOW ANYONE\n".encode("utf-8"))
+            return
+
+        icons = {'ONLINE': "🟢", 'PLAYING': "🔴", 'OFFLINE': "⚫"}
+        lines = ["🤝 FOLLOWING:\n\n"]
+        for target in following:
+            status = self.presence.status(target)
+            lines.append(f"{icons[status]} 👤 {target} | STATUS: {status}\n")
+
+        conn.send("".join(lines).encode("utf-8"))
+
+    def presence_line(self, kind, presence):
+        return f"{kind} {presence.username} {presence.status} {presence.notification} {presence.ip} {presence.port}\n"
+
     # Game initiation server response
     def initiate_game(self, conn, host, guest):
 
@@ -313,152 +740,155 @@ class SAI_Server:
             # Check users existence
             if host in self.users and guest in self.users:
 
-                # Check if host user is online, guest is online or playing, guest is available to receive notifications
-                if (self.users[host]['status'] == 'ONLINE') and (self.users[guest]['status'] == 'ONLINE' or self.users[guest]['status'] == 'PLAYING') and (self.users[guest]['notification'] == 'AVAILABLE'):
+                # Check if host user is online with no invite pending, guest is online or playing, guest is available to receive notifications
+                # Checked and reserved under lock so two hosts can not invite the same guest at once
+                with self.invite_lock:
+                    available = (self.presence.status(host) == 'ONLINE') and (host not in self.invites_by_host) and (self.presence.status(guest) == 'ONLINE' or self.presence.status(
+                        guest) == 'PLAYING') and (self.presence.notification(guest) == 'AVAILABLE') and (guest not in self.invites_by_guest)
 
-                    # Generate unique token for the game
-                    game_token = self.generate_unique_token()
+                    if available:
+                        # New PENDING game record with its own unique token
+                        game = self.games.create(host, guest)
+                        game.timer = self.timers.schedule(INVITE_TIMEOUT, self.expire_invite, game.game_id)
 
+                        self.invites_by_guest[guest] = game.game_id
+                        self.invites_by_host[host] = game.game_id
+                        self.metrics.increment('invites_sent')
+
+                        # Set availability to receive notifications to busy
+                        self.presence.set_notification(host, 'BUSY')
+                        self.presence.set_notification(guest, 'BUSY')
+
+                if available:
                     # Initiate game notification
                     response_host = f"🔔 INVITED {guest} TO A GAME\n"
 
                     response_guest_online = f"🔔 {host} INVITED YOU TO JOIN A GAME\n"
                     response_guest_playing = f"🔔 {host} INVITED YOU TO JOIN ANOTHER GAME\n"
 
-                    # Get participants connections
-                    conn_host = self.get_user_connection(host)
+                    # Get guest connection, host reply goes back with the request
                     conn_guest = self.get_user_connection(guest)
-
-                    # Starting game infos
-                    game_info = {
-                        'token': game_token,
-                        'players': [host, guest],
-                        'status': 'PENDING',  # Can be PENDING or ACCEPTED or DECLINED
-                    }
-
-                    # Store game infos to server
-                    self.games[game_token] = game_info
-
-                    # If connections exists, send notification
-                    if conn_host:
-                        conn_host.send(response_host.encode("utf-8"))
-
-                        # Set availability to receive notifications to busy
-                        self.users[host]['notification'] = 'BUSY'
-                        self.users[guest]['notification'] = 'BUSY'
-                        self.save_users_to_file()   # Save user data to database file
+                    conn.send(response_host.encode("utf-8"))
 
                     # Invite to join a new game for an online user
-                    if conn_guest and self.users[guest]['status'] == 'ONLINE':
+                    if conn_guest and self.presence.status(guest) == 'ONLINE':
                         conn_guest.send(response_guest_online.encode("utf-8"))
 
                     # Invite to join another game for a playing user
-                    if conn_guest and self.users[guest]['status'] == 'PLAYING':
+                    if conn_guest and self.presence.status(guest) == 'PLAYING':
                         conn_guest.send(response_guest_playing.encode("utf-8"))
 
-                    # Wait for guest response
-                    response = None
-
-                    def wait_for_response():  # Wait for a response
-                        nonlocal response
-                        response = conn_guest.recv(1024).decode("utf-8")
-
-                    # Create a thread to run wait for response function
-                    response_thread = threading.Thread(
-                        target=wait_for_response)
-
-                    response_thread.start()  # Start thread
-
-                    # Wait for thread to finish or timeout
-                    response_thread.join(timeout=15)  # Timeout 15 seconds
-
-                    if response is None:  # No response received within timeout
-                        # Guest did not answer
-                        game_info['status'] = 'DECLINED'
-                        response_afk = "TIMEOUT"
-                        response_ignore = "IGNORED"
-
-                        # Set availability to receive notifications back to available
-                        self.users[host]['notification'] = 'AVAILABLE'
-                        self.users[guest]['notification'] = 'AVAILABLE'
-                        self.save_users_to_file()   # Save user data to database file
-
-                        # User online and do not respond
-                        if self.users[guest]['status'] == 'ONLINE':
-                            # Event user seems to be afk, doesn't answer
-                            afk_event = f"💤 USER SEEMS TO BE AFK: {guest}"
-                            response_guest = response_afk
-
-                            # Guest is still AFK, did not answer previous notification, keep him busy
-                            self.users[guest]['notification'] = 'BUSY'
-                            self.save_users_to_file()   # Save user data to database file
-
-                            # Stdout SAI server event
-                            self.stdout_event(afk_event)
-                            # Afk event to log file
-                            self.log_event(afk_event)
-
-                        # User playing and did not respond
-                        elif self.users[guest]['status'] == 'PLAYING':
-                            # Event user ignored invite, didn't answer
-                            response_guest = response_ignore
-
-                        if conn_host:  # Send to host timeout
-                            conn_host.send(response_guest.encode("utf-8"))
-
-                        if conn_guest:  # Send to guest timeout
-                            conn_host.send(response_guest.encode("utf-8"))
-                    else:
-                        # Set availability to receive notifications back to available
-                        self.users[host]['notification'] = 'AVAILABLE'
-                        self.users[guest]['notification'] = 'AVAILABLE'
-                        self.save_users_to_file()   # Save user data to database file
-
-                        # Invitation accepted by guest
-                        if response == "GAME_ACK":
-                            game_info['status'] = 'ACCEPTED'
-
-                            # Send to host user client response command
-                            response_host_accepted = "ACCEPTED"
-
-                            if conn_host:
-                                conn_host.send(
-                                    response_host_accepted.encode("utf-8"))
-
-                        # Invitation declined by guest
-                        elif response == "GAME_NEG":
-                            game_info['status'] = 'DECLINED'
-
-                            # Send to host user client response command
-                            response_host_declined = "DECLINED"
-
-                            if conn_host:
-                                conn_host.send(
-                                    response_host_declined.encode("utf-8"))
-
-                        # Unexpected response from guest
-                        else:
-                            game_info['status'] = 'DECLINED'
-
-                            # Invitation cancelled by server
-                            response_host_unexpected = "UNEXPECTED RESPONSE"
-                            if conn_host:
-                                conn_host.send(
-                                    response_host_unexpected.encode("utf-8"))
-
-                # Guest is busy, still trying to deal with an invitation
-                elif self.users[guest]['notification'] == 'BUSY':
-                    response_host = f"📞 {guest} IS DEALING WITH ANOTHER INVITE, TRY AGAIN LATER\n"
+                    return  # Host gets the outcome when the guest answers or the invite expires
 
-                    # Get host connection
-                    conn_host = self.get_user_connection(host)
-                    if conn_host:
-                        conn_host.send(response_host.encode("utf-8"))
+                # Guest is busy, still trying to deal with an invitation, or host is still waiting on its own invite
+                elif self.presence.notification(guest) == 'BUSY' or guest in self.invites_by_guest or host in self.invites_by_host:
+                    response_host = f"📞 {guest} IS DEALING WITH ANOTHER INVITE, TRY AGAIN LATER\n"
+                    conn.send(response_host.encode("utf-8"))
+                    return
 
         # Guest not found or offline
         response = "💣 PLAYER NOT FOUND OR OFFLINE\n"
         conn.send(response.encode("utf-8"))
 
+    # Pending invite leaves the indexes, None when it was already resolved
+    def take_invite(self, game_id):
+        with self.invite_lock:
+            game = self.games.get(game_id)
+            if not game or game.status != 'PENDING':
+                return None
+
+            game.timer.cancel()  # No-op when the invite is taken by its own timer
+
+            if self.invites_by_guest.get(game.guest) == game_id:
+                del self.invites_by_guest[game.guest]
+            if self.invites_by_host.get(game.host) == game_id:
+                del self.invites_by_host[game.host]
+            return game
+
+    # Guest answered, GAME_ACK accepts and GAME_NEG declines
+    def answer_invite(self, conn, guest, answer):
+        game = self.take_invite(self.invites_by_guest.get(guest))
+
+        if game is None:
+            # Invite timed out or host left, accepting guest is waiting for an answer
+            if answer == "GAME_ACK":
+                conn.send("⌛ INVITE EXPIRED\n".encode("utf-8"))
+            return
+
+        host = game.host
+        conn_host = self.get_user_connection(host)
+
+        # Set availability to receive notifications back to available
+        self.presence.set_notification(host, 'AVAILABLE')
+        self.presence.set_notification(guest, 'AVAILABLE')
+
+        # Invitation accepted by guest
+        if answer == "GAME_ACK":
+            self.games.accept(game)
+            self.metrics.increment('invites_accepted')
+            response_host = "ACCEPTED"
+
+        # Invitation declined by guest
+        else:
+            self.games.finish(game, 'DECLINED')
+            response_host = "DECLINED"
+
+        # Send to host user client response command
+        if conn_host:
+            conn_host.send(response_host.encode("utf-8"))
+
+    # Guest did not answer in time
+    def timeout_invite(self, game):
+        host, guest = game.host, game.guest
+        self.games.finish(game, 'TIMEOUT')
+        conn_host = self.get_user_connection(host)
+
+        # Set availability to receive notifications back to available
+        self.presence.set_notification(host, 'AVAILABLE')
+        self.presence.set_notification(guest, 'AVAILABLE')
+
+        # User playing and did not respond
+        if self.presence.status(guest) == 'PLAYING':
+            # Event user ignored invite, didn't answer
+            response_host = "IGNORED"  # Counted with the other timeouts by the registry watcher
+
+        # User online or gone and did not respond
+        else:
+            response_host = "TIMEOUT"
+
+            if self.presence.status(guest) == 'ONLINE':
+                # Event user seems to be afk, doesn't answer
+                afk_event = f"💤 USER SEEMS TO BE AFK: {guest}"
+
+                # Guest is still AFK, did not answer previous notification, keep him busy
+                self.presence.set_notification(guest, 'BUSY')
+
+                # Afk event to log file and stdout
+                self.log_event(afk_event)
+
+        if conn_host:  # Send to host timeout
+            conn_host.send(response_host.encode("utf-8"))
+
+    # Invite timer fired, guest did not answer in time
+    def expire_invite(self, game_id):
+        game = self.take_invite(game_id)
+        if game:
+            self.timeout_invite(game)
+
+    # User left, invites sent to it time out and invites sent by it are cancelled
+    def cancel_invites(self, username):
+        game = self.take_invite(self.invites_by_guest.get(username))
+        if game:
+            self.timeout_invite(game)
+
+        game = self.take_invite(self.invites_by_host.get(username))
+        if game:
+            self.games.finish(game, 'CANCELLED')
+            self.presence.set_notification(game.guest, 'AVAILABLE')
+
+        # Match of a user that left is over
+        self.games.leave(username)
+
     # Change users status to playing
     def start_game(self, conn, host, guest):
         # Events
@@ -466,27 +896,29 @@ class SAI_Server:
         playing_event_guest = f"🥊 USER IS PLAYING: {guest}"
         playing_event_both = f"🔥 USERS IN MATCH: {host} X {guest}"
 
-        # Stdout SAI server event
-        self.stdout_event(playing_event_host)
-        self.stdout_event(playing_event_guest)
-        self.stdout_event(playing_event_both)
-
-        # Playing event to log file
+        # Playing event to log file and stdout
         self.log_event(playing_event_host)
         self.log_event(playing_event_guest)
         self.log_event(playing_event_both)
 
         # Update status for playing
-        self.users[host]['status'] = 'PLAYING'
-        self.users[guest]['status'] = 'PLAYING'
-        self.save_users_to_file()
+        self.presence.set_status(host, 'PLAYING')
+        self.presence.set_status(guest, 'PLAYING')
+
+        # Accepted game record becomes PLAYING
+        self.games.start(host, guest)
+        self.metrics.increment('matches_started')
 
     # Send to guest which port should connect server response
-    def send_guest_conn_port(self, player_guest, port):
+    def send_guest_conn_port(self, player_guest, port, framed=False):
         # Get guest's address by username
         conn_guest = self.get_user_connection(player_guest)
         response_guest = f"CONNECT TO PORT {port}"
 
+        # Guest must open the P2P connection with the framed handshake
+        if framed:
+            response_guest += " FRAMED"
+
         if conn_guest:
             conn_guest.send(response_guest.encode("utf-8"))
 
@@ -495,40 +927,84 @@ class SAI_Server:
         # Inactive means user is no longer in a game and is now available
         inactive_event_self = f"🌀 USER BECAME INACTIVE: {player_self}"
 
-        # Stdout SAI server event
-        self.stdout_event(inactive_event_self)
-
-        # Inactive event to log file
+        # Inactive event to log file and stdout
         self.log_event(inactive_event_self)
 
         # Update status for online
-        self.users[player_self]['status'] = 'ONLINE'
-        self.save_users_to_file()
+        self.presence.set_status(player_self, 'ONLINE')
+
+        # Game record is OVER once its first player reports it
+        self.games.leave(player_self)
 
     # Set user status to available to receive notifications
     def set_invite_status_available(self, self_user):
-        self.users[self_user]['notification'] = 'AVAILABLE'
-        self.save_users_to_file()   # Save user data to database file
+        self.presence.set_notification(self_user, 'AVAILABLE')
 
-    # Log file event addition
-    def log_event(self, event):
-        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    # Registry watcher, invite outcomes and finished matches
+    def count_finished_game(self, game):
+        if game.status == 'OVER':
+            self.metrics.increment('matches_finished')
+        else:
+            self.metrics.increment(f"invites_{game.status.lower()}")
+
+    # Admin report, only for clients on the server machine
+    def send_stats(self, conn):
+        if conn.getpeername()[0] not in ("127.0.0.1", "::1"):
+            conn.send("🚨 STATS ONLY FROM LOCALHOST\n".encode("utf-8"))
+            return
+        conn.send(self.metrics.report().encode("utf-8"))
+
+    # Prometheus text dump, rewritten every interval by the timer wheel
+    def dump_metrics(self):
+        if not self.metrics_file:
+            return
+        try:
+            self.metrics.dump(self.metrics_file)
+        except OSError as e:
+            self.stdout_event(f"🚨 METRICS DUMP FAILED: {e!r}")
+        self.timers.schedule(METRICS_DUMP_INTERVAL, self.dump_metrics)
 
-        with open(self.log_file, "a", encoding="utf-8") as log:
-            log.write(f"{current_time}: {event}\n")
+    # Log file event addition, echoed to stdout by the same background writer
+    def log_event(self, event):
+        self.events.log(event)
 
     # Stdout time and event printing
     def stdout_event(self, event):
-        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        print(f"{current_time}: {event}")
-
-    # Generate unique token for game
-    def generate_unique_token(self):
-        return str(uuid.uuid4())
+        self.events.log(event, to_file=False)
+
+    # Live and finished game records with the memory they hold
+    def send_game_stats(self, conn):
+        stats = self.games.stats()
+        response = (f"🎲 GAMES LIVE: {stats['live']} | FINISHED: {stats['finished']} | "
+                    f"CREATED: {stats['created']} | EVICTED: {stats['evicted']} | "
+                    f"MEMORY: {stats['bytes'] / 1024:.1f} KB\n")
+        conn.send(response.encode("utf-8"))
 
 
 # Script being executed as main program and being run directly
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SAI SERVER")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4000)
+    parser.add_argument("--mode", choices=SERVER_MODES, default="threaded",
+                        help="threaded: one thread per client, eventloop: single-threaded selectors loop")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes sharing the port, more than one starts a coordinator process")
+    parser.add_argument("--storage", choices=STORAGE_BACKENDS, default="file",
+                        help="file: binary snapshot and journal, sqlite: SQLite database in WAL mode")
+    parser.add_argument("--metrics-file", default=None,
+                        help=f"write Prometheus text metrics to this file every {METRICS_DUMP_INTERVAL} seconds")
+    parser.add_argument("--heartbeat-interval", type=float, default=HEARTBEAT_INTERVAL,
+                        help="seconds before a quiet client is pinged, silent clients are dropped after 3 intervals, 0 turns heartbeats off")
+    args = parser.parse_args()
+
     os.system('cls' if os.name == 'nt' else 'clear')
-    sai_server = SAI_Server("127.0.0.1", 4000)  # SAI instance
-    sai_server.start()                          # Initiates server's execution
+
+    if args.workers > 1:
+        from sai_cluster import start_cluster
+        start_cluster(args.host, args.port, args.mode, args.workers, args.storage, args.metrics_file,
+                      args.heartbeat_interval)
+    else:
+        sai_server = SAI_Server(args.host, args.port, args.mode, args.storage, args.heartbeat_interval)  # SAI instance
+        sai_server.metrics_file = args.metrics_file
+        sai_server.start()  # Initiates server's execution
@@ -0,0 +1,198 @@
+# Binary snapshot of the users database, memory mapped and read on demand
+# Layout: header, fixed size index sorted by username, rows with extra fields, string heap
+
+import argparse
+import json
+import mmap
+import os
+import struct
+import threading
+
+MAGIC = b"SAIS"
+VERSION = 1
+
+HEADER = struct.Struct("<4sHHIIQ")  # Magic, version, reserved, users, users with extra fields, heap offset
+RECORD = struct.Struct("<QHHI")  # Heap offset, username, password and extra field lengths
+ROW = struct.Struct("<I")  # Index row of a user with extra fields
+
+
+class Snapshot_Error(Exception):
+    pass
+
+
+class Binary_Snapshot:
+
+    # Opening maps the file and reads the header only, users are decoded when asked for
+    # Readers hold the lock, a newer snapshot replaces the file and its map in between two reads
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.open_map()
+
+    def open_map(self):
+        with open(self.path, "rb") as file:
+            size = os.fstat(file.fileno()).st_size
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+        if len(self.map) < HEADER.size:
+            raise Snapshot_Error(f"SNAPSHOT TOO SHORT: {self.path}")
+
+        magic, version, _, self.count, self.extra_count, self.heap_offset = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise Snapshot_Error(f"NOT A SAI SNAPSHOT: {self.path}")
+
+        self.extra_offset = HEADER.size + self.count * RECORD.size
+
+    def __len__(self):
+        return self.count
+
+    def name(self, row):
+        offset, name_length, _, _ = RECORD.unpack_from(self.map, HEADER.size + row * RECORD.size)
+        return self.map[offset:offset + name_length].decode("utf-8")
+
+    # Username, password and extra fields of one index row
+    def row(self, row):
+        offset, name_length, password_length, extra_length = RECORD.unpack_from(
+            self.map, HEADER.size + row * RECORD.size)
+        password_offset = offset + name_length
+        extra_offset = password_offset + password_length
+
+        username = self.map[offset:password_offset].decode("utf-8")
+        password = self.map[password_offset:extra_offset].decode("utf-8")
+        extra = json.loads(self.map[extra_offset:extra_offset + extra_length]) if extra_length else {}
+        return username, password, extra
+
+    # Index row of a user, -1 when not in the snapshot
+    def find(self, username):
+        key = username.encode("utf-8")
+        low, high = 0, self.count
+
+        while low < high:
+            middle = (low + high) // 2
+            offset, name_length, _, _ = RECORD.unpack_from(self.map, HEADER.size + middle * RECORD.size)
+            name = self.map[offset:offset + name_length]
+            if name < key:
+                low = middle + 1
+            elif name > key:
+                high = middle
+            else:
+                return middle
+        return -1
+
+    def password(self, username):
+        with self.lock:
+            row = self.find(username)
+            if row < 0:
+                return None
+            offset, name_length, password_length, _ = RECORD.unpack_from(self.map, HEADER.size + row * RECORD.size)
+            offset += name_length
+            return self.map[offset:offset + password_length].decode("utf-8")
+
+    # Every username with its password, in index order
+    # Lock is held for the whole walk, used at start and for full snapshots only
+    def items(self):
+        with self.lock:
+            for row in range(self.count):
+                offset, name_length, password_length, _ = RECORD.unpack_from(
+                    self.map, HEADER.size + row * RECORD.size)
+                password_offset = offset + name_length
+                yield (self.map[offset:password_offset].decode("utf-8"),
+                       self.map[password_offset:password_offset + password_length].decode("utf-8"))
+
+    # Users with extra fields such as follow lists, cost follows their number and not every user
+    def extras(self):
+        with self.lock:
+            for index in range(self.extra_count):
+                row, = ROW.unpack_from(self.map, self.extra_offset + index * ROW.size)
+                username, _, extra = self.row(row)
+                yield username, extra
+
+    # Newer snapshot written at path takes the place of this one
+    # Map is closed before the rename, Windows refuses to replace a mapped file
+    def replace(self, path):
+        with self.lock:
+            self.close()
+            try:
+                os.replace(path, self.path)
+            finally:
+                self.open_map()
+
+    def close(self):
+        if isinstance(self.map, mmap.mmap):
+            self.map.close()
+
+
+# Write users, username to record with password and optional extra fields, as one binary snapshot
+def write_binary_snapshot(file, users):
+    usernames = sorted(users, key=lambda username: username.encode("utf-8"))
+    index = []
+    extra_rows = []
+    heap = []
+    heap_size = 0
+
+    for row, username in enumerate(usernames):
+        record = dict(users[username])
+        name = username.encode("utf-8")
+        password = record.pop('password').encode("utf-8")
+        extra = json.dumps(record, separators=(",", ":")).encode("utf-8") if record else b""
+        if len(name) > 0xFFFF or len(password) > 0xFFFF:
+            raise Snapshot_Error(f"USERNAME OR PASSWORD TOO LONG: {username}")
+
+        index.append((heap_size, len(name), len(password), len(extra)))
+        if extra:
+            extra_rows.append(row)
+        heap.append(name + password + extra)
+        heap_size += len(name) + len(password) + len(extra)
+
+    heap_offset = HEADER.size + len(index) * RECORD.size + len(extra_rows) * ROW.size
+    file.write(HEADER.pack(MAGIC, VERSION, 0, len(index), len(extra_rows), heap_offset))
+    file.write(b"".join(RECORD.pack(offset + heap_offset, *lengths) for offset, *lengths in index))
+    file.write(b"".join(ROW.pack(row) for row in extra_rows))
+    file.write(b"".join(heap))
+
+
+# Users of a JSON lines database file, later lines win
+def read_json_lines(path):
+    users = {}
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                users.update(json.loads(line))
+    return users
+
+
+# Every user of a binary snapshot, same form as the JSON lines file
+def read_binary_snapshot(path):
+    snapshot = Binary_Snapshot(path)
+    users = {}
+    for row in range(len(snapshot)):
+        username, password, extra = snapshot.row(row)
+        users[username] = {'password': password, **extra}
+    snapshot.close()
+    return users
+
+
+def write_json_lines(path, users):
+    with open(path, "w", encoding="utf-8") as file:
+        for username, user_data in users.items():
+            json.dump({username: user_data}, file)
+            file.write("\n")
+
+
+# Converter between the JSON lines database file and the binary snapshot
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SAI SNAPSHOT CONVERTER")
+    parser.add_argument("direction", choices=("to-binary", "to-json"))
+    parser.add_argument("source")
+    parser.add_argument("target")
+    args = parser.parse_args()
+
+    if args.direction == "to-binary":
+        users = read_json_lines(args.source)
+        with open(args.target, "wb") as file:
+            write_binary_snapshot(file, users)
+    else:
+        users = read_binary_snapshot(args.source)
+        write_json_lines(args.target, users)
+
+    print(f"✅ CONVERTED {len(users)} USERS: {args.source} -> {args.target}")
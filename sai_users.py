@@ -0,0 +1,66 @@
+# Registered users of SAI, credentials only, presence lives at the presence table
+
+import sys
+import threading
+
+
+class User_Table:
+
+    # Interned username straight to its password, no dictionary per user
+    # Users of a binary snapshot or SQLite database stay on disk, only users added or changed since are kept here
+    def __init__(self):
+        self.passwords = {}
+        self.snapshot = None
+        self.added = 0  # Users kept here that are not in the snapshot
+        self.lock = threading.Lock()  # Snapshot thread attaches while commands add users
+
+    # Read users on demand, snapshot answers password, items and len
+    # Users the snapshot now holds with the same password leave memory, later changes stay here
+    def attach(self, snapshot):
+        with self.lock:
+            self.snapshot = snapshot
+            for username, password in list(self.passwords.items()):
+                if snapshot.password(username) == password:
+                    del self.passwords[username]
+            self.added = sum(1 for username in self.passwords if snapshot.password(username) is None)
+
+    # Add user, False when username is already taken
+    def add(self, username, password):
+        with self.lock:
+            if username in self:
+                return False
+            self.passwords[sys.intern(username)] = password
+            self.added += 1
+            return True
+
+    # Replace or add user, used when replaying stored records
+    def load(self, username, password):
+        with self.lock:
+            if username not in self:
+                self.added += 1
+            self.passwords[sys.intern(username)] = password
+
+    # Password of a user, None when not registered
+    def password(self, username):
+        password = self.passwords.get(username)
+        if password is None and self.snapshot:
+            password = self.snapshot.password(username)
+        return password
+
+    def __contains__(self, username):
+        return username in self.passwords or (self.snapshot is not None and self.snapshot.password(username) is not None)
+
+    def __len__(self):
+        return (len(self.snapshot) if self.snapshot else 0) + self.added
+
+    # Copy of the usernames, safe while other threads register users
+    def __iter__(self):
+        return (username for username, _ in self.items())
+
+    # Every user with its password, snapshot read in order instead of one lookup per user
+    def items(self):
+        passwords = dict(self.passwords)
+        if self.snapshot:
+            for username, password in self.snapshot.items():
+                yield username, passwords.pop(username, password)
+        yield from passwords.items()
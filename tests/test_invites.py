@@ -0,0 +1,64 @@
+# Invite rules of SAI server, run with: python -m unittest discover tests
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sai_server import SAI_Server
+
+
+class Fake_Connection:
+
+    # Collects what the server sends instead of writing to a socket
+    def __init__(self, port):
+        self.port = port
+        self.sent = []
+        self.tagged = False
+
+    def send(self, data, reply=False):
+        self.sent.append(data.decode("utf-8"))
+        return len(data)
+
+    def getpeername(self):
+        return ("127.0.0.1", self.port)
+
+
+class Invite_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.workdir = tempfile.TemporaryDirectory()
+        os.chdir(self.workdir.name)  # Database and game log stay in the scratch directory
+        self.server = SAI_Server("127.0.0.1", 0)
+        self.conns = {}
+        for port, username in enumerate(("host", "guest", "other"), 5000):
+            self.server.users.add(username, "pw")
+            self.conns[username] = Fake_Connection(port)
+            self.server.login_user(self.conns[username], username, "pw")
+
+    def tearDown(self):
+        self.server.events.close()
+        os.chdir(self.cwd)
+        self.workdir.cleanup()
+
+    def test_second_invite_of_a_pending_host_is_refused(self):
+        self.server.initiate_game(self.conns["host"], "host", "guest")
+        self.server.initiate_game(self.conns["host"], "host", "other")
+
+        self.assertIn("INVITED guest", self.conns["host"].sent[-2])
+        self.assertIn("IS DEALING WITH ANOTHER INVITE", self.conns["host"].sent[-1])
+        self.assertEqual(len(self.conns["other"].sent), 1)  # Login reply only, no invite
+        self.assertNotIn("other", self.server.invites_by_guest)
+
+        # Host leaving cancels its only invite, the guest is free again
+        self.server.cancel_invites("host")
+        self.assertEqual(self.server.invites_by_host, {})
+        self.assertEqual(self.server.invites_by_guest, {})
+        self.assertEqual(self.server.presence.notification("guest"), 'AVAILABLE')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+# Hashed timer wheel, deadlines for SAI server and user client without a thread per timer
+
+import threading
+import time
+
+
+class Timer:
+
+    # Scheduled callback, rounds counts full wheel turns left before it fires
+    def __init__(self, wheel, slot, rounds, callback, args):
+        self.wheel = wheel
+        self.slot = slot
+        self.rounds = rounds
+        self.callback = callback
+        self.args = args
+        self.active = True  # False once fired or cancelled
+
+    def cancel(self):
+        return self.wheel.cancel(self)
+
+
+class Timer_Wheel:
+
+    # Slots hold timers by tick modulo wheel size, schedule and cancel cost O(1)
+    def __init__(self, tick=0.1, slots=512):
+        self.tick = tick  # Seconds per slot, timers fire up to one tick late
+        self.slots = [set() for _ in range(slots)]
+        self.current = 0  # Slot handled by the next tick
+        self.lock = threading.Lock()
+        self.thread = None
+
+    # Run callback with args after delay seconds, returns timer handle
+    def schedule(self, delay, callback, *args):
+        ticks = max(1, int(round(delay / self.tick)))
+
+        with self.lock:
+            slot = (self.current + ticks - 1) % len(self.slots)
+            rounds = (ticks - 1) // len(self.slots)
+            timer = Timer(self, slot, rounds, callback, args)
+            self.slots[slot].add(timer)
+        return timer
+
+    # Remove timer before it fires, False when it already fired or was cancelled
+    def cancel(self, timer):
+        with self.lock:
+            if not timer.active:
+                return False
+            timer.active = False
+            self.slots[timer.slot].discard(timer)
+        return True
+
+    # Handle one slot, callbacks run outside the lock so they may schedule or cancel timers
+    def advance(self):
+        due = []
+
+        with self.lock:
+            bucket = self.slots[self.current]
+            for timer in list(bucket):
+                if timer.rounds > 0:
+                    timer.rounds -= 1
+                else:
+                    bucket.discard(timer)
+                    timer.active = False
+                    due.append(timer)
+            self.current = (self.current + 1) % len(self.slots)
+
+        for timer in due:
+            try:
+                timer.callback(*timer.args)
+            except Exception as e:
+                print(f"🚨 TIMER CALLBACK FAILED: {e!r}")
+
+    # Tick forever at a steady rate, late ticks are caught up instead of skipped
+    def run(self):
+        next_tick = time.monotonic() + self.tick
+        while True:
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.advance()
+            next_tick += self.tick
+
+    # One background thread drives every timer of the wheel
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        return self
@@ -1,435 +1,446 @@
+import asyncio
 import threading
-import select
-import socket
-import random
 import time
 import os
 
+from sai_client import ROUNDS, Client_Error, SAI_Client, animal_icon, count_points, initialize_ocean_board
+from timer_wheel import Timer_Wheel
+
+LOBBY_PAGE_SIZE = 20  # Users per online list page
+
+# Seconds before a received invitation expires at client, SAI expires it after 15 seconds
+INVITE_EXPIRATION_ONLINE = 13
+INVITE_EXPIRATION_PLAYING = 10
+
+CONNECT_TIMEOUT = 10  # Seconds an accepting guest waits for the host port before returning to the lobby
+
 
 class User_Client:
 
-    # Constructor method, creates socket
+    # Terminal front end of SAI_Client, menus and prints only
+    # SAI_Client runs on an asyncio loop at a background thread, the menu waits for its coroutines
     def __init__(self, host, port):
         self.host = host
         self.port = port
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.lock = threading.Lock()
-        self.running = True  # Invite listener thread controller
+        self.client = SAI_Client(host, port)
+        self.client.on_event = self.handle_event  # Invitations are shown as soon as they arrive
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.running = True  # False once the user exits, disconnection is then expected
         self.notification = False  # Active notification controller
         self.input_ack_neg = False  # Controller for accept or decline notification at input
         self.inviter = None  # Store inviter username when user receive a notification
         self.response_in_game = None  # Store SAI invite response when user is playing
         self.match_declined = False  # Controller for refused invites while playing
-        self.invite_time_left = 0  # Timer for expired invitation
+        self.timers = Timer_Wheel()  # Invitation deadlines, started at login
+        self.invite_timer = None  # Expiration of the current invitation
 
         # True means invite has expired, False means invite still can be ack or neg
         self.invite_expired = False
 
+        # Last rendered lobby lists and their SAI version, reused when server answers NOT_MODIFIED
+        self.lobby_lists = {'ONLINE': (0, None), 'PLAYING': (0, None)}
+
+    # Lobby kept fresh by presence pushes, username to status, notification, ip and port
+    # None until subscribed, lists are requested from SAI meanwhile
+    @property
+    def lobby(self):
+        return self.client.lobby
+
     # Connection to server
     def connect(self):
-        self.sock.connect((self.host, self.port))
+        self.loop_thread.start()
+        self.run(self.client.connect())
 
         os.system('cls' if os.name == 'nt' else 'clear')
         print(f"💡 CONNECTED TO SERVER ON {self.host}:{self.port}")
 
-    # Message sender method
-    def send_message(self, message):
-        # Socket send message to server
-        self.sock.sendall(message.encode("utf-8"))
+    # Run a SAI client coroutine at the client loop and wait for its result
+    def run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
 
-    # Server response receiver
-    def receive_response(self):
+    # Same as run for requests to SAI, None when SAI is gone or did not answer in time
+    def request(self, coroutine):
         try:
-            data = self.sock.recv(1024)  # Socket receive response from server
-            if not data:
-                return None
-            response = data.decode("utf-8")
-            return response
-        except ConnectionAbortedError as e:
-            print(
-                f"⛔ CONNECTION WAS TERMINATED BY THE SOFTWARE ON THE HOST")
-            return None
-        except Exception as e:
-            print(f"⛔ AN UNHANDLED EXCEPTION OCCURRED")
+            return self.run(coroutine)
+        except Client_Error:
+            print(f"⛔ CONNECTION WAS TERMINATED BY THE SOFTWARE ON THE HOST")
+        except asyncio.TimeoutError:
+            print(f"⌛ SERVER DID NOT ANSWER IN TIME")
+        return None
+
+    # Commands without a response, written at the client loop since its streams are not thread safe
+    def send_message(self, send, *args):
+        def write():
+            try:
+                send(*args)
+            except Client_Error:
+                pass
+        self.loop.call_soon_threadsafe(write)
+
+    # Pushes seen at the client loop, invitations are shown at once and the menu acts on them once input returns
+    # Other events stay queued at SAI_Client for the menu waiting on them
+    def handle_event(self, event):
+        if event.kind == 'INVITED':
+            self.show_invitation(event, event.message)
+            return True
+        if event.kind == 'DISCONNECTED' and self.running:
+            print("\n🚨 SERVER DISCONNECTED. EXITING CLIENT")
+        return False
 
     # Send registration command
     def register_user(self, username, password):
         # Send username and password
-        command = f"REGISTER {username} {password}"
-        self.send_message(command)
+        result = self.request(self.client.register(username, password))
+        if result:
+            print(f"\n{result[1]}")
 
-        response = self.receive_response()  # Receive response from server
-        print(f"\n{response}")
-
-    # Send login command
+    # Send login command, presence subscription goes in the same round trip
     def login_user(self, username, password):
-        command = f"LOGIN {username} {password}"
-        self.send_message(command)
+        result = self.request(self.client.login(username, password, presence=True))
+        if not result:
+            return None
 
-        response = self.receive_response()  # Receive response from server
+        authenticated, response = result
         print(f"\n{response}")
 
         # If user authenticated return username
-        if "LOGIN SUCCESSFUL" in response:
-            return username
-        else:
-            return None
+        return username if authenticated else None
 
-    # Send list users online command
+    # Send list users online command, one page at a time sorted by username
     def list_users_online(self, logged_in_username):
-        command = f"LIST_USERS_ONLINE {logged_in_username}"
-        self.send_message(command)
+        if self.lobby is not None:
+            self.print_local_lobby('ONLINE', logged_in_username)
+            return
+
+        version, _ = self.lobby_lists['ONLINE']
+        page = self.request(self.client.list_online(limit=LOBBY_PAGE_SIZE, version=version))
+        if page is None:
+            return
+        page = self.cache_lobby_list('ONLINE', page)
+        print(f"\n{page.text}")
+
+        # Later pages and name filters are fetched only when asked for, never cached
+        prefix = ""
+        next_cursor = page.next_cursor
+        while next_cursor:
+            choice = input("[N] NEXT PAGE | [/NAME] FILTER BY NAME | ENTER TO RETURN: ").strip()
+
+            if choice.upper() == "N":
+                page = self.client.list_online(limit=LOBBY_PAGE_SIZE, cursor=next_cursor, prefix=prefix or None)
+            elif choice.startswith("/") and len(choice) > 1:
+                prefix = choice[1:]
+                page = self.client.list_online(limit=LOBBY_PAGE_SIZE, prefix=prefix)
+            else:
+                break
 
-        response = self.receive_response()
-        print(f"\n{response}")
+            page = self.request(page)
+            if page is None:
+                return
+            print(f"\n{page.text}")
+            next_cursor = page.next_cursor
+
+    # Lobby from presence pushes, same pages and name filter as the SAI listing without a request
+    def print_local_lobby(self, status, logged_in_username=None):
+        icon = "🔴" if status == 'PLAYING' else "🟢"
+        users = sorted((username, entry) for username, entry in list(self.lobby.items())
+                       if entry[0] == status and username != logged_in_username)
+        prefix = ""
+        start = 0
+
+        while True:
+            matching = [(username, entry) for username, entry in users if username.startswith(prefix)]
+            page = matching[start:start + LOBBY_PAGE_SIZE]
+
+            if page:
+                print(f"\n🤖 {status} USERS:\n")
+                for username, (user_status, _, ip, port) in page:
+                    print(f"{icon} 👤 {username} | STATUS: {user_status} | IP: {ip} | PORT: {port}")
+                print()
+            else:
+                print(f"\n👻 NO {status} USERS FOUND\n")
+
+            if start + LOBBY_PAGE_SIZE >= len(matching):
+                break
+
+            choice = input("[N] NEXT PAGE | [/NAME] FILTER BY NAME | ENTER TO RETURN: ").strip()
+            if choice.upper() == "N":
+                start += LOBBY_PAGE_SIZE
+            elif choice.startswith("/") and len(choice) > 1:
+                prefix = choice[1:]
+                start = 0
+            else:
+                break
 
     def list_users_playing(self):
-        command = "LIST_USERS_PLAYING"
-        self.send_message(command)
+        if self.lobby is not None:
+            self.print_local_lobby('PLAYING')
+            return
 
-        response = self.receive_response()
-        print(f"\n{response}")
+        version, _ = self.lobby_lists['PLAYING']
+        page = self.request(self.client.list_playing(version=version))
+        if page is not None:
+            print(f"\n{self.cache_lobby_list('PLAYING', page).text}")
+
+    # Keep versioned list, NOT_MODIFIED means last rendered list is still current
+    def cache_lobby_list(self, kind, page):
+        if page.not_modified:
+            _, cached = self.lobby_lists[kind]
+            return cached if cached is not None else page
+
+        if page.version is not None:
+            self.lobby_lists[kind] = (page.version, page)
+        return page
 
     # Send initiate game command
     def initiate_game(self, player_host, player_guest):
 
         # HOST means the user who sends the invitation, GUEST means the user who will be invited
-        command = f"GAME_INI {player_host} {player_guest}"
-        self.send_message(command)
-
-        response = self.receive_response()
+        result = self.request(self.client.invite(player_guest))
+        if not result:
+            return
+        invited, response = result
         print(f"\n{response}")
 
         # Send invite and wait for guest response
-        if "INVITED" in response:
+        if invited:
             print("⏰ WAITING 15 SEC FOR GUEST RESPONSE\n")
 
-            response_invite = self.receive_response()
+            response_invite = self.request(self.client.wait_invite_answer())
 
             # Accepted, host received GAME_ACK
-            if "ACCEPTED" in response_invite:
+            if response_invite == "ACCEPTED":
                 print(f"🍾 GUEST ACCEPTED GAME INVITE\n")
 
                 # Inviter user start P2P connection when guest accept invite
                 self.start_connection(player_host, player_guest)
 
             # Declined, host receveid GAME_NEG
-            elif "DECLINED" in response_invite:
+            elif response_invite == "DECLINED":
                 os.system('cls' if os.name == 'nt' else 'clear')
                 print(f"🧹 GAME INVITE DECLINED BY GUEST\n")
 
             # Timeout, user invited is online but did not respond
-            elif "TIMEOUT" in response_invite:
+            elif response_invite == "TIMEOUT":
                 os.system('cls' if os.name == 'nt' else 'clear')
                 print(f"💤 GUEST SEEMS TO BE AFK\n")
 
             # Ignored, user invited is playing but ignored invitation
-            elif "IGNORED" in response_invite:
+            elif response_invite == "IGNORED":
                 os.system('cls' if os.name == 'nt' else 'clear')
                 print(f"🔕 GUEST IGNORED YOUR INVITATION\n")
 
             else:
                 print("❓ UNEXPECTED RESPONSE FROM GUEST\n")
 
-    # Inviter sends socket port to invitee command
+    # Host side, SAI_Client listens for the guest and sends SAI the port and the game start
     def start_connection(self, player_host, player_guest):
-        # Host player creates a socket
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as game_socket_host:
-
-            # Links to an available address
-            game_socket_host.bind((self.host, 0))
-            _, self_port = game_socket_host.getsockname()
-            game_socket_host.listen(1)  # Only one connection
+        print(f"🔗 WAITING FOR {player_guest} TO CONNECT\n")
 
-            print(
-                f"🔗 WAITING FOR {player_guest} TO CONNECT ON PORT {self_port}\n")
+        try:
+            match = self.run(self.client.host_match(player_guest))
+        except (OSError, asyncio.TimeoutError, Client_Error):
+            print(f"🚨 {player_guest} DID NOT CONNECT, RETURNING TO LOBBY\n")
+            self.send_message(self.client.game_over)
+            return
 
-            # Send to SAI server guest's username and which port should connect
-            command = f"SEND_GUEST_CONN_PORT {player_guest} {self_port}"
-            self.send_message(command)
+        print(f"🎉 CONNECTED TO {player_guest}. STARTING GAME...\n")
+        self.play_match(match, player_host, player_guest)
 
-            # Waits until invitee connects to host
-            # Upon connection new socket is created for communication with the guest
-            game_socket_P2P, _ = game_socket_host.accept()
+    # Match between host and guest, both send SAI game over afterwards to set their status back to online
+    def play_match(self, match, player_self, player_opponent):
+        try:
+            # Connected start game
+            self.start_game(match, player_self, player_opponent)
 
-            if game_socket_P2P:
-                # Send to SAI game start command
-                command = f"GAME_START {player_host} {player_guest}"
-                self.send_message(command)
+        # Opponent had lost connection or left game
+        except Exception as e:
+            print("🚨 CONNECTION TO OPPONENT FAILED\n")
 
-                print(f"🎉 CONNECTED TO {player_guest}. STARTING GAME...\n")
+            # Show self win message
+            os.system('cls' if os.name == 'nt' else 'clear')
+            print(
+                f"💨 OPNT: {player_opponent} HAS LEFT THE GAME, LEAVING MATCH\n")
+            print(
+                f"🥇 CONGRATULATIONS, {player_self}! YOU ARE THE WINNER!\n")
 
-                try:
-                    # Connected start game
-                    self.start_game(game_socket_P2P, player_host, player_guest)
+            print("⌚ RETURNING TO LOBBY\n")
+            time.sleep(1)
 
-                    # Host after match ends send to SAI game over command to set back status to online
-                    command = f"GAME_OVER {player_host}"
-                    self.send_message(command)
+        finally:
+            self.send_message(self.client.game_over)
+            self.run(match.close())
+
+    # Game logic of Match.play, the terminal only asks for moves and shows rounds and result
+    def start_game(self, match, player_self, player_opponent):
+        totals = [0, 0]  # Self and opponent points, shown before each move
+
+        # Input blocks, it waits at an executor thread so the client loop keeps reading SAI meanwhile
+        async def choose(ocean_board, round_number):
+            return await asyncio.get_running_loop().run_in_executor(
+                None, self.choose_square, ocean_board, round_number, player_self, player_opponent, totals)
+
+        async def show_round(round_number, ocean_board, move_self, move_opponent, score_self, score_opponent):
+            totals[:] = [score_self, score_opponent]
+            self.display_round(round_number, ocean_board, player_self, player_opponent, move_self, move_opponent,
+                               score_self, score_opponent)
+            await asyncio.sleep(5)
+
+        result = self.run(match.play(choose, on_round=show_round))
+        self.display_result(result, player_self, player_opponent)
+
+    # Square of one round, None leaves the match
+    def choose_square(self, ocean_board, round_number, player_self, player_opponent, totals):
+        # Invitation inside match received
+        if (self.notification == True) and (self.invite_expired == False):
+            if self.answer_invite_in_match(player_opponent):
+                return None
 
-                    game_socket_P2P.close()  # Close socket
+        os.system('cls' if os.name == 'nt' else 'clear')
+        print(
+            f"🦀 ROUND {round_number}: {player_self} VS {player_opponent}\n")
 
-                # Host view, guest had lost connection or left game
-                except Exception as e:
-                    print("🚨 FAILED TO CONNECT TO GUEST/n")
+        print(f"🌞 SELF TOTAL: {totals[0]} POINTS")
+        print(f"🌚 OPNT TOTAL: {totals[1]} POINTS")
+        print(f"\n🏁 TYPE [x] TO LEAVE MATCH")
 
-                    # Host after match ends send to SAI game over command to set back status to online
-                    command = f"GAME_OVER {player_host}"
-                    self.send_message(command)
+        self.display_ocean_empty()  # Display empty ocean
 
-                    # Show host win message
-                    os.system('cls' if os.name == 'nt' else 'clear')
-                    print(
-                        f"💨 OPNT: {player_guest} HAS LEFT THE GAME, LEAVING MATCH\n")
-                    print(
-                        f"🥇 CONGRATULATIONS, {player_host}! YOU ARE THE WINNER!\n")
+        # Get self player's move
+        square = self.get_player_move()
+        if square:
+            print(f"\n🦗 WAITING FOR {player_opponent} ...\n")
+        return square
 
-                    print("⌚ RETURNING TO LOBBY\n")
-                    time.sleep(1)
+    # Invitation received while playing, True when the user leaves the match to accept it
+    def answer_invite_in_match(self, player_opponent):
+        # Save inviter username, the invitation is answered here
+        response, self.response_in_game = self.response_in_game, None
+        self.inviter = response.split()[1]
+        self.input_ack_neg = False  # Remove ack and neg as valid option at input
 
-                    game_socket_P2P.close()
-                    # Send anything back to SAI to reload client response receiver
-                    self.send_message("NOTHING")
+        os.system('cls' if os.name == 'nt' else 'clear')
 
-    # Game logic
-    def start_game(self, game_socket_self, player_self, player_opponent):
         while True:
-            # Score counter
-            score_self = 0
-            score_opponent = 0
-
-            for round_number in range(1, 6):  # Five rounds
-                leave_match = False  # User left match
-
-                # Invitation inside match received
-                if (self.notification == True) and (self.invite_expired == False):
-                    # Save inviter username
-                    parts = self.response_in_game.split()
-                    self.inviter = parts[1]
-
-                    os.system('cls' if os.name == 'nt' else 'clear')
-
-                    while True:
-                        print(f"📬 NEW NOTIFICATION:\n{self.response_in_game}")
-                        print(f"📢 SEND BACK ACK TO {self.inviter}:\n")
-                        print("[8] LEAVE THE MATCH TO ACCEPT INVITE")
-                        print("[9] DECLINE INVITATION AND CONTINUE PLAYING")
-
-                        choice = input("\n📟 CHOOSE AN OPTION: ")
-
-                        if choice == "8":  # Accept invitation to join another match
-                            # Accepted but invite has already expired
-                            if self.invite_expired == True:
-                                os.system('cls' if os.name ==
-                                          'nt' else 'clear')
-                                print(
-                                    f"📢 INVITATION FROM {self.inviter} EXPIRED")
-                                print(
-                                    f"♻️  CONTINUING MATCH AGAINST {player_opponent}")
-                                time.sleep(1)
-
-                                # When returns to lobby, client do not deal with the invitation
-                                self.notification = False
-                                self.input_ack_neg = False  # Remove ack and neg as valid option at input
-                                self.response_in_game = None  # Store SAI invite response from invitation
-                                self.invite_expired = True  # Set invite to expired again
-                                leave_match = False  # User don't leave match
-
-                                # Not used to refuse invitation but to tell client there is no need to deal with this invite anymore
-                                self.match_declined = True
-                                break
-
-                            else:  # Invite not expired
-                                print("\n🟠 LEAVING MATCH\n")
-                                time.sleep(1)
-
-                                self.notification = True  # When returns to lobby, client deal with the invitation
-                                leave_match = True  # User left match
-
-                                self.input_ack_neg = False  # Remove ack and neg as valid option at input
-                                self.response_in_game = None  # Store SAI invite response from invitation
-                                self.invite_expired = False  # Invite not expired
-
-                                os.system('cls' if os.name ==
-                                          'nt' else 'clear')
-
-                                print(
-                                    f"💨 SELF: {player_self}, YOU LEFT THE MATCH\n")
-                                print(
-                                    f"🥈 SORRY, {player_self}! YOU LOST THE GAME!\n")
-
-                                print("⌚ RETURNING TO LOBBY\n")
-                                time.sleep(1)
-                                break
-
-                        elif choice == "9":  # Decline invitation, continue playing
-                            print("\n🔴 DECLINING")
-                            print(
-                                f"♻️ CONTINUING MATCH AGAINST {player_opponent}")
-
-                            time.sleep(1)
-
-                            os.system('cls' if os.name == 'nt' else 'clear')
-
-                            # When returns to lobby, client do not deal with the invitation
-                            self.notification = False
-                            self.input_ack_neg = False  # Remove ack and neg as valid option at input
-                            self.response_in_game = None  # Store SAI invite response from invitation
-                            self.invite_expired = True  # Set invite to expired
-                            leave_match = False  # User do not leave match
-
-                            # Match was declined, no need to deal with this invite anymore when return to lobby
-                            self.match_declined = True
-                            break
-
-                        else:  # Invalid input
-                            os.system('cls' if os.name == 'nt' else 'clear')
-                            print("\n⛔ INVALID OPTION, CHOOSE A VALID ONE\n")
-
-                if leave_match == True:  # Player self left match to join another one
-                    break
-
-                os.system('cls' if os.name == 'nt' else 'clear')
-                print(
-                    f"🦀 ROUND {round_number}: {player_self} VS {player_opponent}\n")
-
-                print(f"🌞 SELF TOTAL: {score_self} POINTS")
-                print(f"🌚 OPNT TOTAL: {score_opponent} POINTS")
-                print(f"\n🏁 TYPE [x] TO LEAVE MATCH")
+            print(f"📬 NEW NOTIFICATION:\n{response}")
+            print(f"📢 SEND BACK ACK TO {self.inviter}:\n")
+            print("[8] LEAVE THE MATCH TO ACCEPT INVITE")
+            print("[9] DECLINE INVITATION AND CONTINUE PLAYING")
 
-                # Initialize the ocean board for each round
-                ocean_board = self.initialize_ocean_board()
-
-                self.display_ocean_empty()  # Display empty ocean
-
-                # Get self player's move
-                move_self = self.get_player_move(ocean_board)
+            choice = input("\n📟 CHOOSE AN OPTION: ")
 
-                # Leave player's move
-                if move_self == "LEAVE":
+            if choice == "8":  # Accept invitation to join another match
+                # Accepted but invite has already expired
+                if self.invite_expired == True:
                     os.system('cls' if os.name == 'nt' else 'clear')
-                    game_socket_self.send(move_self.encode('utf-8'))
-
-                    print(
-                        f"💨 SELF: {player_self}, YOU LEFT THE MATCH\n")
-                    print(f"🥈 SORRY, {player_self}! YOU LOST THE GAME!\n")
-
-                    print("⌚ RETURNING TO LOBBY\n")
+                    print(f"📢 INVITATION FROM {self.inviter} EXPIRED")
+                    print(f"♻️  CONTINUING MATCH AGAINST {player_opponent}")
                     time.sleep(1)
-                    break
 
-                # Send the animal type caught to the opponent
-                game_socket_self.send(move_self.encode('utf-8'))
+                    # When returns to lobby, client do not deal with the invitation
+                    self.notification = False
 
-                # Update self score
-                round_points_self = self.count_points(move_self)
-                score_self += round_points_self
+                    # Not used to refuse invitation but to tell client there is no need to deal with this invite anymore
+                    self.match_declined = True
+                    return False
 
-                print(f"\n🦗 WAITING FOR {player_opponent} ...\n")
+                # Invite not expired, when returns to lobby client deals with the invitation
+                print("\n🟠 LEAVING MATCH\n")
+                time.sleep(1)
+                self.notification = True
+                return True
 
-                # Wait for opponent's response
-                move_opponent = game_socket_self.recv(
-                    1024).decode('utf-8')
+            elif choice == "9":  # Decline invitation, continue playing
+                print("\n🔴 DECLINING")
+                print(f"♻️ CONTINUING MATCH AGAINST {player_opponent}")
+                time.sleep(1)
 
-                # Self waiting for opponent's response but received left command from opponent
-                if move_opponent == "LEAVE":
-                    os.system('cls' if os.name == 'nt' else 'clear')
-                    print(
-                        f"💨 OPNT: {player_opponent} HAS LEFT THE GAME, LEAVING MATCH\n")
-                    print(
-                        f"🥇 CONGRATULATIONS, {player_self}! YOU ARE THE WINNER!\n")
+                # When returns to lobby, client do not deal with the invitation
+                self.notification = False
+                self.invite_expired = True  # Set invite to expired
 
-                    print("⌚ RETURNING TO LOBBY\n")
-                    time.sleep(1)
-                    break
+                # Match was declined, no need to deal with this invite anymore when return to lobby
+                self.match_declined = True
+                return False
 
+            else:  # Invalid input
                 os.system('cls' if os.name == 'nt' else 'clear')
-                print(
-                    f"🦀 ROUND {round_number}: {player_self} VS {player_opponent}")
-
-                # Update opponent score
-                round_points_opponent = self.count_points(move_opponent)
-                score_opponent += round_points_opponent
-
-                # Get animal icon
-                icon_self = self.get_animal_icon(move_self)
-                icon_opponent = self.get_animal_icon(move_opponent)
+                print("\n⛔ INVALID OPTION, CHOOSE A VALID ONE\n")
 
-                # Display the ocean result
-                self.display_ocean_result(ocean_board)
+    # Both moves of a finished round
+    def display_round(self, round_number, ocean_board, player_self, player_opponent, move_self, move_opponent,
+                      score_self, score_opponent):
+        os.system('cls' if os.name == 'nt' else 'clear')
+        print(
+            f"🦀 ROUND {round_number}: {player_self} VS {player_opponent}")
 
-                print(
-                    f"\n🌞 SELF: {player_self} CAUGHT A {move_self} {icon_self} +{round_points_self}!\n   TOTAL: {score_self} POINTS")
-                print(
-                    f"\n🌚 OPNT: {player_opponent} CAUGHT A {move_opponent} {icon_opponent} +{round_points_opponent}!\n   TOTAL: {score_opponent} POINTS")
+        # Display the ocean result
+        self.display_ocean_result(ocean_board)
 
-                if round_number == 5:
-                    # Show results
-                    print("\n⌚ GAME FINISHED! SHOWING RESULTS...\n")
-                    time.sleep(5)
+        print(
+            f"\n🌞 SELF: {player_self} CAUGHT A {move_self} {self.get_animal_icon(move_self)} +{self.count_points(move_self)}!\n   TOTAL: {score_self} POINTS")
+        print(
+            f"\n🌚 OPNT: {player_opponent} CAUGHT A {move_opponent} {self.get_animal_icon(move_opponent)} +{self.count_points(move_opponent)}!\n   TOTAL: {score_opponent} POINTS")
 
-                    os.system('cls' if os.name == 'nt' else 'clear')
+        if round_number == ROUNDS:
+            print("\n⌚ GAME FINISHED! SHOWING RESULTS...\n")
+        else:
+            print("\n⌚ NEXT ROUND STARTS IN 5 SECONDS\n")
 
-                    if score_self > score_opponent:
-                        print(
-                            f"\n🥇 CONGRATULATIONS, {player_self}! YOU ARE THE WINNER!")
+    # Match_Result of the match, a player that left loses it
+    def display_result(self, result, player_self, player_opponent):
+        os.system('cls' if os.name == 'nt' else 'clear')
 
-                    elif score_self < score_opponent:
-                        print(f"\n🥈 SORRY, {player_self}! YOU LOST THE GAME!")
+        if result.left == 'SELF':
+            print(f"💨 SELF: {player_self}, YOU LEFT THE MATCH\n")
+            print(f"🥈 SORRY, {player_self}! YOU LOST THE GAME!\n")
+            print("⌚ RETURNING TO LOBBY\n")
+            time.sleep(1)
+            return
 
-                    else:
-                        print(f"\n🃏 IT'S A TIE! THE GAME ENDS IN A DRAW!")
+        if result.left == 'OPPONENT':
+            print(
+                f"💨 OPNT: {player_opponent} HAS LEFT THE GAME, LEAVING MATCH\n")
+            print(
+                f"🥇 CONGRATULATIONS, {player_self}! YOU ARE THE WINNER!\n")
+            print("⌚ RETURNING TO LOBBY\n")
+            time.sleep(1)
+            return
 
-                    print(f"\n🌞 SELF TOTAL: {score_self} POINTS")
-                    print(f"🌚 OPNT TOTAL: {score_opponent} POINTS")
-                    print("\n⌚ RETURNING TO LOBBY\n")
+        if result.outcome == 'WIN':
+            print(f"\n🥇 CONGRATULATIONS, {player_self}! YOU ARE THE WINNER!")
+        elif result.outcome == 'LOSS':
+            print(f"\n🥈 SORRY, {player_self}! YOU LOST THE GAME!")
+        else:
+            print(f"\n🃏 IT'S A TIE! THE GAME ENDS IN A DRAW!")
 
-                else:
-                    print("\n⌚ NEXT ROUND STARTS IN 5 SECONDS\n")
-                    time.sleep(5)
-            break
+        print(f"\n🌞 SELF TOTAL: {result.score_self} POINTS")
+        print(f"🌚 OPNT TOTAL: {result.score_opponent} POINTS")
+        print("\n⌚ RETURNING TO LOBBY\n")
 
     # Initialize a 5x5 ocean board with animals types and chances
     def initialize_ocean_board(self):
-        ocean_board = [[None] * 5 for _ in range(5)]
+        return initialize_ocean_board()
 
-        for row in range(5):
-            for col in range(5):
-                # Generate a random number between 0 and 1
-                chance = random.random()
-                # Only one of the sea creatures will be selected for each square
-                if chance <= 0.05:  # 5% chance to appear
-                    ocean_board[row][col] = "SHARK"
-                elif chance <= 0.15:  # 10% chance to appear
-                    ocean_board[row][col] = "SQUID"
-                elif chance <= 0.35:  # 20% chance to appear
-                    ocean_board[row][col] = "LOBSTER"
-                elif chance <= 0.65:  # 30% chance to appear
-                    ocean_board[row][col] = "FISH"
-                elif chance <= 1.0:  # 35% chance to appear
-                    ocean_board[row][col] = "SHRIMP"
-        return ocean_board
-
-    # Get the player's move by row and column
-    def get_player_move(self, ocean_board):
+    # Square the player fishes by row and column, None to leave the match
+    def get_player_move(self):
         while True:
             try:
                 # Leave comand
                 row_input = input(f"🪝  CHOOSE A ROW: ")
                 if row_input.lower() == "x":
-                    return "LEAVE"
+                    return None
 
                 col_input = input(f"🪝  CHOOSE A COLUMN: ")
                 if col_input.lower() == "x":
-                    return "LEAVE"
+                    return None
 
                 row = int(row_input) - 1
                 col = int(col_input) - 1
 
                 # Normal coordinate input
                 if 0 <= row < 5 and 0 <= col < 5:
-                    animal_type = ocean_board[row][col]
-                    return animal_type
+                    return row, col
 
                 else:
                     print("\n🚨 INVALID INPUT. CHOOSE A VALID ROW AND COLUMN\n")
@@ -437,24 +448,9 @@ class User_Client:
             except ValueError:
                 print("\n🚨 INVALID INPUT. ENTER A NUMBER\n")
 
-    # Update scores based on animal type
+    # Update scores based on animal type, shark 100, squid 80, lobster 60, fish 50 and shrimp 30
     def count_points(self, animal_type):
-        # 🦈 Shark worth 100 points
-        if animal_type == "SHARK":
-            points = 100
-        # 🦑 Squid worth 80 points
-        elif animal_type == "SQUID":
-            points = 80
-        # 🦞 Lobster worth 60 points
-        elif animal_type == "LOBSTER":
-            points = 60
-        # 🐟 Fish worth 50 points
-        elif animal_type == "FISH":
-            points = 50
-        # 🦐 Shrimp worth 30 points
-        elif animal_type == "SHRIMP":
-            points = 30
-        return points
+        return count_points(animal_type)
 
     # Display the ocean board empty
     def display_ocean_empty(self):
@@ -480,87 +476,57 @@ class User_Client:
 
     # Get the animal icon for display
     def get_animal_icon(self, animal_type):
-        if animal_type == "SHARK":
-            return "🦈"  # Shark icon
-        elif animal_type == "SQUID":
-            return "🦑"  # Squid icon
-        elif animal_type == "LOBSTER":
-            return "🦞"  # Lobster icon
-        elif animal_type == "FISH":
-            return "🐟"  # Fish icon
-        elif animal_type == "SHRIMP":
-            return "🦐"  # Shrimp icon
-        else:
-            return "❓"  # Unknown animal icon
+        return animal_icon(animal_type)
 
     # SAI Timeout is 15 seconds, considering RTT and 1 second delay to guest send back
     # ACK or NEG, invite must be set back to expired in less than 14 seconds
-    def set_invite_expired_online(self):
-        time.sleep(13)
+    # Playing user also needs 2 seconds to leave current match + 2 seconds to send response
+    def schedule_invite_expiration(self, delay):
+        self.cancel_invite_expiration()  # Previous invitation timer must not expire this one
+        self.invite_timer = self.timers.schedule(delay, self.set_invite_expired)
+
+    # Invitation answered, its timer has nothing left to do
+    def cancel_invite_expiration(self):
+        if self.invite_timer:
+            self.invite_timer.cancel()
+            self.invite_timer = None
+
+    def set_invite_expired(self):
         self.invite_expired = True
 
-    # Delay 2 seconds to leave current match + 1 second to ACK or NEG + 2 seconds user send response
-    def set_invite_expired_playing(self):
-        self.invite_time_left = 10
-        for i in range(9, 0, -1):
-            time.sleep(1)
-            self.invite_time_left = i
-        self.invite_expired = True
+    # Show invitation, online users answer at the menu and playing users between rounds
+    def show_invitation(self, event, response):
+        if not event.playing:  # Case user is online
+            os.system('cls' if os.name == 'nt' else 'clear')
 
-    # Thread to listen for invite notifications
-    def listen_invite_notification(self):
-        while self.running:
-            try:
-                # Lock to ensure that only one thread at a time executes
-                with self.lock:
-                    # Check available data for reading at socket
-                    ready_to_read, _, _ = select.select(
-                        [self.sock], [], [], 0.1)
-
-                    if ready_to_read:
-                        response = self.receive_response()
-                        # Show notification at client
-                        if "INVITED YOU TO JOIN A GAME" in response:  # Case user is online
-                            os.system('cls' if os.name == 'nt' else 'clear')
-
-                            print(f"📬 NEW NOTIFICATION:\n{response}")
-                            print("PRESS ENTER TO CONTINUE")
-
-                            # Save inviter username
-                            parts = response.split()
-                            self.inviter = parts[1]
-                            self.notification = True  # Notification active
-                            self.invite_expired = False  # Set invite as not expired
-
-                            # Invitation timeout client side when self is online
-                            timer_thread = threading.Thread(
-                                target=self.set_invite_expired_online)
-                            timer_thread.start()
-
-                        if "INVITED YOU TO JOIN ANOTHER GAME" in response:  # Case user is playing
-                            self.response_in_game = response  # Store SAI invite response
-                            self.notification = True  # Notification active
-                            self.invite_expired = False  # Set invite as not expired
-
-                            # Invitation timeout client side when self is playing
-                            timer_thread = threading.Thread(
-                                target=self.set_invite_expired_playing)
-                            timer_thread.start()
-
-            except ConnectionError:
-                print("\n🚨 SERVER DISCONNECTED. EXITING CLIENT")
-                break
+            print(f"📬 NEW NOTIFICATION:\n{response}")
+            print("PRESS ENTER TO CONTINUE")
+
+            # Save inviter username
+            self.inviter = event.username
+            self.notification = True  # Notification active
+            self.invite_expired = False  # Set invite as not expired
+
+            # Invitation timeout client side when self is online
+            self.schedule_invite_expiration(INVITE_EXPIRATION_ONLINE)
+
+        else:  # Case user is playing
+            self.response_in_game = response  # Store SAI invite response
+            self.notification = True  # Notification active
+            self.invite_expired = False  # Set invite as not expired
+
+            # Invitation timeout client side when self is playing
+            self.schedule_invite_expiration(INVITE_EXPIRATION_PLAYING)
 
-    # Close socket connection
+    # Close connection to SAI and stop the client loop
     def close_connection(self):
-        self.sock.close()
+        self.run(self.client.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
         print("\n🛑 CONNECTION TO SERVER CLOSED\n")
 
     def main(self):
         self.connect()  # Connect user to SAI server
         logged_in_username = None  # Logged username
-        invite_checker = threading.Thread(
-            target=self.listen_invite_notification, daemon=True)
 
         print("\n🎏 WELCOME TO FISHERMEN MASTERS\n")
 
@@ -568,7 +534,7 @@ class User_Client:
             # Playing user declines invitation
             if self.match_declined == True:
                 # Used for reloading client lobby
-                self.send_message("GAME_NEG")
+                self.send_message(self.client.decline)
                 self.match_declined = False
 
             # Notifications options
@@ -584,12 +550,8 @@ class User_Client:
             if (self.notification) and (self.invite_expired == True):
                 print(f"📢 INVITATION FROM {self.inviter} EXPIRED\n")
 
-                # Send anything back to SAI to reload client response receiver
-                self.send_message("NOTHING")
-
                 # User received a notification, did not answer and now is back available at lobby
-                command = f"AVAILABLE {logged_in_username}"
-                self.send_message(command)
+                self.send_message(self.client.available)
 
                 self.notification = False  # Remove notification
                 self.input_ack_neg = False  # Remove ack and neg as valid option at input
@@ -631,9 +593,9 @@ class User_Client:
                 # Receives from login method username if logged in or none if failed
                 logged_in_username = client.login_user(username, password)
 
-                # When authenticated by SAI start thread to listen for invite notifications
+                # When authenticated by SAI start invitation deadlines
                 if logged_in_username:
-                    invite_checker.start()
+                    self.timers.start()
 
                     time.sleep(1)
                     os.system('cls' if os.name == 'nt' else 'clear')
@@ -685,64 +647,41 @@ class User_Client:
                 print("\n🟢 ACCEPTING\n")
                 time.sleep(1)
 
-                self.send_message("GAME_ACK")  # Send SAI game accept
                 self.notification = False   # Remove notification
                 self.input_ack_neg = False  # Remove ack and neg as valid option at input
+                self.cancel_invite_expiration()
 
                 print(f"🍾 YOU ACCEPTED THE INVITATION\n")
 
                 player_opponent = self.inviter  # Save opponent's namne
                 self.inviter = None  # Set back the inviter's to none
 
-                # Wait for SAI response about which socket to connect to
-                response = self.receive_response()
-
-                if "CONNECT TO PORT" in response:
-                    parts = response.split()
-                    port_host = int(parts[3])  # Get received port
-
-                    # Create socket and connects to received address from SAI
-                    game_socket_guest = socket.socket(
-                        socket.AF_INET, socket.SOCK_STREAM)
-
+                # Send SAI game accept, reply tells if the invite expired, host port arrives as a push
+                try:
+                    event = self.run(self.client.accept(timeout=CONNECT_TIMEOUT))
+                except asyncio.TimeoutError:
+                    event = None
+                    print(f"⌛ {player_opponent} DID NOT OPEN THE MATCH IN TIME, RETURNING TO LOBBY\n")
+                    self.send_message(self.client.game_over)  # Accepted game record ends here
+                except Client_Error:
+                    event = None
+                    print(f"⛔ CONNECTION WAS TERMINATED BY THE SOFTWARE ON THE HOST")
+
+                if event and event.kind == 'CONNECT':
                     try:
-                        # Invitee connects to inviter
-                        game_socket_guest.connect((self.host, port_host))
+                        # Invitee connects to inviter at the port received from SAI
+                        match = self.run(self.client.join_match(player_opponent, event))
+                    except OSError:
+                        print("🚨 FAILED TO CONNECT TO HOST\n")
+                        self.send_message(self.client.game_over)
+                    else:
                         print(
                             f"🎉 CONNECTED TO {player_opponent}. STARTING GAME...\n")
+                        self.play_match(match, logged_in_username, player_opponent)
 
-                        # Connected start game
-                        self.start_game(game_socket_guest,
-                                        logged_in_username, player_opponent)
-
-                        # Guest after match ends send to SAI game over command to set back status to online
-                        command = f"GAME_OVER {logged_in_username}"
-                        self.send_message(command)
-
-                        game_socket_guest.close()  # Close socket
-
-                    # Guest view, host had lost connection or left game
-                    except Exception as e:
-                        print("🚨 FAILED TO CONNECT TO HOST/n")
-
-                        # Guest after match ends send to SAI game over command to set back status to online
-                        command = f"GAME_OVER {logged_in_username}"
-                        self.send_message(command)
-
-                        # Show guest win message
-                        os.system('cls' if os.name == 'nt' else 'clear')
-                        print(
-                            f"💨 OPNT: {player_opponent} HAS LEFT THE GAME, LEAVING MATCH\n")
-                        print(
-                            f"🥇 CONGRATULATIONS, {logged_in_username}! YOU ARE THE WINNER!\n")
-
-                        print("⌚ RETURNING TO LOBBY\n")
-                        time.sleep(1)
-
-                        game_socket_guest.close()
-
-                        # Send anything back to SAI to reload client response receiver
-                        self.send_message("NOTHING")
+                # Host left or invite expired before the answer reached SAI
+                elif event and event.kind == 'INVITE_EXPIRED':
+                    print(f"📢 INVITATION FROM {player_opponent} EXPIRED\n")
 
             # Game invite declined
             elif choice == "9" and logged_in_username and self.notification == True and self.input_ack_neg == True and self.invite_expired == False:
@@ -750,28 +689,25 @@ class User_Client:
                 time.sleep(1)
                 os.system('cls' if os.name == 'nt' else 'clear')
 
-                self.send_message("GAME_NEG")
+                self.send_message(self.client.decline)
                 self.notification = False  # Remove notification
                 self.input_ack_neg = False  # Remove ack and neg as valid option at input
+                self.cancel_invite_expiration()
 
             # Invalid option
             else:
                 os.system('cls' if os.name == 'nt' else 'clear')
 
-                if self.input_ack_neg == False:
-                    self.send_message("NOTHING")
-
                 if self.invite_expired == False:
                     print("\n⛔ INVALID OPTION, CHOOSE A VALID ONE\n")
 
-        self.running = False  # Sign thread to stop execution
-
-        # Ensure program doesn't exit before thread finish
-        if invite_checker.is_alive():
-            invite_checker.join()
+        self.running = False  # Disconnection from now on is expected
 
         client.close_connection()
 
+        # Ensure program doesn't exit before the client loop finishes
+        self.loop_thread.join()
+
 
 if __name__ == "__main__":
     client = User_Client("127.0.0.1", 4000)